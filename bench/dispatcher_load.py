@@ -0,0 +1,172 @@
+#-jc load test for a running dispatcher (Flask or ASGI mode)
+#
+# Each simulated client uploads an example image and long-polls
+# GET /categorize/<id>?wait=... until a class comes back. The test is run
+# once per concurrency level and reports throughput and latency
+# percentiles, e.g.
+#
+#   python bench/dispatcher_load.py --url http://localhost:8080 \
+#       --concurrency 10,100,500 --requests 2000 --output load.json
+#
+# --rate switches to an open-loop run at a fixed arrival rate.
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+IMAGES = ROOT / "src" / "dispatcher" / "example-images"
+IN_PROGRESS = "Recognition in progress"
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+def summarise(latencies):
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else None,
+    }
+
+
+def multipart(filename, payload, user_name):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f"Content-Disposition: form-data; name=\"user_name\"\r\n\r\n{user_name}\r\n"
+        f"--{boundary}\r\n"
+        f"Content-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + payload + f"\r\n--{boundary}--\r\n".encode()
+    return f"multipart/form-data; boundary={boundary}", body
+
+
+async def http_call(host, port, method, path, body=b"", content_type=None):
+    # one request per connection keeps the client side simple and comparable
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        headers = [f"{method} {path} HTTP/1.1", f"Host: {host}:{port}", "Connection: close"]
+        if content_type is not None:
+            headers.append(f"Content-Type: {content_type}")
+        headers.append(f"Content-Length: {len(body)}")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+        raw = await reader.read()
+    finally:
+        writer.close()
+    head, _, payload = raw.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    return status, json.loads(payload or b"null")
+
+
+async def one_request(host, port, filename, payload, wait, results):
+    content_type, body = multipart(filename, payload, "loadtest")
+    started = time.monotonic()
+    try:
+        status, data = await http_call(host, port, "POST", "/categorize", body, content_type)
+        if status != 200:
+            raise Exception(f"upload failed with {status}")
+        uploaded = time.monotonic()
+        text = IN_PROGRESS
+        while text == IN_PROGRESS:
+            status, data = await http_call(host, port, "GET", f"/categorize/{data['id']}?wait={wait}")
+            text = data["text"]
+        results["upload"].append(uploaded - started)
+        results["result"].append(time.monotonic() - uploaded)
+        results["total"].append(time.monotonic() - started)
+    except Exception:
+        results["errors"] += 1
+
+
+async def client(host, port, images, wait, todo, results):
+    while todo:
+        todo.pop()
+        filename, payload = images[len(todo) % len(images)]
+        await one_request(host, port, filename, payload, wait, results)
+
+
+def report(results, elapsed, **extra):
+    return dict(
+        extra,
+        errors=results["errors"],
+        elapsed_s=round(elapsed, 3),
+        throughput_rps=round(len(results["total"]) / elapsed, 3) if elapsed else None,
+        upload=summarise(results["upload"]),
+        result=summarise(results["result"]),
+        end_to_end=summarise(results["total"]),
+    )
+
+
+async def run_level(host, port, images, concurrency, requests, wait):
+    # closed loop: `concurrency` clients, each waiting for its result before the next upload
+    results = {"upload": [], "result": [], "total": [], "errors": 0}
+    todo = list(range(requests))
+    started = time.monotonic()
+    await asyncio.gather(*[client(host, port, images, wait, todo, results) for _ in range(concurrency)])
+    return report(results, time.monotonic() - started, concurrency=concurrency, requests=requests)
+
+
+async def run_rate(host, port, images, rate, requests, wait):
+    # open loop: uploads start every 1/rate seconds whether or not earlier ones finished
+    results = {"upload": [], "result": [], "total": [], "errors": 0}
+    started = time.monotonic()
+    tasks = []
+    for idx in range(requests):
+        await asyncio.sleep(max(0.0, started + idx / rate - time.monotonic()))
+        filename, payload = images[idx % len(images)]
+        tasks.append(asyncio.create_task(one_request(host, port, filename, payload, wait, results)))
+    await asyncio.gather(*tasks)
+    return report(results, time.monotonic() - started, rate=rate, requests=requests)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dispatcher load test")
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--concurrency", default="10,50,100")
+    parser.add_argument("--rate", type=float, default=None, help="open-loop requests/sec instead of --concurrency")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--wait", type=float, default=25)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    target = urlsplit(args.url)
+    images = [(path.name, path.read_bytes()) for path in sorted(IMAGES.glob("*.jpg"))]
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    host, port = target.hostname, target.port or 80
+    if args.rate is not None:
+        runs = [run_rate(host, port, images, args.rate, args.requests, args.wait)]
+    else:
+        runs = [run_level(host, port, images, level, args.requests, args.wait) for level in levels]
+
+    output = {"url": args.url, "levels": []}
+    for run in runs:
+        result = asyncio.run(run)
+        print(json.dumps(result), file=sys.stderr)
+        output["levels"].append(result)
+    write_report(output, args.output)
+
+
+def write_report(report, path):
+    if path:
+        with open(path, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#-jc micro-benchmark: per-event encode/decode cost, old Event vs slots + codecs
+#
+# Times a Request and a Response with realistic trace stages through
+# dump() and back (a fresh dto per decode, as scan_batches does). The
+# "legacy" rows are the __dict__-based Event as it was before the schema
+# rewrite, copied below so the comparison stays runnable, e.g.
+#
+#   python bench/event_codec.py --events 20000 --output codec.json
+
+import argparse
+import json
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from dispatcher_load import write_report  # noqa: E402
+from common.event import codec  # noqa: E402
+from common.event.request_dto import Request  # noqa: E402
+from common.event.response_dto import Response  # noqa: E402
+
+
+class LegacyEvent(object):
+    def __init__(self):
+        self._tz_created = str(datetime.now())
+        self._id = str(uuid.uuid4())
+        self.correlation_id = None
+        self.trace_id = uuid.uuid4().hex
+        self.span_id = None
+        self.stages = dict()
+        self._expected_fields = []
+        self.more = None
+
+    def load(self, event_json):
+        event = event_json if isinstance(event_json, dict) else json.loads(event_json)
+        for field in self.keys():
+            if field in event:
+                self.__dict__[field] = event[field]
+            elif field not in self._expected_fields:
+                pass
+            else:
+                raise Exception(f"Invalid event definition: {event}")
+
+    def dump(self, dump_format="json"):
+        for key in self._expected_fields:
+            if self._as_dict()[key] is None:
+                raise Exception("Mismatched event dto")
+        return json.dumps(self._as_dict()) if dump_format == "json" else dict(self.__dict__)
+
+    def _as_dict(self):
+        unfiltered = dict(self.__dict__)
+        unfiltered.pop("_expected_fields")
+        unfiltered.pop("more")
+        return unfiltered
+
+    def keys(self):
+        return self._as_dict().keys()
+
+
+class LegacyRequest(LegacyEvent):
+    def __init__(self):
+        super().__init__()
+        self.image_path = None
+        self.image_size = None
+        self.image_format = None
+        self.user_name = None
+        self.image_digest = None
+        self._expected_fields.extend(["image_path", "image_size", "image_format", "user_name"])
+
+
+class LegacyResponse(LegacyEvent):
+    def __init__(self):
+        super().__init__()
+        self.image_class = None
+        self._expected_fields.extend(["image_class", "correlation_id"])
+
+
+def fill(event, kind):
+    now = time.time()
+    event.span_id = "00f067aa0ba902b7"
+    event.stages = {"received": now, "stored": now + 0.001, "published": now + 0.002}
+    if kind == "request":
+        event.image_path = f"/data/images/{uuid.uuid4()}.jpg"
+        event.image_size = 123456
+        event.image_format = "jpg"
+        event.user_name = "benchmark"
+        event.image_digest = "ab" * 32
+    else:
+        event.correlation_id = str(uuid.uuid4())
+        event.image_class = "shine"
+        event.stages.update(consumed=now + 0.01, dequeued=now + 0.02, inferred=now + 0.05, responded=now + 0.06)
+    return event
+
+
+def per_event_us(function, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        function()
+    return round((time.perf_counter() - started) / count * 1e6, 3)
+
+
+def legacy_decode(dto_cls, payload):
+    dto = dto_cls()
+    dto.load(payload)
+    return dto
+
+
+def slots_decode(dto_cls, payload):
+    return dto_cls.from_payload(payload)
+
+
+def measure(name, event, dto_cls, dump_format, count):
+    # decode as scan_batches does: a fresh dto per payload
+    decode = legacy_decode if name == "legacy" else slots_decode
+    payload = event.dump(dump_format)
+    if decode(dto_cls, payload)._id != event._id:
+        raise Exception(f"{name}/{dump_format} did not round-trip")
+    return {
+        "impl": name,
+        "codec": dump_format,
+        "bytes": len(payload),
+        "encode_us": per_event_us(lambda: event.dump(dump_format), count),
+        "decode_us": per_event_us(lambda: decode(dto_cls, payload), count),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Event serialisation micro-benchmark")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    report = {"events": args.events, "results": []}
+    for kind, legacy_cls, dto_cls in (("request", LegacyRequest, Request), ("response", LegacyResponse, Response)):
+        rows = [measure("legacy", fill(legacy_cls(), kind), legacy_cls, "json", args.events)]
+        for name in codec.CODECS:
+            if codec.codec_for(name) == name:
+                rows.append(measure("slots", fill(dto_cls(), kind), dto_cls, name, args.events))
+        for row in rows:
+            row["event"] = kind
+            print(json.dumps(row), file=sys.stderr)
+        report["results"].extend(rows)
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
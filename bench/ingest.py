@@ -0,0 +1,91 @@
+#-jc ingest normalisation: stored bytes and categorize decode time, original vs rendition
+#
+# Builds phone-sized uploads (--width x --height, sensor-like noise, EXIF,
+# JPEG quality 92) from the example images, runs each through the
+# dispatcher's Ingest at every --max-side, and times categorize's
+# load_image() on the original and on the rendition. input_diff is the mean
+# absolute difference between the two 224x224 model inputs, e.g.
+#
+#   python bench/ingest.py --max-side 384,512,1024 --repeat 5 --output ingest.json
+
+import argparse
+import io
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from dispatcher_load import write_report  # noqa: E402
+from dispatcher.src.ingest import Ingest  # noqa: E402
+from categorize.engine.preprocess import load_image  # noqa: E402
+
+IMAGES = ROOT / "src" / "dispatcher" / "example-images"
+
+
+def phone_upload(path, width, height, seed):
+    image = Image.open(path).convert("RGB").resize((width, height), Image.BICUBIC)
+    pixels = np.asarray(image, dtype=np.int16)
+    noise = np.random.default_rng(seed).normal(0, 6, pixels.shape).astype(np.int16)
+    image = Image.fromarray(np.clip(pixels + noise, 0, 255).astype(np.uint8))
+    exif = Image.Exif()
+    exif[0x010F] = "BenchPhone"
+    exif[0x0112] = 1
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=92, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest normalisation benchmark")
+    parser.add_argument("--max-side", default="512", help="comma-separated rendition sizes")
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    uploads = {
+        path.stem: phone_upload(path, args.width, args.height, seed)
+        for seed, path in enumerate(sorted(IMAGES.glob("*.jpg")))
+    }
+    report = {"width": args.width, "height": args.height, "quality": args.quality, "results": []}
+    for name, upload in uploads.items():
+        decode_original, original_input = best_of(lambda: load_image(io.BytesIO(upload)), args.repeat)
+        for max_side in [int(side) for side in args.max_side.split(",")]:
+            ingest = Ingest({"max_side": max_side, "quality": args.quality})
+            ingest_s, rendition = best_of(lambda: ingest.normalise(io.BytesIO(upload)), args.repeat)
+            decode_rendition, rendition_input = best_of(lambda: load_image(io.BytesIO(rendition)), args.repeat)
+            row = {
+                "image": name,
+                "max_side": max_side,
+                "original_bytes": len(upload),
+                "stored_bytes": len(rendition),
+                "bytes_saved_pct": round(100 * (1 - len(rendition) / len(upload)), 1),
+                "ingest_ms": round(ingest_s * 1000, 2),
+                "decode_original_ms": round(decode_original * 1000, 2),
+                "decode_rendition_ms": round(decode_rendition * 1000, 2),
+                "input_diff": round(float(np.abs(original_input - rendition_input).mean()), 3),
+            }
+            print(json.dumps(row), file=sys.stderr)
+            report["results"].append(row)
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#-jc compare categorize inference engines: load time, accuracy parity, latency
+#
+# The first --engine is the reference; every other engine is compared
+# against it on the example images (top-1 agreement and the largest
+# probability difference) and timed at each batch size, e.g.
+#
+#   python bench/model_runtime.py \
+#       --engine keras=src/categorize/model/vgg19-weather.h5 \
+#       --engine tflite=src/categorize/model/vgg19-weather-int8.tflite \
+#       --batch-size 1,8 --repeat 20 --output runtime.json
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from dispatcher_load import summarise  # noqa: E402
+from categorize.engine.engine import InferenceEngine, IMAGE_CLASSES  # noqa: E402
+from categorize.engine.preprocess import load_image  # noqa: E402
+
+IMAGES = ROOT / "src" / "dispatcher" / "example-images"
+#-jc example images are named after their class
+EXPECTED = {"fog": "foggy", "rain": "rainy", "shine": "shine"}
+
+
+def time_engine(engine, images, batch_size, repeat):
+    batch = np.concatenate([images[idx % len(images)] for idx in range(batch_size)])
+    engine.predict(batch)  #-jc warm-up: first call allocates
+    latencies = []
+    for _ in range(repeat):
+        started = time.monotonic()
+        engine.predict(batch)
+        latencies.append(time.monotonic() - started)
+    return dict(
+        summarise(latencies),
+        batch_size=batch_size,
+        images_per_sec=round(batch_size * len(latencies) / sum(latencies), 3),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inference engine comparison")
+    parser.add_argument("--engine", action="append", required=True, help="backend=model_path")
+    parser.add_argument("--batch-size", default="1,8")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    paths = sorted(IMAGES.glob("*.jpg"))
+    images = [load_image(str(path)) for path in paths]
+    expected = [EXPECTED.get(path.stem) for path in paths]
+    batch_sizes = [int(size) for size in args.batch_size.split(",")]
+
+    report = {"images": [path.name for path in paths], "engines": []}
+    reference = None
+    for spec in args.engine:
+        backend, model_path = spec.split("=", 1)
+        started = time.monotonic()
+        engine = InferenceEngine(backend, {"model_path": model_path, "threads": args.threads})
+        load_time = time.monotonic() - started
+
+        probabilities = engine.predict(np.concatenate(images))
+        predicted = [IMAGE_CLASSES[int(np.argmax(row))] for row in probabilities]
+        result = {
+            "backend": backend,
+            "model": model_path,
+            "model_bytes": Path(model_path).stat().st_size,
+            "load_ms": round(load_time * 1000, 3),
+            "predicted": predicted,
+            "accuracy": sum(p == e for p, e in zip(predicted, expected)) / len(expected),
+            "latency": [time_engine(engine, images, size, args.repeat) for size in batch_sizes],
+        }
+        if reference is None:
+            reference = (predicted, probabilities)
+        else:
+            result["top1_agreement"] = sum(p == r for p, r in zip(predicted, reference[0])) / len(predicted)
+            result["max_prob_diff"] = round(float(np.max(np.abs(probabilities - reference[1]))), 6)
+        print(json.dumps(result), file=sys.stderr)
+        report["engines"].append(result)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#-jc offline end-to-end benchmark: upload -> queue -> categorize -> response -> dispatcher
+#
+# Everything runs in this process with local stand-ins: the dispatcher
+# behind a threaded werkzeug server, the in-memory queue backend, file
+# storage in a temp dir and categorize with the stub model. No Kafka,
+# Postgres or TensorFlow needed, so runs are comparable across commits:
+#
+#   python bench/pipeline.py --rate 50 --requests 1000 --batch-size 8 --output pipeline.json
+#   python bench/pipeline.py --concurrency 20 --requests 1000
+#
+# The report has client-side upload/result/end-to-end percentiles plus
+# categorize's per-stage timings (queued, fetch, preprocess, predict,
+# publish) and batch sizes. --trace-file writes every span as JSON lines.
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from werkzeug.serving import make_server  # noqa: E402
+
+from dispatcher_load import IMAGES, run_level, run_rate, write_report  # noqa: E402
+from common.config.config import Configuration  # noqa: E402
+from categorize.engine.engine import InferenceEngine  # noqa: E402
+import categorize.runtime.app as categorize  # noqa: E402
+import dispatcher.src.app as dispatcher  # noqa: E402
+
+
+def start_pipeline(args):
+    config = Configuration()
+    config.queue_backend = "memory"
+    config.storage_backend = "file"
+    #-jc the example images repeat, so the result cache would answer nearly everything
+    config.cache_backend = "memory" if args.cache else ""
+    config.categorize_batch_size = args.batch_size
+    config.categorize_batch_max_wait_ms = args.batch_wait_ms
+    config.categorize_preprocess_workers = args.preprocess_workers
+    if args.trace_file:
+        config.tracing_exporter = "file"
+        config.tracing_endpoint = args.trace_file
+
+    dispatcher.configure(config)
+    threading.Thread(target=dispatcher.update_results, name="state_updater", daemon=True).start()
+
+    categorize.configure(config)
+    categorize.start_preprocess_pool(config)
+    categorize.MODEL_EXEC = InferenceEngine("stub", {
+        "model_path": "stub",
+        "batch_ms": args.model_batch_ms,
+        "image_ms": args.model_image_ms,
+    })
+    categorize.MODEL_EXEC.warm_up(categorize.BATCH_SIZE)
+    threading.Thread(target=categorize.infer, name="inference", daemon=True).start()
+
+    server = make_server("127.0.0.1", 0, dispatcher.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="http", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark")
+    parser.add_argument("--rate", type=float, default=None, help="open-loop requests/sec")
+    parser.add_argument("--concurrency", type=int, default=10, help="closed-loop clients, when --rate is not set")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--wait", type=float, default=25)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--batch-wait-ms", type=int, default=50)
+    parser.add_argument("--preprocess-workers", type=int, default=4)
+    parser.add_argument("--model-batch-ms", type=float, default=5.0)
+    parser.add_argument("--model-image-ms", type=float, default=2.0)
+    parser.add_argument("--cache", action="store_true", help="enable the dispatcher result cache")
+    parser.add_argument("--trace-file", default=None, help="export spans to this JSON lines file")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    images = [(path.name, path.read_bytes()) for path in sorted(IMAGES.glob("*.jpg"))]
+
+    with tempfile.TemporaryDirectory(prefix="pipeline-bench-") as storage_dir:
+        os.environ["STORAGE_DIR"] = storage_dir
+        server = start_pipeline(args)
+        try:
+            if args.rate is not None:
+                run = run_rate("127.0.0.1", server.server_port, images, args.rate, args.requests, args.wait)
+            else:
+                run = run_level("127.0.0.1", server.server_port, images, args.concurrency, args.requests, args.wait)
+            result = asyncio.run(run)
+        finally:
+            server.shutdown()
+
+    write_report({
+        "settings": vars(args),
+        "load": result,
+        "stages": categorize.STAGE_STATS,
+        "batches": categorize.BATCH_STATS,
+        "results": dispatcher.RESULT_MART.stats(),
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+#-jc minimal S3-compatible server for offline runs (tests and bench/storage_throughput.py)
+#
+# Path-style requests only, objects held in memory, no auth checks. Enough
+# of the API for boto3's put/get/head/delete, DeleteObjects, ranged GETs,
+# ListObjectsV2 and multipart uploads:
+#
+#   python bench/s3_standin.py 127.0.0.1:9000
+#   S3_ENDPOINT=http://127.0.0.1:9000 ...
+
+import argparse
+import hashlib
+import threading
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.etree import ElementTree  # nosec B405 -jc local stand-in, parses boto3 requests only
+from xml.sax.saxutils import escape
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_PUT(self):
+        bucket, key, query = self._target()
+        body = self._body()
+        with self.server.lock:
+            if not key:
+                self.server.buckets.setdefault(bucket, dict())
+                return self._reply(200)
+            if "uploadId" in query:
+                upload = self.server.uploads.get(query["uploadId"][0])
+                if upload is None:
+                    return self._error(404, "NoSuchUpload")
+                upload[int(query["partNumber"][0])] = body
+                return self._reply(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})  # nosec B324 -jc ETag
+            if bucket not in self.server.buckets:
+                return self._error(404, "NoSuchBucket")
+            self.server.buckets[bucket][key] = (body, datetime.now(timezone.utc))
+        self._reply(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})  # nosec B324 -jc ETag
+
+    def do_POST(self):
+        bucket, key, query = self._target()
+        body = self._body()
+        with self.server.lock:
+            if "delete" in query:
+                keys = [element.text for element in ElementTree.fromstring(body).iter() if element.tag.endswith("Key")]  # nosec B314
+                objects = self.server.buckets.get(bucket, {})
+                for deleted in keys:
+                    objects.pop(deleted, None)
+                return self._xml(
+                    "<DeleteResult>" + "".join(f"<Deleted><Key>{escape(k)}</Key></Deleted>" for k in keys) + "</DeleteResult>"
+                )
+            if "uploads" in query:
+                upload_id = uuid.uuid4().hex
+                self.server.uploads[upload_id] = dict()
+                return self._xml(
+                    f"<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{escape(key)}</Key>"
+                    f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+                )
+            upload = self.server.uploads.pop(query["uploadId"][0], None)
+            if upload is None:
+                return self._error(404, "NoSuchUpload")
+            body = b"".join(upload[part] for part in sorted(upload))
+            self.server.buckets[bucket][key] = (body, datetime.now(timezone.utc))
+        self._xml(
+            f"<CompleteMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{escape(key)}</Key>"
+            f"<ETag>\"{hashlib.md5(body).hexdigest()}-{len(upload)}\"</ETag></CompleteMultipartUploadResult>"  # nosec B324 -jc ETag
+        )
+
+    def do_GET(self):
+        bucket, key, query = self._target()
+        if not key:
+            return self._list(bucket, query)
+        found = self._lookup(bucket, key)
+        if found is None:
+            return self._error(404, "NoSuchKey")
+        body, modified = found
+        headers = self._object_headers(body, modified)
+        status = 200
+        ranged = self.headers.get("Range")
+        if ranged:
+            start, _, end = ranged.split("=", 1)[1].partition("-")
+            start, end = int(start), min(int(end) if end else len(body) - 1, len(body) - 1)
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            body, status = body[start:end + 1], 206
+        self._reply(status, body, headers)
+
+    def do_HEAD(self):
+        bucket, key, _ = self._target()
+        found = self._lookup(bucket, key)
+        if found is None:
+            return self._reply(404)
+        headers = self._object_headers(*found)
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(found[0])))
+        self.end_headers()
+
+    def do_DELETE(self):
+        bucket, key, query = self._target()
+        with self.server.lock:
+            if "uploadId" in query:
+                self.server.uploads.pop(query["uploadId"][0], None)
+            else:
+                self.server.buckets.get(bucket, {}).pop(key, None)
+        self._reply(204)
+
+    def _list(self, bucket, query):
+        with self.server.lock:
+            if bucket not in self.server.buckets:
+                return self._error(404, "NoSuchBucket")
+            objects = sorted(self.server.buckets[bucket].items())
+        prefix = query.get("prefix", [""])[0]
+        after = query.get("continuation-token", query.get("start-after", [""]))[0]
+        limit = int(query.get("max-keys", ["1000"])[0])
+        matching = [item for item in objects if item[0].startswith(prefix) and item[0] > after]
+        page, truncated = matching[:limit], len(matching) > limit
+        contents = "".join(
+            f"<Contents><Key>{escape(key)}</Key><Size>{len(body)}</Size>"
+            f"<LastModified>{modified.strftime('%Y-%m-%dT%H:%M:%S.000Z')}</LastModified></Contents>"
+            for key, (body, modified) in page
+        )
+        token = f"<NextContinuationToken>{escape(page[-1][0])}</NextContinuationToken>" if truncated else ""
+        self._xml(
+            f"<ListBucketResult><Name>{bucket}</Name><Prefix>{escape(prefix)}</Prefix>"
+            f"<KeyCount>{len(page)}</KeyCount><MaxKeys>{limit}</MaxKeys>"
+            f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>{token}{contents}</ListBucketResult>"
+        )
+
+    def _lookup(self, bucket, key):
+        with self.server.lock:
+            return self.server.buckets.get(bucket, {}).get(key)
+
+    def _target(self):
+        url = urlsplit(self.path)
+        bucket, _, key = url.path.lstrip("/").partition("/")
+        return bucket, unquote(key), parse_qs(url.query, keep_blank_values=True)
+
+    def _body(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if "aws-chunked" in (self.headers.get("Content-Encoding") or ""):
+            body = self._unchunk(body)
+        return body
+
+    @staticmethod
+    def _unchunk(body):
+        # aws-chunked: "<hex size>[;chunk-signature=...]\r\n<data>\r\n" ..., then trailers
+        data, pos = [], 0
+        while True:
+            line_end = body.index(b"\r\n", pos)
+            size = int(body[pos:line_end].split(b";")[0], 16)
+            if size == 0:
+                return b"".join(data)
+            data.append(body[line_end + 2:line_end + 2 + size])
+            pos = line_end + 2 + size + 2
+
+    @staticmethod
+    def _object_headers(body, modified):
+        return {
+            "ETag": f'"{hashlib.md5(body).hexdigest()}"',  # nosec B324 -jc ETag
+            "Last-Modified": modified.strftime("%a, %d %b %Y %H:%M:%S GMT"),
+            "Accept-Ranges": "bytes",
+            "Content-Type": "binary/octet-stream",
+        }
+
+    def _xml(self, document):
+        self._reply(200, ('<?xml version="1.0" encoding="UTF-8"?>' + document).encode(), {"Content-Type": "application/xml"})
+
+    def _error(self, status, code):
+        self._reply(status, f"<Error><Code>{code}</Code><Message>{code}</Message></Error>".encode(), {"Content-Type": "application/xml"})
+
+    def _reply(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def standin_server(address, buckets=()):
+    # returns a started server; stop with server.shutdown()
+    host, port = address.rsplit(":", 1)
+    server = ThreadingHTTPServer((host, int(port)), Handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.buckets = {bucket: dict() for bucket in buckets}
+    server.uploads = dict()
+    server.url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="s3-standin", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-memory S3 stand-in")
+    parser.add_argument("address", help="host:port to listen on")
+    parser.add_argument("--bucket", action="append", default=[], help="bucket to create up front")
+    args = parser.parse_args()
+    server = standin_server(args.address, args.bucket)
+    print(f"S3 stand-in on {server.url}, buckets {args.bucket}")
+    threading.Event().wait()
@@ -0,0 +1,107 @@
+#-jc storage throughput: LocalFilesystem vs S3 (plain and behind the read-through cache)
+#
+# Each backend writes --objects objects of --size bytes from --threads
+# threads, then reads them all back twice (the second pass is what a warm
+# categorize cache sees). Without --endpoint the S3 rows run against the
+# in-process stand-in (bench/s3_standin.py), which measures the client
+# side; point it at MinIO or real S3 for numbers that include the server:
+#
+#   python bench/storage_throughput.py --objects 500 --size 200000 --threads 16
+#   python bench/storage_throughput.py --endpoint http://localhost:9000 --bucket images
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from dispatcher_load import summarise, write_report  # noqa: E402
+from s3_standin import standin_server  # noqa: E402
+from common.storage.storage import Storage  # noqa: E402
+
+
+def timed(function, items, threads):
+    def run(item):
+        started = time.monotonic()
+        result = function(item)
+        return time.monotonic() - started, result
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(run, items))
+    return time.monotonic() - started, [latency for latency, _ in results], [result for _, result in results]
+
+
+def phase(name, function, items, threads, size):
+    elapsed, latencies, results = timed(function, items, threads)
+    report = dict(
+        summarise(latencies),
+        phase=name,
+        elapsed_s=round(elapsed, 3),
+        ops_per_s=round(len(items) / elapsed, 1),
+        mb_per_s=round(len(items) * size / elapsed / 1e6, 1),
+    )
+    return report, results
+
+
+def run_backend(name, storage, payloads, threads, size):
+    rows = []
+    row, paths = phase("put_bytes", lambda data: storage.put_bytes(data)[0], payloads, threads, size)
+    rows.append(row)
+    for read in ("get_bytes", "get_bytes_again"):
+        row, _ = phase(read, storage.get_bytes, paths, threads, size)
+        rows.append(row)
+    for row in rows:
+        row["backend"] = name
+        print(json.dumps(row), file=sys.stderr)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Storage backend throughput")
+    parser.add_argument("--objects", type=int, default=300)
+    parser.add_argument("--size", type=int, default=150000, help="bytes per object")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--endpoint", default=None, help="S3 endpoint; default an in-process stand-in")
+    parser.add_argument("--bucket", default="images")
+    parser.add_argument("--cache-mb", type=float, default=1024)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    payloads = [os.urandom(args.size) for _ in range(args.objects)]
+    workdir = tempfile.mkdtemp(prefix="storage-bench-")
+    server = None
+    if args.endpoint is None:
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+        server = standin_server("127.0.0.1:0", [args.bucket])
+    s3_config = {
+        "bucket": args.bucket,
+        "endpoint": args.endpoint or server.url,
+        "region": "us-east-1",
+        "max_connections": max(32, args.threads * 2),
+    }
+    try:
+        os.environ["STORAGE_DIR"] = os.path.join(workdir, "file")
+        os.makedirs(os.environ["STORAGE_DIR"])
+        report = {"objects": args.objects, "size": args.size, "threads": args.threads, "results": []}
+        report["results"] += run_backend("file", Storage("file"), payloads, args.threads, args.size)
+        report["results"] += run_backend("s3", Storage("s3", s3_config), payloads, args.threads, args.size)
+        cached = Storage("s3", dict(s3_config, cache_dir=os.path.join(workdir, "cache"), cache_max_mb=args.cache_mb))
+        report["results"] += run_backend("s3+cache", cached, payloads, args.threads, args.size)
+    finally:
+        if server is not None:
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,13 +5,59 @@ CREATE TABLE IF NOT EXISTS requests (
     image_path TEXT,
     image_size BIGINT,
     image_format TEXT,
-    user_name TEXT
+    user_name TEXT,
+    image_digest TEXT,
+    original_path TEXT,
+    trace_id TEXT,
+    span_id TEXT,
+    stages JSONB,
+    image_expired_at TIMESTAMPTZ
 );
 
+CREATE INDEX IF NOT EXISTS requests_image_digest_idx ON requests (image_digest);
+CREATE INDEX IF NOT EXISTS requests_image_path_idx ON requests (image_path);
+-- retention walks the rows whose image is still live, oldest first
+CREATE INDEX IF NOT EXISTS requests_retention_idx ON requests (_tz_created) WHERE image_expired_at IS NULL;
+
 CREATE TABLE IF NOT EXISTS responses (
     _id TEXT PRIMARY KEY,
     _tz_created TIMESTAMPTZ,
     correlation_id TEXT,
-    image_class TEXT
+    image_class TEXT,
+    trace_id TEXT,
+    span_id TEXT,
+    stages JSONB
+);
+
+CREATE INDEX IF NOT EXISTS responses_correlation_id_idx ON responses (correlation_id);
+
+-- one row per answered request: milliseconds spent in each hop
+CREATE TABLE IF NOT EXISTS request_latency (
+    _id TEXT PRIMARY KEY,
+    _tz_created TIMESTAMPTZ,
+    trace_id TEXT,
+    upload_ms DOUBLE PRECISION,
+    publish_ms DOUBLE PRECISION,
+    request_transit_ms DOUBLE PRECISION,
+    queue_wait_ms DOUBLE PRECISION,
+    preprocess_wait_ms DOUBLE PRECISION,
+    inference_ms DOUBLE PRECISION,
+    response_publish_ms DOUBLE PRECISION,
+    response_transit_ms DOUBLE PRECISION,
+    total_ms DOUBLE PRECISION
 );
 
+CREATE INDEX IF NOT EXISTS request_latency_total_ms_idx ON request_latency (total_ms);
+
+CREATE TABLE IF NOT EXISTS event_counts (
+    table_name TEXT PRIMARY KEY,
+    row_count BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO event_counts (table_name, row_count)
+SELECT 'requests', COUNT(*) FROM requests
+ON CONFLICT (table_name) DO NOTHING;
+
+INSERT INTO event_counts (table_name, row_count)
+SELECT 'responses', COUNT(*) FROM responses
+ON CONFLICT (table_name) DO NOTHING;
@@ -0,0 +1,11 @@
+import logging
+
+
+class InferenceBackend(object):
+    def __init__(self, config):
+        self.LOGGER = logging
+        self.config = config
+
+    def predict(self, images):
+        # images: preprocessed float32 batch (n, 224, 224, 3); returns (n, classes)
+        pass
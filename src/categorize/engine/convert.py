@@ -0,0 +1,62 @@
+#-jc one-shot conversion of the Keras model for the "tflite" engine
+#
+#   python -m categorize.engine.convert --model src/categorize/model/vgg19-weather.h5 \
+#       --output src/categorize/model/vgg19-weather-int8.tflite --quantize int8
+#
+# --quantize: none (float32), dynamic (int8 weights), fp16 (half-size
+# weights, float compute) or int8 (weights and activations, calibrated on
+# --calibration-dir; the three example images are a bare minimum, point it
+# at a few hundred real uploads for a production artefact).
+
+import argparse
+import logging
+from pathlib import Path
+
+from categorize.engine.preprocess import load_image
+
+
+IMAGES = Path(__file__).resolve().parents[2] / "dispatcher" / "example-images"
+QUANTIZE_MODES = ["none", "dynamic", "fp16", "int8"]
+
+
+def representative_images(image_dir):
+    for path in sorted(Path(image_dir).glob("*.jpg")):
+        yield [load_image(str(path))]
+
+
+def convert(model_path, output_path, quantize="none", calibration_dir=IMAGES):
+    import tensorflow as tf
+    from keras.models import load_model
+
+    if quantize not in QUANTIZE_MODES:
+        raise Exception(f"Unknown quantisation {quantize!r}, expected one of {QUANTIZE_MODES}")
+
+    model = load_model(model_path, compile=False)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize != "none":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == "fp16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "int8":
+        #-jc input/output stay float32, so the engine contract does not change
+        converter.representative_dataset = lambda: representative_images(calibration_dir)
+
+    payload = converter.convert()
+    Path(output_path).write_bytes(payload)
+    logging.info("Wrote %s (%d bytes, quantize=%s)", output_path, len(payload), quantize)
+    return len(payload)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert the categorize model to TFLite")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--quantize", choices=QUANTIZE_MODES, default="none")
+    parser.add_argument("--calibration-dir", default=str(IMAGES))
+    args = parser.parse_args(argv)
+    convert(args.model, args.output, args.quantize, args.calibration_dir)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,46 @@
+import logging
+import os
+import numpy as np
+
+from categorize.engine.preprocess import TARGET_SIZE
+from categorize.engine.model_cache import model_digest
+
+
+#-jc output order of the weather model
+IMAGE_CLASSES = ["foggy", "rainy", "shine"]
+
+
+class InferenceEngine(object):
+    def __init__(self, backend, config):
+        self.LOGGER = logging
+        #-jc names the model in every response; the stub has no file to hash
+        digest = model_digest(config["model_path"]) if os.path.isfile(config["model_path"]) else None
+        self.model_id = digest[:16] if digest is not None else backend
+        if backend == "keras":
+            from categorize.engine.keras_backend import KerasBackend
+            self.backend = KerasBackend(config)
+        elif backend == "tflite":
+            from categorize.engine.tflite_backend import TFLiteBackend
+            self.backend = TFLiteBackend(config)
+        elif backend == "cached":
+            #-jc the .h5 is converted once; later starts load the TFLite artefact in milliseconds
+            from categorize.engine.model_cache import cached_model
+            from categorize.engine.tflite_backend import TFLiteBackend
+            config = dict(config, model_path=cached_model(
+                config["model_path"], config["cache_dir"], config["quantize"] if "quantize" in config else "none",
+                digest=digest,
+            ))
+            self.backend = TFLiteBackend(config)
+        elif backend == "stub":
+            from categorize.engine.stub_backend import StubBackend
+            self.backend = StubBackend(config)
+        else:
+            raise Exception(f"Unknown inference backend {backend!r}")
+        self.LOGGER.info(f"Selected inference backend: {self.backend} for {config['model_path']}")
+
+    def predict(self, images):
+        return self.backend.predict(images)
+
+    def warm_up(self, batch_size=1):
+        # the first call traces the graph / sizes the interpreter; do it before real traffic
+        self.backend.predict(np.zeros((batch_size,) + TARGET_SIZE + (3,), dtype=np.float32))
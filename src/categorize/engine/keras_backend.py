@@ -0,0 +1,11 @@
+from categorize.engine.backend import InferenceBackend
+
+
+class KerasBackend(InferenceBackend):
+    def __init__(self, config):
+        super().__init__(config)
+        from keras.models import load_model
+        self.model = load_model(config["model_path"], compile=False)
+
+    def predict(self, images):
+        return self.model.predict(images, verbose=0)
@@ -0,0 +1,33 @@
+import os
+import logging
+from pathlib import Path
+
+from common.cache.cache import content_digest
+
+
+LOGGER = logging
+
+
+def model_digest(model_path):
+    with open(model_path, "rb") as model:
+        return content_digest(model)
+
+
+def cached_model(model_path, cache_dir, quantize="none", digest=None):
+    # Returns the path of a TFLite conversion of model_path, building it on
+    # first use. Keyed by the model's content hash, so a new model file
+    # never picks up a stale artefact.
+    digest = digest if digest is not None else model_digest(model_path)
+    target = Path(cache_dir) / f"{Path(model_path).stem}-{digest[:16]}-{quantize}.tflite"
+    if target.exists():
+        LOGGER.info("Using cached model %s", target)
+        return str(target)
+
+    from categorize.engine.convert import convert
+    LOGGER.info("No cached model for %s, converting to %s", model_path, target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    #-jc workers may race on the first start; each writes its own file, last rename wins
+    partial = target.with_name(f".partial-{os.getpid()}-{target.name}")
+    convert(model_path, str(partial), quantize)
+    os.replace(partial, target)
+    return str(target)
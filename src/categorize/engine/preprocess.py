@@ -0,0 +1,22 @@
+import numpy as np
+from PIL import Image
+
+
+TARGET_SIZE = (224, 224)
+#-jc keras vgg19 preprocess_input ("caffe" mode): RGB->BGR, ImageNet means, no scaling
+CHANNEL_MEANS = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+#-jc bump whenever load_image() output changes: it keys the tensor cache
+PREPROCESS_VERSION = 1
+
+
+def load_image(source):
+    # source is a path or a file-like buffer from Storage.open_object();
+    # mirrors keras load_img(target_size=(224, 224)) + img_to_array +
+    # vgg19.preprocess_input, without importing keras
+    img = Image.open(source)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if img.size != TARGET_SIZE:
+        img = img.resize(TARGET_SIZE, Image.NEAREST)
+    img = np.asarray(img, dtype=np.float32)[..., ::-1] - CHANNEL_MEANS
+    return img.reshape((1,) + img.shape)
@@ -0,0 +1,61 @@
+from categorize.engine.preprocess import PREPROCESS_VERSION
+from common.metrics.metrics import counter, gauge
+from common.storage.disk_cache import DiskLRU
+import numpy as np
+import hashlib
+import logging
+
+
+REQUESTS = counter("categorize_tensor_cache_requests_total", "Preprocessed tensor cache lookups, by outcome", ("outcome",))
+CACHED_BYTES = gauge("categorize_tensor_cache_bytes", "Bytes held in the preprocessed tensor cache")
+
+
+def cache_key(image_path):
+    # Stored objects are never rewritten under the same path (uuid names,
+    # or the content digest under the content layout), so the path names
+    # the exact bytes load_image() reads; the version retires tensors from
+    # an older load_image(). Under the uuid layout every upload is a new
+    # path, so re-uploads of the same bytes do not share an entry
+    if not image_path:
+        return None
+    return f"{hashlib.sha256(image_path.encode()).hexdigest()}-v{PREPROCESS_VERSION}"
+
+
+class TensorCache(object):
+    # load_image() output on local disk, one .npy per image, so a re-scored
+    # image (model roll, retry, bulk backfill) skips fetch, decode, resize
+    # and preprocessing. Hits are memory-mapped read-only; the directory is
+    # a DiskLRU, so max_bytes bounds every worker sharing it together.
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.LOGGER = logging
+        self.lru = DiskLRU(cache_dir, max_bytes, REQUESTS, CACHED_BYTES, suffix=".npy")
+
+    def get(self, key):
+        path = self.lru.path(key)
+        try:
+            tensor = np.load(path, mmap_mode="r")
+        except FileNotFoundError:
+            REQUESTS.inc(outcome="miss")
+            return None
+        except (OSError, ValueError):
+            #-jc truncated or foreign file: drop it and decode again
+            self.LOGGER.warning("Dropping unreadable tensor %s", path)
+            self.lru.forget(path)
+            REQUESTS.inc(outcome="miss")
+            return None
+        self.lru.touch(path)
+        REQUESTS.inc(outcome="hit")
+        return tensor
+
+    def put(self, key, tensor):
+        if tensor.nbytes > self.max_bytes:
+            return
+        #-jc a full or read-only cache disk must not fail the image
+        self.lru.store(
+            self.lru.path(key), lambda target: np.save(target, np.ascontiguousarray(tensor), allow_pickle=False)
+        )
+
+    def stats(self):
+        return self.lru.stats()
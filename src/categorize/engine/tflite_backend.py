@@ -0,0 +1,42 @@
+import numpy as np
+from categorize.engine.backend import InferenceBackend
+
+
+class TFLiteBackend(InferenceBackend):
+    def __init__(self, config):
+        super().__init__(config)
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        threads = int(config["threads"]) if "threads" in config else 0
+        self.interpreter = Interpreter(model_path=config["model_path"], num_threads=threads or None)
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = None
+
+    def predict(self, images):
+        #-jc the interpreter is sized per batch; only re-allocate when the size changes
+        if images.shape[0] != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input["index"], images.shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = images.shape[0]
+        self.interpreter.set_tensor(self.input["index"], self._quantize(images, self.input))
+        self.interpreter.invoke()
+        return self._dequantize(self.interpreter.get_tensor(self.output["index"]), self.output)
+
+    @staticmethod
+    def _quantize(images, detail):
+        if detail["dtype"] == np.float32:
+            return images
+        scale, zero_point = detail["quantization"]
+        info = np.iinfo(detail["dtype"])
+        return np.clip(np.round(images / scale + zero_point), info.min, info.max).astype(detail["dtype"])
+
+    @staticmethod
+    def _dequantize(output, detail):
+        if detail["dtype"] == np.float32:
+            return output
+        scale, zero_point = detail["quantization"]
+        return (output.astype(np.float32) - zero_point) * scale
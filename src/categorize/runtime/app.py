@@ -1,45 +1,218 @@
 import os
+import time
+STARTED = time.monotonic()  #-jc startup phases are timed from here
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 
 import threading
+import signal
+import multiprocessing
 import random
 import logging
+import queue as pyqueue
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-from flask import Flask
-from keras.models import load_model
-from keras.utils import load_img as img_from_file
-from keras.utils import img_to_array
-from keras.utils import disable_interactive_logging
-from keras.applications.vgg19 import preprocess_input
-from keras.applications.vgg19 import decode_predictions
+from flask import Flask, jsonify
 
 from common.storage.storage import Storage
 from common.queue.queue import Queue
 from common.event.request_dto import Request
 from common.event.response_dto import Response
 from common.config.config import Configuration
+from common.metrics.metrics import REGISTRY, histogram, instrument_app
+from common.tracing.tracing import Tracer
+from categorize.engine.engine import InferenceEngine, IMAGE_CLASSES
+from categorize.engine.preprocess import load_image
+from categorize.engine.tensor_cache import TensorCache, cache_key
 
 import traceback
 
 LOGGER = logging
 app = Flask(__name__)
 RESULT_MART = dict()
+BATCH_STATS = {
+    "batches": 0,
+    "images": 0,
+    "last_size": 0,
+    "last_latency_ms": 0.0,
+    "avg_latency_ms": 0.0,
+}
+STAGE_STATS = dict()
 MODEL_EXEC = None
+PREPROCESS_POOL = None
+TENSOR_CACHE = None  #-jc preprocessed inputs by stored object, when configured
+STOPPING = threading.Event()
+WORKERS = []
+WORKER_ID = 0
+WORKER_STATS = None  #-jc shared dict, only when running several worker processes
+WORKER_METRICS = None
+METRICS_PUBLISHED = 0.0
+STARTUP = {"ready": False, "phases": {}}
+TRACER = Tracer("categorize")
+STAGE_LATENCY = histogram("categorize_stage_seconds", "Time per pipeline stage (per image or per batch)", ("stage",))
+BATCH_SIZES = histogram("categorize_batch_size", "Images per inference batch", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
 
 
 @app.route("/stats", methods=["GET"])
 def get_request_stats():
     global RESULT_MART
-    return str(RESULT_MART)
+    if WORKER_STATS is not None:
+        return str(dict(workers=dict(WORKER_STATS)))
+    if TENSOR_CACHE is not None:
+        return str(dict(RESULT_MART, batch=BATCH_STATS, stages=STAGE_STATS, tensor_cache=TENSOR_CACHE.stats()))
+    return str(dict(RESULT_MART, batch=BATCH_STATS, stages=STAGE_STATS))
 
 
-def load_image(file_name):
-    img = img_from_file(file_name, target_size=(224, 224))
-    img = img_to_array(img)
-    img = img.reshape((1, img.shape[0], img.shape[1], img.shape[2]))
-    img = preprocess_input(img)
-    return img
+def worker_metrics():
+    if WORKER_METRICS is None:
+        return []
+    return [({"worker": str(worker_id)}, snapshot) for worker_id, snapshot in WORKER_METRICS.items()]
+
+
+instrument_app(app, extra=worker_metrics)
+
+
+@app.route("/health", methods=["GET"])
+def get_health():
+    # liveness: the process answers and no inference worker has died
+    alive = all(worker.is_alive() for worker in WORKERS)
+    return jsonify({"alive": alive}), 200 if alive else 503
+
+
+@app.route("/ready", methods=["GET"])
+def get_ready():
+    # readiness: model loaded, warmed up and consuming (in every worker)
+    if WORKER_STATS is not None:
+        startups = [WORKER_STATS.get(worker_id, {}).get("startup", {}) for worker_id in range(len(WORKERS))]
+    else:
+        startups = [STARTUP]
+    ready = bool(WORKERS) and all(startup.get("ready") for startup in startups) and not STOPPING.is_set()
+    return jsonify({"ready": ready, "startup": startups}), 200 if ready else 503
+
+
+def prepare_image(image_path, key=None):
+    # runs on the preprocess pool; returns (tensor, fetch seconds,
+    # decode+preprocess seconds, wall-clock time it finished)
+    started = time.monotonic()
+    if key is not None and TENSOR_CACHE is not None:
+        image = TENSOR_CACHE.get(key)
+        if image is not None:
+            #-jc cached: no fetch, no decode
+            return image, 0.0, time.monotonic() - started, time.time()
+    with STORAGE.open_object(image_path) as buffer:
+        fetched = time.monotonic()
+        image = load_image(buffer)
+    if key is not None and TENSOR_CACHE is not None:
+        TENSOR_CACHE.put(key, image)
+    return image, fetched - started, time.monotonic() - fetched, time.time()
+
+
+def classify_batch(batch, prepared):
+    # returns one class per event, None where the image failed to load or
+    # the predict failed
+    image_classes = [None] * len(batch)
+    images = []
+    loaded = []
+    for idx, (event, future) in enumerate(zip(batch, prepared)):
+        try:
+            image, fetch_time, preprocess_time, finished = future.result()
+            record_stage("fetch", fetch_time)
+            record_stage("preprocess", preprocess_time)
+            event.mark("preprocessed", finished)
+            TRACER.record(
+                "categorize.fetch", event.trace_id, finished - preprocess_time - fetch_time,
+                finished - preprocess_time, parent_id=event.span_id
+            )
+            TRACER.record(
+                "categorize.preprocess", event.trace_id, finished - preprocess_time, finished,
+                parent_id=event.span_id
+            )
+            images.append(image)
+            loaded.append(idx)
+        except Exception:
+            LOGGER.exception("classify_batch(): failed to load image for %s", event["_id"])
+
+    if images:
+        try:
+            started = time.monotonic()
+            predict_started = time.time()
+            pred = MODEL_EXEC.predict(np.concatenate(images))  #-jc
+            record_stage("predict", time.monotonic() - started)
+            for row, idx in enumerate(loaded):
+                image_classes[idx] = IMAGE_CLASSES[int(np.argmax(pred[row]))]
+                batch[idx].mark("inferred")
+                TRACER.record(
+                    "categorize.predict", batch[idx].trace_id, predict_started, batch[idx].stages["inferred"],
+                    parent_id=batch[idx].span_id, batch_size=len(images)
+                )
+        except Exception:
+            LOGGER.exception("classify_batch(): model failed, using random classes")
+
+    return image_classes
+
+
+def prefetch(queue, ready):
+    # Stage 1: pull batches and hand every image to the preprocess pool, so
+    # decoding overlaps with the model working on earlier batches. `ready`
+    # is bounded, which stops us pulling from Kafka when the model lags.
+    # Offsets are committed only once the responses infer() published are delivered.
+    batches = queue.scan_batches(QUEUE_RCV_CHANNEL, Request, BATCH_SIZE, BATCH_MAX_WAIT, manual_commit=True)
+    try:
+        for batch in batches:
+            if STOPPING.is_set():
+                break
+            if not batch:
+                continue
+            for event in batch:
+                event.mark("consumed")
+            prepared = [
+                PREPROCESS_POOL.submit(prepare_image, event.image_path, cache_key(event.image_path))
+                for event in batch
+            ]
+            ready.put((batch, prepared, time.monotonic()))
+    except Exception:
+        LOGGER.exception("prefetch(): feed failed")
+    finally:
+        #-jc closes the consumer, so the group rebalances without waiting for a timeout
+        batches.close()
+        ready.put(None)
+
+
+def record_batch(size, latency):
+    global BATCH_STATS
+    BATCH_STATS["batches"] += 1
+    BATCH_SIZES.observe(size)
+    BATCH_STATS["images"] += size
+    BATCH_STATS["last_size"] = size
+    BATCH_STATS["last_latency_ms"] = round(latency * 1000, 3)
+    BATCH_STATS["avg_latency_ms"] = round(
+        BATCH_STATS["avg_latency_ms"]
+        + (BATCH_STATS["last_latency_ms"] - BATCH_STATS["avg_latency_ms"]) / BATCH_STATS["batches"],
+        3,
+    )
+
+
+def record_stage(stage, seconds):
+    global STAGE_STATS
+    STAGE_LATENCY.observe(seconds, stage=stage)
+    stats = STAGE_STATS.setdefault(stage, {"count": 0, "last_ms": 0.0, "avg_ms": 0.0})
+    stats["count"] += 1
+    stats["last_ms"] = round(seconds * 1000, 3)
+    stats["avg_ms"] = round(stats["avg_ms"] + (stats["last_ms"] - stats["avg_ms"]) / stats["count"], 3)
+
+
+def publish_stats():
+    global METRICS_PUBLISHED
+    if WORKER_STATS is not None:
+        WORKER_STATS[WORKER_ID] = dict(RESULT_MART, batch=BATCH_STATS, stages=STAGE_STATS, startup=STARTUP)
+        #-jc the parent serves /metrics for all workers; a snapshot a second is plenty
+        if time.monotonic() - METRICS_PUBLISHED >= 1.0:
+            METRICS_PUBLISHED = time.monotonic()
+            WORKER_METRICS[WORKER_ID] = REGISTRY.snapshot()
+
+
+def startup_phase(phase, started):
+    STARTUP["phases"][phase] = round((time.monotonic() - started) * 1000, 3)
 
 
 def infer():
@@ -47,43 +220,73 @@ def infer():
     global MODEL_EXEC
 
     LOGGER.info(
-        "infer(): starting; backend=%s brokers=%s rcv=%s send=%s",
-        QUEUE_BACKEND, QUEUE_CONFIG, QUEUE_RCV_CHANNEL, QUEUE_SEND_CHANNEL
+        "infer(): starting; backend=%s brokers=%s rcv=%s send=%s batch_size=%s max_wait=%ss",
+        QUEUE_BACKEND, QUEUE_CONFIG, QUEUE_RCV_CHANNEL, QUEUE_SEND_CHANNEL, BATCH_SIZE, BATCH_MAX_WAIT
     )
 
+    queue = None
     try:
         queue = Queue(QUEUE_BACKEND, QUEUE_CONFIG)
         LOGGER.info("infer(): Queue created OK")
 
-        for event in queue.scan_events(QUEUE_RCV_CHANNEL, Request()):
+        ready = pyqueue.Queue(maxsize=PREFETCH_BATCHES)
+        threading.Thread(target=prefetch, args=(queue, ready), name="prefetch", daemon=True).start()
+
+        STARTUP["ready"] = True
+        STARTUP["total_ms"] = round((time.monotonic() - STARTED) * 1000, 3)
+        LOGGER.info("infer(): worker %s ready after %sms: %s", WORKER_ID, STARTUP["total_ms"], STARTUP["phases"])
+        publish_stats()
+
+        # Stage 2: the model takes whatever the pool has finished
+        while True:
+            item = ready.get()
+            if item is None:
+                if STOPPING.is_set():
+                    LOGGER.info("infer(): worker %s stopped", WORKER_ID)
+                    return
+                raise Exception("Inference feed stopped")
+            batch, prepared, queued_at = item
             LOGGER.info(
-                "infer(): received event type=%s id=%s",
-                type(event),
-                event.get("_id") if isinstance(event, dict) else getattr(event, "_id", "unknown"),
+                "infer(): received batch of %d: %s",
+                len(batch), [event["_id"] for event in batch]
             )
 
-            resp = Response()
-            resp.correlation_id = event["_id"]
-            image_classes = ["foggy", "rainy", "shine"]
-
-            try:
-                image_path = STORAGE.get_file(event.image_path)
-                image = load_image(image_path)
-                pred = MODEL_EXEC.predict(image)  #-jc
+            started = time.monotonic()
+            record_stage("queued", started - queued_at)
+            for event in batch:
+                event.mark("dequeued")
+            image_classes = classify_batch(batch, prepared)
+            record_batch(len(batch), time.monotonic() - started)
 
-                idx = int(np.argmax(pred[0]))  #-jc
-                resp.image_class = image_classes[idx]  #-jc
-            except Exception:
-                LOGGER.exception("infer(): model failed, using random class")
-                resp.image_class = random.choice(image_classes)
+            started = time.monotonic()
+            for event, image_class in zip(batch, image_classes):
+                resp = Response()
+                resp.follow(event)
+                resp.correlation_id = event["_id"]
+                #-jc the client still gets a class, as the single-image path did, but flagged
+                resp.fallback = image_class is None
+                resp.image_class = random.choice(IMAGE_CLASSES) if resp.fallback else image_class
+                resp.model = MODEL_EXEC.model_id
 
-            if resp.image_class in RESULT_MART:
-                RESULT_MART[resp.image_class] += 1
-            else:
-                RESULT_MART[resp.image_class] = 1
+                if resp.image_class in RESULT_MART:
+                    RESULT_MART[resp.image_class] += 1
+                else:
+                    RESULT_MART[resp.image_class] = 1
 
-            LOGGER.info("infer(): publishing response id=%s", resp.correlation_id)
-            queue.publish_event(QUEUE_SEND_CHANNEL, resp)
+                LOGGER.info("infer(): publishing response id=%s", resp.correlation_id)
+                resp.mark("responded")
+                queue.publish_event(QUEUE_SEND_CHANNEL, resp)
+                TRACER.stage_span("queue.request", resp, "published", "consumed")
+                TRACER.stage_span("categorize.queued", resp, "consumed", "dequeued")
+                TRACER.stage_span("categorize.batch", resp, "dequeued", "responded", batch_size=len(batch))
+            #-jc publish only buffers: ack once the responses are on the broker.
+            # Unacked, the batch and everything after it is redelivered to
+            # the group once this worker is gone
+            if not queue.flush():
+                raise Exception("Responses not delivered")
+            batch.ack()
+            record_stage("publish", time.monotonic() - started)
+            publish_stats()
 
     except Exception:
         LOGGER.error(
@@ -91,9 +294,122 @@ def infer():
             traceback.format_exc()
         )
         raise
+    finally:
+        if queue is not None:
+            queue.close()
+
+
+def configure(config):
+    global MODEL_PATH, BATCH_SIZE, BATCH_MAX_WAIT, PREFETCH_BATCHES, WORKER_COUNT, SHUTDOWN_TIMEOUT
+    global STORAGE, QUEUE_BACKEND, QUEUE_CONFIG, QUEUE_SEND_CHANNEL, QUEUE_RCV_CHANNEL, TRACER, TENSOR_CACHE
+
+    # App configuration
+    MODEL_PATH = config.categorize_model_path
+    BATCH_SIZE = max(1, int(config.categorize_batch_size))
+    BATCH_MAX_WAIT = int(config.categorize_batch_max_wait_ms) / 1000.0
+    PREFETCH_BATCHES = max(1, int(config.categorize_prefetch_batches))
+    WORKER_COUNT = max(1, int(config.categorize_workers))
+    SHUTDOWN_TIMEOUT = float(config.categorize_shutdown_timeout)
+
+    # Integrations configuration
+    STORAGE = Storage(backend=config.storage_backend, config={
+        "bucket": config.storage_s3_bucket,
+        "endpoint": config.storage_s3_endpoint,
+        "region": config.storage_s3_region,
+        "max_connections": int(config.storage_s3_max_connections),
+        "max_concurrency": int(config.storage_s3_max_concurrency),
+        "multipart_threshold_mb": float(config.storage_s3_multipart_threshold_mb),
+        "multipart_chunk_mb": float(config.storage_s3_multipart_chunk_mb),
+        #-jc optional local read-through cache, worth it when storage is remote
+        "cache_dir": config.categorize_storage_cache_dir,
+        "cache_max_mb": float(config.categorize_storage_cache_max_mb),
+    })
+    if config.categorize_tensor_cache_dir:
+        #-jc before the preprocess pool forks, so process workers inherit it
+        TENSOR_CACHE = TensorCache(
+            config.categorize_tensor_cache_dir, int(float(config.categorize_tensor_cache_max_mb) * 1024 * 1024)
+        )
+    TRACER = Tracer("categorize", config.tracing_exporter, {
+        "endpoint": config.tracing_endpoint,
+        "sample_rate": float(config.tracing_sample_rate),
+    })
+
+    QUEUE_BACKEND = config.queue_backend
+    QUEUE_CONFIG = {
+        "connection": config.queue_config,
+        "linger_ms": int(config.queue_linger_ms),
+        "batch_size": int(config.queue_batch_size),
+        "compression": config.queue_compression,
+        "codec": config.queue_codec,
+        #-jc every replica and worker shares one group, so each request is handled once
+        "group_id": config.categorize_group_id,
+    }
+    QUEUE_SEND_CHANNEL = config.queue_response_channel
+    QUEUE_RCV_CHANNEL = config.queue_input_channel
+
+
+def start_preprocess_pool(config):
+    global PREPROCESS_POOL
+    started = time.monotonic()
+    #-jc pool first: process workers are forked before TensorFlow spins up
+    if config.categorize_preprocess_mode == "process":
+        PREPROCESS_POOL = ProcessPoolExecutor(max_workers=int(config.categorize_preprocess_workers))
+        PREPROCESS_POOL.submit(int).result()
+    else:
+        PREPROCESS_POOL = ThreadPoolExecutor(
+            max_workers=int(config.categorize_preprocess_workers), thread_name_prefix="preprocess"
+        )
+    startup_phase("preprocess_pool", started)
+
+
+def start_inference(config):
+    # TensorFlow is first imported here, off the main thread, so /health
+    # answers while the model loads; the warm-up batch runs before we
+    # subscribe, so the first real batch does not pay for graph tracing
+    global MODEL_EXEC
+    started = time.monotonic()
+    MODEL_EXEC = InferenceEngine(config.categorize_engine, {
+        "model_path": MODEL_PATH,
+        "threads": int(config.categorize_engine_threads),
+        "cache_dir": config.categorize_model_cache_dir,
+        "quantize": config.categorize_model_cache_quantize,
+    })
+    startup_phase("model_load", started)
+
+    started = time.monotonic()
+    MODEL_EXEC.warm_up(BATCH_SIZE)
+    startup_phase("warm_up", started)
+    infer()
+
+
+def run_worker(worker_id, config):
+    # Entry point of a forked inference worker: its own consumer (same
+    # group, so Kafka splits the partitions between workers), its own
+    # preprocess pool and its own copy of the model.
+    global WORKER_ID
+    WORKER_ID = worker_id
+    del WORKERS[:]
+    signal.signal(signal.SIGTERM, lambda signum, frame: STOPPING.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    start_preprocess_pool(config)
+    start_inference(config)
+
+
+def shutdown(signum, frame):
+    # Drain what has been prefetched, leave the consumer group, then exit
+    LOGGER.info("Stopping %d inference worker(s) on signal %s", len(WORKERS), signum)
+    STOPPING.set()
+    for worker in WORKERS:
+        if isinstance(worker, multiprocessing.Process):
+            worker.terminate()
+    for worker in WORKERS:
+        worker.join(SHUTDOWN_TIMEOUT)
+    raise SystemExit(0)
 
 
 if __name__ == "__main__":
+    startup_phase("imports", STARTED)
+    started = time.monotonic()
     config = Configuration()
     config.load_config(config_file_path=os.getenv("CONFIG_FILE", default=None))
 
@@ -102,18 +418,26 @@ if __name__ == "__main__":
     APP_PORT = int(config.categorize_app_port)
     LOGLEVEL_DEBUG = config.categorize_app_debug
 
-    # App configuration
-    MODEL_PATH = config.categorize_model_path
-
-    # Integrations configuration
-    STORAGE = Storage(backend=config.storage_backend)
+    configure(config)
+    startup_phase("config", started)
 
-    QUEUE_BACKEND = config.queue_backend
-    QUEUE_CONFIG = config.queue_config
-    QUEUE_SEND_CHANNEL = config.queue_response_channel
-    QUEUE_RCV_CHANNEL = config.queue_input_channel
+    if WORKER_COUNT > 1:
+        #-jc fork before anything touches TensorFlow; each worker loads its own model
+        context = multiprocessing.get_context("fork")
+        manager = context.Manager()
+        WORKER_STATS = manager.dict()
+        WORKER_METRICS = manager.dict()
+        for worker_id in range(WORKER_COUNT):
+            #-jc not daemonic: a worker may run its own preprocess process pool
+            worker = context.Process(target=run_worker, args=(worker_id, config), name=f"inference-{worker_id}")
+            worker.start()
+            WORKERS.append(worker)
+    else:
+        start_preprocess_pool(config)
+        update_thread = threading.Thread(target=start_inference, args=(config,), name="inference", daemon=True)
+        update_thread.start()
+        WORKERS.append(update_thread)
 
-    MODEL_EXEC = load_model(MODEL_PATH, compile=False)
-    update_thread = threading.Thread(target=infer, name="inference")
-    update_thread.start()
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
     app.run(host=APP_HOST, port=APP_PORT, debug=LOGLEVEL_DEBUG, use_reloader=False)
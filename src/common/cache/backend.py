@@ -0,0 +1,23 @@
+import logging
+
+
+class CacheBackend(object):
+    def __init__(self, config):
+        self.config = config
+        self.LOGGER = logging
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        pass
+
+    def put(self, key, value):
+        pass
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
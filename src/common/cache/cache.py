@@ -0,0 +1,43 @@
+import hashlib
+import logging
+
+
+def content_digest(stream, chunk_size=65536):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    def __init__(self, backend, config):
+        self.LOGGER = logging
+        self.tiers = []
+        for name in [name.strip() for name in backend.split(",") if name.strip()]:
+            if name == "memory":
+                from common.cache.memory_backend import MemoryCache
+                self.tiers.append((name, MemoryCache(config)))
+            elif name == "postgres":
+                from common.cache.postgres_backend import PostgresCache
+                self.tiers.append((name, PostgresCache(config)))
+            else:
+                raise Exception("Cache backend not implemented")
+        self.LOGGER.info(f"Selected cache tiers: {[name for name, _ in self.tiers]}")
+
+    def get(self, key):
+        for idx, (_, tier) in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                #-jc backfill the faster tiers we missed on the way down
+                for _, upper in self.tiers[:idx]:
+                    upper.put(key, value)
+                return value
+        return None
+
+    def put(self, key, value):
+        for _, tier in self.tiers:
+            tier.put(key, value)
+
+    def stats(self):
+        return {name: tier.stats() for name, tier in self.tiers}
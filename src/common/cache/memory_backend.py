@@ -0,0 +1,50 @@
+from common.cache.backend import CacheBackend
+from collections import OrderedDict
+import threading
+import time
+
+
+class MemoryCache(CacheBackend):
+    def __init__(self, config):
+        super().__init__(config)
+        self.max_entries = int(config["max_entries"]) if "max_entries" in config else 10000
+        self.ttl = float(config["ttl"]) if "ttl" in config else 3600.0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            stored_at, value = self.entries[key]
+            if self.ttl > 0 and time.monotonic() - stored_at > self.ttl:
+                del self.entries[key]
+                self.evictions += 1
+                self._evicted(key, value)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self._store(key, value)
+            while len(self.entries) > self.max_entries:
+                evicted_key, (_, evicted_value) = self.entries.popitem(last=False)
+                self.evictions += 1
+                self._evicted(evicted_key, evicted_value)
+
+    def stats(self):
+        stats = super().stats()
+        stats["entries"] = len(self.entries)
+        return stats
+
+    # Subclass hooks, called with the lock held.
+    def _store(self, key, value):
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+
+    def _evicted(self, key, value):
+        pass
@@ -0,0 +1,59 @@
+from common.cache.backend import CacheBackend
+import threading
+import psycopg2
+import psycopg2.sql
+
+
+class PostgresCache(CacheBackend):
+    # Read-only tier: answers come from the responses reporting has already
+    # persisted, joined back to the request that carried the image digest.
+    # Keys are (digest, model); fallback answers are never served.
+    def __init__(self, config):
+        super().__init__(config)
+        self.db = config["db"]
+        self.request_table = config["request_table"] if "request_table" in config else "requests"
+        self.response_table = config["response_table"] if "response_table" in config else "responses"
+        self.connection = None
+        self.lock = threading.Lock()
+        self.query = psycopg2.sql.SQL(
+            "SELECT resp.image_class FROM {requests} req "
+            "JOIN {responses} resp ON resp.correlation_id = req._id "
+            "WHERE req.image_digest = %s AND resp.model = %s AND resp.fallback IS NOT TRUE "
+            "ORDER BY resp._tz_created DESC LIMIT 1"
+        ).format(
+            requests=psycopg2.sql.Identifier(self.request_table),
+            responses=psycopg2.sql.Identifier(self.response_table),
+        )
+
+    def get(self, key):
+        digest, model = key
+        row = self._fetchone(self.query, (digest, model))
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, value):
+        # reporting owns the responses table
+        pass
+
+    def _fetchone(self, query, params):
+        with self.lock:
+            try:
+                if self.connection is None or self.connection.closed:
+                    self.connection = psycopg2.connect(**self.db)
+                    self.connection.autocommit = True
+                with self.connection.cursor() as cur:
+                    cur.execute(query, params)
+                    return cur.fetchone()
+            except psycopg2.Error:
+                self.LOGGER.exception("Postgres cache lookup failed")
+                #-jc close it, or every failure leaves a server connection behind
+                if self.connection is not None:
+                    try:
+                        self.connection.close()
+                    except Exception:
+                        pass
+                self.connection = None
+                return None
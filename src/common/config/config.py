@@ -6,12 +6,49 @@ class Configuration(object):
         #Defaults
         # Storage
         self.storage_backend = "file"
+        #-jc file backend: "uuid" (flat) or "content" (sha256 keyed, sharded, deduplicated)
+        self.storage_file_layout = "uuid"
+        self.storage_file_shard_depth = 2
+        self.storage_s3_bucket = ""
+        self.storage_s3_endpoint = ""
+        self.storage_s3_region = ""
+        self.storage_s3_max_connections = 32
+        self.storage_s3_max_concurrency = 8
+        self.storage_s3_multipart_threshold_mb = 8
+        self.storage_s3_multipart_chunk_mb = 8
 
         # Queue
         self.queue_backend = "kafka"
         self.queue_config = "kafka:29092"
         self.queue_input_channel = "requests_topic"
         self.queue_response_channel = "response_topic"
+        self.queue_linger_ms = 5
+        self.queue_batch_size = 65536
+        self.queue_compression = "lz4"
+        self.queue_codec = "json"
+
+        # Result cache
+        self.cache_backend = "memory"
+        self.cache_max_entries = 10000
+        self.cache_ttl = 3600
+
+        # Result store
+        self.results_backend = "memory"
+        self.results_max_entries = 100000
+        self.results_ttl = 3600
+
+        # Tracing
+        self.tracing_exporter = "none"
+        self.tracing_endpoint = ""
+        self.tracing_sample_rate = 1.0
+
+        # Retention (reporting runs it; 0 days keeps images forever)
+        self.retention_days = 0
+        self.retention_interval_s = 3600
+        self.retention_batch_size = 500
+        self.retention_max_deletes_per_sec = 200
+        self.retention_partial_max_age_s = 3600
+        self.retention_orphan_grace_hours = 24
 
         # Dispatcher
         self.dispatcher_app_host = "127.0.0.1"
@@ -19,12 +56,33 @@ class Configuration(object):
         self.dispatcher_app_debug = True
         self.dispatcher_temp_folder = "/tmp"  # nosec B108 - container-local temp storage -jc
         self.dispatcher_allowed_extensions = {'png', 'jpg', 'jpeg'}
+        self.dispatcher_max_wait = 30
+        #-jc 0 stores uploads as they came; otherwise a JPEG rendition bounded to max_side
+        self.dispatcher_ingest_max_side = 0
+        self.dispatcher_ingest_quality = 85
+        self.dispatcher_ingest_keep_original = False
 
         # Categorize
         self.categorize_app_host = "127.0.0.1"
         self.categorize_app_port = "8090"
         self.categorize_app_debug = True
         self.categorize_model_path = "../model/vgg19-weather.h5"
+        self.categorize_batch_size = 1
+        self.categorize_batch_max_wait_ms = 50
+        self.categorize_preprocess_mode = "thread"
+        self.categorize_preprocess_workers = 4
+        self.categorize_prefetch_batches = 2
+        self.categorize_group_id = "categorize"
+        self.categorize_workers = 1
+        self.categorize_shutdown_timeout = 30
+        self.categorize_engine = "keras"
+        self.categorize_engine_threads = 0
+        self.categorize_model_cache_dir = "/tmp/categorize-models"
+        self.categorize_model_cache_quantize = "none"
+        self.categorize_storage_cache_dir = ""
+        self.categorize_storage_cache_max_mb = 1024
+        self.categorize_tensor_cache_dir = ""
+        self.categorize_tensor_cache_max_mb = 2048
 
         # Reporting
         self.reporting_app_host = "127.0.0.1"
@@ -37,6 +95,11 @@ class Configuration(object):
         self.reporting_db_database_name = "cat_categorize"
         self.reporting_db_request_table = "requests"
         self.reporting_db_response_table = "responses"
+        self.reporting_db_counts_table = "event_counts"
+        self.reporting_db_latency_table = "request_latency"
+        self.reporting_db_pool_size = 4
+        self.reporting_flush_rows = 500
+        self.reporting_flush_interval_ms = 1000
 
     def load_config(self, config_file_path=None):
         if config_file_path is not None:
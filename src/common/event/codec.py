@@ -0,0 +1,55 @@
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Wire encodings for events. JSON payloads (stdlib or orjson, same bytes on
+# the wire) go out bare, so they stay readable by anything that reads JSON.
+# Other encodings are prefixed with a small header, NUL + name + NUL,
+# which the consumer uses to pick the decoder: producers can switch
+# encoding without coordinating with consumers, as long as the consumers
+# are upgraded first.
+
+LOGGER = logging
+HEADER = b"\x00"
+CODECS = ("json", "orjson", "msgpack")
+#-jc json.dumps() with any option set builds a new encoder per call
+JSON_ENCODER = json.JSONEncoder(separators=(",", ":"))
+
+
+def codec_for(name):
+    # the encoding actually used for `name`; a missing optional library
+    # falls back to JSON, which every consumer can read
+    if name not in CODECS:
+        raise Exception(f"Event codec not implemented: {name}")
+    if name == "orjson" and orjson is None or name == "msgpack" and msgpack is None:
+        LOGGER.warning(f"Event codec {name} not installed, using json")
+        return "json"
+    return name
+
+
+def encode(data, codec="json"):
+    if codec == "orjson":
+        return orjson.dumps(data)
+    elif codec == "msgpack":
+        return HEADER + b"msgpack" + HEADER + msgpack.packb(data)
+    return JSON_ENCODER.encode(data)
+
+
+def decode(payload):
+    if isinstance(payload, (bytes, bytearray, memoryview)) and payload[:1] == HEADER:
+        name, _, body = bytes(payload[1:]).partition(HEADER)
+        if name == b"msgpack" and msgpack is not None:
+            return msgpack.unpackb(body)
+        raise Exception(f"Cannot decode event encoding {name!r}")
+    #-jc orjson parses any JSON, whoever produced it
+    return orjson.loads(payload) if orjson is not None else json.loads(payload)
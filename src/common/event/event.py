@@ -1,55 +1,89 @@
-import json
+import time
 from datetime import datetime
 import uuid
+from common.event import codec
 
 
 class Event(object):
+    # Each class declares its payload schema: FIELDS, in wire order, and the
+    # EXPECTED ones which must be set before dump() and present in load().
+    # Values live in slots, so there is no per-instance __dict__ to copy and
+    # encode/decode are a single pass over the schema.
+    __slots__ = ("_tz_created", "_id", "correlation_id", "trace_id", "span_id", "stages", "more")
+    FIELDS = ("_tz_created", "_id", "correlation_id", "trace_id", "span_id", "stages")
+    EXPECTED = ()
+
     def __init__(self):
         self._tz_created = str(datetime.now())
         self._id = str(uuid.uuid4())
         self.correlation_id = None
-        self._expected_fields = []
+        #-jc trace context: W3C-sized ids, and when each hop reached each stage
+        self.trace_id = uuid.uuid4().hex
+        self.span_id = None
+        self.stages = dict()
         self.more = None
 
-    def load(self, event_json):
-        event = event_json if isinstance(event_json, dict) else json.loads(event_json)
-        for field in self.keys():
+    @classmethod
+    def from_payload(cls, payload):
+        # for consumers: a new event straight from the wire, without minting
+        # the ids and timestamp __init__ would and the payload overwrites
+        event = payload if isinstance(payload, dict) else codec.decode(payload)
+        dto = cls.__new__(cls)
+        dto.more = None
+        try:
+            for field in cls.FIELDS:
+                setattr(dto, field, event[field])
+        except KeyError:
+            #-jc older producers leave optional fields out: take the defaults
+            dto = cls()
+            dto.load(event)
+        return dto
+
+    def load(self, payload):
+        event = payload if isinstance(payload, dict) else codec.decode(payload)
+        for field in self.FIELDS:
             if field in event:
-                self.__dict__[field] = event[field]
-            elif field not in self._expected_fields:
-                pass
-            else:
+                setattr(self, field, event[field])
+            elif field in self.EXPECTED:
                 raise Exception(f"Invalid event definition: {event}")
 
+    def mark(self, stage, at=None):
+        self.stages[stage] = time.time() if at is None else at
+
+    def follow(self, event):
+        # a reply joins the trace of the event it answers, stages included
+        self.trace_id = event.trace_id
+        self.span_id = event.span_id
+        self.stages = dict(event.stages)
+
     def set_field(self, field, value):
-        if field in self._as_dict().keys():
-            self.__dict__[field] = value
+        if field in self.FIELDS:
+            setattr(self, field, value)
 
     def dump(self, dump_format="json"):
-        for key in self._expected_fields:
-            if self._as_dict()[key] is None:
+        for key in self.EXPECTED:
+            if getattr(self, key) is None:
                 raise Exception("Mismatched event dto")
-        return json.dumps(self._as_dict()) if dump_format == "json" else dict(self.__dict__)
+        if dump_format in codec.CODECS:
+            return codec.encode(self._as_dict(), dump_format)
+        return self._as_dict()
 
     def _as_dict(self):
-        unfiltered = dict(self.__dict__)
-        unfiltered.pop("_expected_fields")
-        unfiltered.pop("more")
-        return unfiltered
+        return {field: getattr(self, field) for field in self.FIELDS}
 
     def __getitem__(self, name):
-        return self._as_dict()[name]
+        if name not in self.FIELDS:
+            raise KeyError(name)
+        return getattr(self, name)
 
     def __iter__(self):
-        return iter(self._as_dict())
+        return iter(self.FIELDS)
 
     def keys(self):
-        return self._as_dict().keys()
+        return self.FIELDS
 
     def items(self):
-        return self._as_dict().items()
+        return [(field, getattr(self, field)) for field in self.FIELDS]
 
     def values(self):
-        return self._as_dict().values()
-
-
+        return [getattr(self, field) for field in self.FIELDS]
@@ -2,13 +2,16 @@ from common.event.event import Event
 
 
 class Request(Event):
+    __slots__ = ("image_path", "image_size", "image_format", "user_name", "image_digest", "original_path")
+    FIELDS = Event.FIELDS + __slots__
+    EXPECTED = ("image_path", "image_size", "image_format", "user_name")
+
     def __init__(self):
         super().__init__()
         self.image_path = None
         self.image_size = None
         self.image_format = None
         self.user_name = None
-        self._expected_fields.append("image_path")
-        self._expected_fields.append("image_size")
-        self._expected_fields.append("image_format")
-        self._expected_fields.append("user_name")
+        self.image_digest = None
+        #-jc set when ingest keeps the upload next to its rendition
+        self.original_path = None
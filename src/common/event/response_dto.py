@@ -2,9 +2,15 @@ from common.event.event import Event
 
 
 class Response(Event):
+    __slots__ = ("image_class", "fallback", "model")
+    FIELDS = Event.FIELDS + __slots__
+    EXPECTED = ("image_class", "correlation_id")
+
     def __init__(self):
         super().__init__()
         self.image_class = None
         self.correlation_id = None
-        self._expected_fields.append("image_class")
-        self._expected_fields.append("correlation_id")
+        #-jc a random stand-in because fetch, decode or predict failed; never cached
+        self.fallback = False
+        #-jc which model answered, so cached answers go with it
+        self.model = None
@@ -0,0 +1,288 @@
+import bisect
+import os
+import threading
+import time
+
+
+# Counters, gauges and histograms rendered in the Prometheus text format.
+# Updates take one lock and a dict lookup, cheap enough to leave on under
+# load; label values should come from small fixed sets (route templates,
+# channel names, stages), never from ids.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric(object):
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values = dict()
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def snapshot(self):
+        with self.lock:
+            values = {key: self._copy(value) for key, value in self.values.items()}
+        return {"kind": self.kind, "help": self.help, "labels": self.label_names, "values": values}
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self.function = None
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set_function(self, function):
+        # evaluated at scrape time, for totals something else already keeps
+        self.function = function
+
+    def snapshot(self):
+        if self.function is not None:
+            try:
+                total = self.function()
+                with self.lock:
+                    self.values[()] = total
+            except Exception:
+                pass
+        return super().snapshot()
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self.function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        # evaluated at scrape time, for values something else already tracks
+        self.function = function
+
+    def snapshot(self):
+        if self.function is not None:
+            try:
+                self.set(self.function())
+            except Exception:
+                pass
+        return super().snapshot()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                #-jc [per-bucket counts (last one is +Inf), sum, count]
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        return Timer(self, labels)
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot["buckets"] = self.buckets
+        return snapshot
+
+    @staticmethod
+    def _copy(value):
+        return [list(value[0]), value[1], value[2]]
+
+
+class Timer(object):
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.monotonic() - self.started, **self.labels)
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = dict()
+        self.lock = threading.Lock()
+
+    def counter(self, name, help, labels=()):
+        return self._get_or_create(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._get_or_create(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labels, buckets=buckets)
+
+    def snapshot(self):
+        # plain dicts and lists, so it can be handed to another process
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def render(self, extra=()):
+        # extra: (labels, snapshot) pairs from other processes, e.g. {"worker": "1"}
+        return render([({}, self.snapshot())] + list(extra))
+
+    def _get_or_create(self, cls, name, help, labels, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, labels, **kwargs)
+            elif not isinstance(metric, cls):
+                raise Exception(f"Metric {name} already registered as a {metric.kind}")
+            return metric
+
+
+def render(snapshots):
+    merged = dict()
+    for extra, snapshot in snapshots:
+        for name, metric in snapshot.items():
+            merged.setdefault(name, (metric, []))[1].append((extra, metric))
+
+    lines = []
+    for name, (first, parts) in merged.items():
+        lines.append(f"# HELP {name} {first['help']}")
+        lines.append(f"# TYPE {name} {first['kind']}")
+        for extra, metric in parts:
+            for key, value in metric["values"].items():
+                labels = dict(extra, **dict(zip(metric["labels"], key)))
+                if metric["kind"] == "histogram":
+                    cumulative = 0
+                    for bound, count in zip(list(metric["buckets"]) + ["+Inf"], value[0]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(dict(labels, le=bound))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {value[1]}")
+                    lines.append(f"{name}_count{_labels(labels)} {value[2]}")
+                else:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+#-jc one registry per process, shared by every module
+REGISTRY = Registry()
+
+
+def counter(name, help, labels=()):
+    return REGISTRY.counter(name, help, labels)
+
+
+def gauge(name, help, labels=()):
+    return REGISTRY.gauge(name, help, labels)
+
+
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.histogram(name, help, labels, buckets)
+
+
+def _resident_memory():
+    #-jc Linux only; elsewhere the gauge is simply not updated
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+counter("process_cpu_seconds_total", "User and system CPU time of this process").set_function(
+    lambda: sum(os.times()[:2])
+)
+gauge("process_resident_memory_bytes", "Resident memory of this process").set_function(_resident_memory)
+gauge("process_threads", "Threads in this process").set_function(threading.active_count)
+
+
+HTTP_LATENCY = histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+)
+
+
+def instrument_app(app, framework="flask", extra=None):
+    # Times every request by route template and adds GET /metrics.
+    # extra: optional callable returning (labels, snapshot) pairs to merge in.
+    if framework == "quart":
+        from quart import request, g
+    else:
+        from flask import request, g
+
+    def start_timer():
+        g.metrics_started = time.monotonic()
+
+    def observe_request(response):
+        started = getattr(g, "metrics_started", None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            HTTP_LATENCY.observe(
+                time.monotonic() - started, method=request.method, route=route, status=response.status_code
+            )
+        return response
+
+    def metrics():
+        return REGISTRY.render(extra() if extra is not None else ()), 200, {"Content-Type": CONTENT_TYPE}
+
+    if framework == "quart":
+        #-jc Quart would push sync hooks onto a thread pool; these never block
+        async def start_timer_async():
+            start_timer()
+
+        async def observe_request_async(response):
+            return observe_request(response)
+
+        async def metrics_async():
+            return metrics()
+
+        app.before_request(start_timer_async)
+        app.after_request(observe_request_async)
+        app.add_url_rule("/metrics", "metrics", metrics_async, methods=["GET"])
+    else:
+        app.before_request(start_timer)
+        app.after_request(observe_request)
+        app.add_url_rule("/metrics", "metrics", metrics, methods=["GET"])
+    return app
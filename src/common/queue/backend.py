@@ -1,5 +1,48 @@
+from collections import deque
+import threading
 import logging
 
+
+def no_ack():
+    pass
+
+
+class PendingBatches(object):
+    # Offsets of the batches handed out with manual_commit, oldest first.
+    # Batches are acknowledged from whichever thread handled them, but
+    # committing an offset commits everything before it, so only the run of
+    # acknowledged batches at the front is ever committable.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batches = deque()  # [offsets, acked]
+
+    def add(self, offsets):
+        entry = [offsets, False]
+        with self.lock:
+            self.batches.append(entry)
+
+        def ack():
+            with self.lock:
+                entry[1] = True
+        return ack
+
+    def completed(self):
+        # the next offset to read per partition, past every acknowledged batch
+        offsets = dict()
+        with self.lock:
+            while self.batches and self.batches[0][1]:
+                offsets.update(self.batches.popleft()[0])
+        return offsets
+
+    def forget(self, partitions):
+        # partitions now owned by another consumer, which re-reads whatever
+        # is still in flight here; a late ack must not commit over it
+        with self.lock:
+            for offsets, _ in self.batches:
+                for partition in partitions:
+                    offsets.pop(partition, None)
+
+
 class QueueBackend(object):
     def __init__(self, config):
         self.connection = config
@@ -10,3 +53,20 @@ class QueueBackend(object):
 
     def subscribe(self, channel):
         pass
+
+    def subscribe_batches(self, channel, max_messages, timeout, manual_commit=False):
+        # yields lists of payloads, committed once the caller asks for the
+        # next one; with manual_commit, (payloads, ack) pairs instead, and a
+        # batch is committed once ack() has been called for it and for every
+        # batch before it
+        pass
+
+    def flush(self):
+        # True once everything published so far has been delivered
+        return True
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {}
@@ -1,27 +1,55 @@
-from common.queue.backend import QueueBackend
-from confluent_kafka import Producer, Consumer
+from common.queue.backend import QueueBackend, PendingBatches, no_ack
+from confluent_kafka import Producer, Consumer, KafkaException, TopicPartition
+from common.metrics.metrics import gauge
+import threading
+import json
 import uuid
 import time
 
+
+LAG = gauge("queue_consumer_lag", "Messages not yet consumed by this group", ("channel", "group"))
+
 class KafkaBackend(QueueBackend):
     def __init__(self, config):
         super().__init__(config)
+        #-jc Configuration hands over a bare "host:port" string
+        if isinstance(config, str):
+            config = {"connection": config}
         self.group_id = config["group_id"] if "group_id" in config else f"abyrvalg-{str(uuid.uuid4())}"
         self.brokers = config["connection"] if "connection" in config else "kafka:29092"
+        self.producer_conf = {
+            'bootstrap.servers': self.brokers,
+            'linger.ms': int(config["linger_ms"]) if "linger_ms" in config else 5,
+            'batch.size': int(config["batch_size"]) if "batch_size" in config else 65536,
+            'compression.type': config["compression"] if "compression" in config else "lz4",
+        }
+        #-jc cooperative-sticky: a rebalance only moves the partitions that change owner
+        self.assignment_strategy = config["assignment_strategy"] if "assignment_strategy" in config else "cooperative-sticky"
+        #-jc librdkafka reports consumer lag on this interval (see _on_stats)
+        self.stats_interval_ms = int(config["stats_interval_ms"]) if "stats_interval_ms" in config else 15000
+        self.flush_timeout = float(config["flush_timeout"]) if "flush_timeout" in config else 10.0
+        self.producer = None
+        self.producer_lock = threading.Lock()
+        self.poller = None
+        self.pending = None
+        self.closed = threading.Event()
+        self.delivered = 0
+        self.failed = 0
+        self.flushed_failures = 0
         self.LOGGER.info("KafkaBackend init: brokers=%r group_id=%r", self.brokers, self.group_id)
 
     def publish(self, channel, event):
         super().publish(channel, event)
-        conf = {'bootstrap.servers': self.brokers}
-        self.LOGGER.info(f"Sending {event} to kafka topic {channel} of cluster {conf}")
-        # #-jc TEMP DEBUG: inspect payload type before Kafka
-        self.LOGGER.info("Kafka publish: topic=%r type=%s bytes=%s",
-                 channel, type(event), (len(event) if hasattr(event, "__len__") else None))
-
-        #-jc TEMP DEBUG END
-        producer = Producer(conf)
-        producer.produce(channel, value=event)
-        producer.flush()
+        producer = self._get_producer()
+        self.LOGGER.debug("Kafka publish: topic=%r bytes=%s", channel, len(event))
+        try:
+            producer.produce(channel, value=event, on_delivery=self._delivery_report)
+        except BufferError:
+            #-jc local queue full: let librdkafka drain, then retry once
+            self.LOGGER.warning("Kafka producer queue full, waiting for deliveries")
+            producer.poll(1.0)
+            producer.produce(channel, value=event, on_delivery=self._delivery_report)
+        producer.poll(0)
 
     def subscribe(self, channel):
         super().subscribe(channel)
@@ -29,9 +57,157 @@ class KafkaBackend(QueueBackend):
                 'group.id': self.group_id,
                 'auto.offset.reset': 'earliest'}
         self.LOGGER.info(f"Starting kafka consumer on {channel} with config {conf}")
-        consumer = Consumer(conf)
+        consumer = Consumer(dict(conf, **self._stats_conf()))
         consumer.subscribe([channel])
         while True:
             msg = consumer.poll(timeout=1.0)
             if msg is None: continue
-            yield str(msg.value().decode("utf-8"))
+            yield msg.value()
+
+    def subscribe_batches(self, channel, max_messages, timeout, manual_commit=False):
+        super().subscribe_batches(channel, max_messages, timeout, manual_commit)
+        conf = {'bootstrap.servers': self.brokers,
+                'group.id': self.group_id,
+                'auto.offset.reset': 'earliest',
+                'enable.auto.commit': False,
+                'partition.assignment.strategy': self.assignment_strategy}
+        self.LOGGER.info(f"Starting kafka batch consumer on {channel} with config {conf}")
+        consumer = Consumer(dict(conf, **self._stats_conf()))
+        consumer.subscribe([channel], on_assign=self._on_assign, on_revoke=self._on_revoke, on_lost=self._on_lost)
+        pending = self.pending = PendingBatches() if manual_commit else None
+        try:
+            while True:
+                #-jc commits stay on this thread, whichever thread acknowledged the batch
+                if pending is not None:
+                    self._commit(consumer, pending.completed())
+                messages = consumer.consume(num_messages=max_messages, timeout=timeout)
+                batch = []
+                offsets = dict()
+                for msg in messages:
+                    if msg.error():
+                        self.LOGGER.error("Kafka consume error on %r: %s", channel, msg.error())
+                        continue
+                    #-jc raw bytes: Event.load picks the decoder from the payload
+                    batch.append(msg.value())
+                    offsets[(msg.topic(), msg.partition())] = msg.offset() + 1
+                if pending is not None:
+                    yield batch, pending.add(offsets) if offsets else no_ack
+                else:
+                    yield batch
+                    #-jc the caller has handled the batch once it asks for the next one
+                    if messages:
+                        self._commit(consumer)
+        finally:
+            if pending is not None:
+                self._commit(consumer, pending.completed())
+            #-jc leaving the group explicitly hands our partitions over straight away
+            consumer.close()
+
+    def _commit(self, consumer, offsets=None):
+        # everything consumed so far, or just the given {(topic, partition): offset}
+        if offsets is not None and not offsets:
+            return
+        try:
+            if offsets is None:
+                consumer.commit(asynchronous=False)
+            else:
+                consumer.commit(
+                    offsets=[TopicPartition(topic, partition, offset) for (topic, partition), offset in offsets.items()],
+                    asynchronous=False,
+                )
+        except KafkaException as e:
+            #-jc partition moved mid-batch: the new owner re-reads it (at-least-once)
+            self.LOGGER.warning("Kafka commit failed after rebalance: %s", e)
+
+    def _stats_conf(self):
+        return {'statistics.interval.ms': self.stats_interval_ms, 'stats_cb': self._on_stats}
+
+    def _on_stats(self, stats_json):
+        try:
+            stats = json.loads(stats_json)
+            for topic, topic_stats in stats.get("topics", {}).items():
+                lags = [
+                    partition["consumer_lag"] for partition in topic_stats.get("partitions", {}).values()
+                    if partition.get("consumer_lag", -1) >= 0
+                ]
+                LAG.set(sum(lags), channel=topic, group=self.group_id)
+        except Exception:
+            self.LOGGER.exception("Kafka statistics could not be parsed")
+
+    def _on_assign(self, consumer, partitions):
+        self.LOGGER.info(
+            "Kafka group %r assigned %s", self.group_id, [f"{p.topic}[{p.partition}]" for p in partitions]
+        )
+
+    def _on_revoke(self, consumer, partitions):
+        # Runs from inside consume(). Without manual commit every batch handed
+        # out has been committed by then. With it, batches still being handled
+        # (queued in categorize's prefetch, say) have not: what has been
+        # acknowledged is committed now, the rest is re-read by the new owner.
+        self.LOGGER.info(
+            "Kafka group %r revoked %s", self.group_id, [f"{p.topic}[{p.partition}]" for p in partitions]
+        )
+        if self.pending is not None:
+            self._commit(consumer, self.pending.completed())
+            self.pending.forget([(p.topic, p.partition) for p in partitions])
+
+    def _on_lost(self, consumer, partitions):
+        #-jc too late to commit anything for these
+        self.LOGGER.warning(
+            "Kafka group %r lost %s", self.group_id, [f"{p.topic}[{p.partition}]" for p in partitions]
+        )
+        if self.pending is not None:
+            self.pending.forget([(p.topic, p.partition) for p in partitions])
+
+    def flush(self):
+        # produce() only buffers; False if anything is still undelivered
+        # after flush_timeout or failed since the last flush
+        with self.producer_lock:
+            if self.producer is None:
+                return True
+            remaining = self.producer.flush(self.flush_timeout)
+        failed, self.flushed_failures = self.failed - self.flushed_failures, self.failed
+        if remaining:
+            self.LOGGER.error("Kafka flush left %d undelivered messages", remaining)
+        return remaining == 0 and failed == 0
+
+    def close(self):
+        self.closed.set()
+        with self.producer_lock:
+            if self.producer is None:
+                return
+            remaining = self.producer.flush(self.flush_timeout)
+            if remaining:
+                self.LOGGER.error("Kafka producer closed with %d undelivered messages", remaining)
+            self.producer = None
+
+    def stats(self):
+        return {"delivered": self.delivered, "failed": self.failed}
+
+    def _get_producer(self):
+        if self.producer is not None:
+            return self.producer
+        with self.producer_lock:
+            if self.producer is None:
+                self.LOGGER.info(f"Starting kafka producer with config {self.producer_conf}")
+                self.producer = Producer(self.producer_conf)
+                self.closed.clear()
+                self.poller = threading.Thread(
+                    target=self._poll_deliveries, name="kafka_delivery", daemon=True
+                )
+                self.poller.start()
+            return self.producer
+
+    def _poll_deliveries(self):
+        while not self.closed.is_set():
+            producer = self.producer
+            if producer is None:
+                break
+            producer.poll(0.1)
+
+    def _delivery_report(self, err, msg):
+        if err is not None:
+            self.failed += 1
+            self.LOGGER.error("Kafka delivery failed: topic=%r error=%s", msg.topic(), err)
+        else:
+            self.delivered += 1
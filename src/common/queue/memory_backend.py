@@ -0,0 +1,260 @@
+from common.queue.backend import QueueBackend, PendingBatches, no_ack
+from common.metrics.metrics import gauge
+from multiprocessing.managers import BaseManager
+import argparse
+import itertools
+import threading
+import time
+import uuid
+
+
+LAG = gauge("queue_consumer_lag", "Messages not yet consumed by this group", ("channel", "group"))
+LAG_INTERVAL = 5.0
+
+
+class Broker(object):
+    # Kafka-like log kept in memory, for tests, benchmarks and single-host
+    # runs: topics split into partitions, consumer groups sharing the
+    # partitions between their members, committed offsets per group and a
+    # retention bound per partition. Offsets are absolute, like Kafka's.
+    def __init__(self, partitions=1, retention=100000):
+        self.partitions = int(partitions)
+        self.retention = int(retention)
+        #-jc dropping from the front of a list is O(retention): trim a chunk at a time
+        self.trim_chunk = max(1, self.retention // 10)
+        self.topics = dict()     # topic -> [[base offset, messages], ...]
+        self.groups = dict()     # (group, topic) -> {"members": [...], "committed": {partition: offset}}
+        self.positions = dict()  # member -> {partition: next offset to fetch}
+        self.round_robin = itertools.count()
+        self.condition = threading.Condition()
+
+    def publish(self, topic, event):
+        with self.condition:
+            partitions = self._topic(topic)
+            partition = partitions[next(self.round_robin) % len(partitions)]
+            partition[1].append(event)
+            if len(partition[1]) >= self.retention + self.trim_chunk:
+                dropped = len(partition[1]) - self.retention
+                del partition[1][:dropped]
+                partition[0] += dropped
+            self.condition.notify_all()
+
+    def join(self, group, topic):
+        member = f"{group}-{uuid.uuid4()}"
+        with self.condition:
+            self._topic(topic)
+            self._group(group, topic)["members"].append(member)
+            self.positions[member] = dict()
+            self.condition.notify_all()
+        return member
+
+    def leave(self, group, topic, member):
+        with self.condition:
+            members = self._group(group, topic)["members"]
+            if member in members:
+                members.remove(member)
+            self.positions.pop(member, None)
+            self.condition.notify_all()
+
+    def fetch(self, group, topic, member, max_messages, timeout, offset_reset="earliest", min_messages=None):
+        # like consume(): waits for a full batch (or min_messages), or returns
+        # what arrived by the timeout
+        deadline = time.monotonic() + timeout
+        min_messages = max_messages if min_messages is None else min_messages
+        with self.condition:
+            while True:
+                positions = self._assign(group, topic, member, offset_reset)
+                if self._available(topic, positions) >= min_messages:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            batch = []
+            for partition in sorted(positions):
+                base, log = self.topics[topic][partition]
+                start = max(positions[partition], base)
+                events = log[start - base:start - base + max_messages - len(batch)]
+                positions[partition] = start + len(events)
+                batch.extend(events)
+            return batch
+
+    def position(self, member):
+        with self.condition:
+            return dict(self.positions.get(member, {}))
+
+    def commit(self, group, topic, member, offsets=None):
+        # the member's current positions, or the given {partition: offset}
+        with self.condition:
+            group_state = self._group(group, topic)
+            assigned = self._assigned(group_state, topic, member)
+            offsets = self.positions.get(member, {}) if offsets is None else offsets
+            for partition, offset in offsets.items():
+                #-jc as in Kafka, a partition that moved to another member cannot be committed
+                if partition in assigned:
+                    group_state["committed"][partition] = offset
+
+    def describe(self):
+        with self.condition:
+            topics = dict()
+            for topic, partitions in self.topics.items():
+                topics[topic] = {"end_offsets": [base + len(log) for base, log in partitions], "groups": {}}
+            for (group, topic), group_state in self.groups.items():
+                topics[topic]["groups"][group] = {
+                    "members": len(group_state["members"]),
+                    "lag": sum(
+                        base + len(log) - max(group_state["committed"].get(partition, base), base)
+                        for partition, (base, log) in enumerate(self.topics[topic])
+                    ),
+                }
+            return topics
+
+    def _topic(self, topic):
+        return self.topics.setdefault(topic, [[0, []] for _ in range(self.partitions)])
+
+    def _group(self, group, topic):
+        return self.groups.setdefault((group, topic), {"members": [], "committed": dict()})
+
+    def _assigned(self, group_state, topic, member):
+        members = group_state["members"]
+        if member not in members:
+            return []
+        idx = members.index(member)
+        return [partition for partition in range(len(self._topic(topic))) if partition % len(members) == idx]
+
+    def _assign(self, group, topic, member, offset_reset):
+        # re-evaluated on every fetch, so joins and leaves rebalance straight away;
+        # newly assigned partitions resume from the group's committed offset
+        group_state = self._group(group, topic)
+        positions = self.positions[member]
+        assigned = self._assigned(group_state, topic, member)
+        for partition in list(positions):
+            if partition not in assigned:
+                del positions[partition]
+        for partition in assigned:
+            if partition not in positions:
+                base, log = self.topics[topic][partition]
+                reset = base if offset_reset == "earliest" else base + len(log)
+                positions[partition] = group_state["committed"].get(partition, reset)
+        return positions
+
+    def _available(self, topic, positions):
+        available = 0
+        for partition, offset in positions.items():
+            base, log = self.topics[topic][partition]
+            available += base + len(log) - max(offset, base)
+        return available
+
+
+#-jc shared by every "memory" backend in the process
+BROKER = Broker()
+
+
+def reset(partitions=1, retention=100000):
+    global BROKER
+    BROKER = Broker(partitions, retention)
+
+
+class MemoryBackend(QueueBackend):
+    def __init__(self, config, broker=None):
+        super().__init__(config)
+        if isinstance(config, str):
+            config = {"connection": config}
+        self.broker = broker if broker is not None else BROKER
+        self.group_id = config["group_id"] if "group_id" in config else f"memory-{str(uuid.uuid4())}"
+        self.offset_reset = config["offset_reset"] if "offset_reset" in config else "earliest"
+        self.published = 0
+        self.lag_checked = 0.0
+
+    def publish(self, channel, event):
+        super().publish(channel, event)
+        self.broker.publish(channel, event)
+        self.published += 1
+
+    def subscribe(self, channel):
+        super().subscribe(channel)
+        #-jc like poll(): hand over whatever is there as soon as there is anything
+        for batch in self._consume(channel, 100, 1.0, 1):
+            for event in batch:
+                yield event
+
+    def subscribe_batches(self, channel, max_messages, timeout, manual_commit=False):
+        super().subscribe_batches(channel, max_messages, timeout, manual_commit)
+        return self._consume(channel, max_messages, timeout, None, manual_commit)
+
+    def _consume(self, channel, max_messages, timeout, min_messages, manual_commit=False):
+        member = self.broker.join(self.group_id, channel)
+        self.LOGGER.info("Memory queue member %s joined %r on %r", member, self.group_id, channel)
+        pending = PendingBatches() if manual_commit else None
+        try:
+            while True:
+                if pending is not None:
+                    self._commit(channel, member, pending.completed())
+                batch = self.broker.fetch(
+                    self.group_id, channel, member, max_messages, timeout, self.offset_reset, min_messages
+                )
+                if pending is not None:
+                    yield batch, pending.add(self.broker.position(member)) if batch else no_ack
+                else:
+                    yield batch
+                    #-jc same contract as Kafka: handled once the caller asks for the next batch
+                    if batch:
+                        self.broker.commit(self.group_id, channel, member)
+                if time.monotonic() - self.lag_checked > LAG_INTERVAL:
+                    self.lag_checked = time.monotonic()
+                    group = self.broker.describe()[channel]["groups"].get(self.group_id, {})
+                    LAG.set(group.get("lag", 0), channel=channel, group=self.group_id)
+        finally:
+            if pending is not None:
+                self._commit(channel, member, pending.completed())
+            self.broker.leave(self.group_id, channel, member)
+
+    def _commit(self, channel, member, offsets):
+        if offsets:
+            self.broker.commit(self.group_id, channel, member, offsets)
+
+    def stats(self):
+        return {"published": self.published}
+
+
+class BrokerClient(BaseManager):
+    pass
+
+
+class BrokerServer(BaseManager):
+    pass
+
+
+BrokerClient.register("broker")
+
+
+class MultiprocessingBackend(MemoryBackend):
+    # Same semantics as "memory", but the Broker lives in a separate server
+    # process (see broker_server()), so services on one host can share it.
+    def __init__(self, config):
+        if isinstance(config, str):
+            config = {"connection": config}
+        host, port = config["connection"].rsplit(":", 1)
+        authkey = config["authkey"] if "authkey" in config else "weather-guess"
+        manager = BrokerClient(address=(host, int(port)), authkey=authkey.encode())
+        manager.connect()
+        super().__init__(config, broker=manager.broker())
+
+
+def broker_server(address, authkey="weather-guess", partitions=1, retention=100000):
+    broker = Broker(partitions, retention)
+    BrokerServer.register("broker", callable=lambda: broker)
+    return BrokerServer(address=address, authkey=authkey.encode()).get_server()
+
+
+if __name__ == "__main__":
+    #-jc python -m common.queue.memory_backend 127.0.0.1:50000 --partitions 4
+    parser = argparse.ArgumentParser(description="Stand-alone in-memory queue broker")
+    parser.add_argument("address")
+    parser.add_argument("--partitions", type=int, default=1)
+    parser.add_argument("--retention", type=int, default=100000)
+    parser.add_argument("--authkey", default="weather-guess")
+    args = parser.parse_args()
+    host, port = args.address.rsplit(":", 1)
+    broker_server((host, int(port)), args.authkey, args.partitions, args.retention).serve_forever()
@@ -1,5 +1,14 @@
 from common.event.event import Event
+from common.event.codec import codec_for
+from common.metrics.metrics import counter, histogram
 import logging
+import time
+
+
+PUBLISHED = counter("queue_published_total", "Events published", ("channel",))
+PUBLISH_LATENCY = histogram("queue_publish_seconds", "Time to serialise and hand an event to the backend", ("channel",))
+CONSUMED = counter("queue_consumed_total", "Events consumed", ("channel",))
+REJECTED = counter("queue_rejected_total", "Consumed payloads that failed to load", ("channel",))
 
 
 class Filter(object):
@@ -37,17 +46,49 @@ class Filter(object):
         return True if filter_result is True else False
 
 
+class Batch(list):
+    # what scan_batches() yields; with manual_commit its offsets are only
+    # committed once ack() has been called
+    def __init__(self, events=(), ack=None):
+        super().__init__(events)
+        self._ack = ack
+
+    def ack(self):
+        if self._ack is not None:
+            self._ack()
+
+
 class Queue(object):
     def __init__(self, backend, config):
         if backend == "kafka":
             from common.queue.kafka_backend import KafkaBackend
             self.queue_backend = KafkaBackend(config)
+        elif backend == "memory":
+            from common.queue.memory_backend import MemoryBackend
+            self.queue_backend = MemoryBackend(config)
+        elif backend == "multiprocessing":
+            from common.queue.memory_backend import MultiprocessingBackend
+            self.queue_backend = MultiprocessingBackend(config)
         else:
             raise Exception("Queue backend not implemented")
         self.LOGGER = logging
+        #-jc wire encoding for published events; consumers read any of them
+        self.codec = codec_for(config["codec"]) if isinstance(config, dict) and "codec" in config else "json"
 
     def publish_event(self, channel, event):
-        self.queue_backend.publish(channel, event.dump())
+        started = time.monotonic()
+        self.queue_backend.publish(channel, event.dump(self.codec))
+        PUBLISH_LATENCY.observe(time.monotonic() - started, channel=channel)
+        PUBLISHED.inc(channel=channel)
+
+    def flush(self):
+        return self.queue_backend.flush()
+
+    def close(self):
+        self.queue_backend.close()
+
+    def stats(self):
+        return self.queue_backend.stats()
 
     def wait_for_event(self, channel, dto, filter):
         for event in self.queue_backend.subscribe(channel):
@@ -64,11 +105,34 @@ class Queue(object):
             try:
                 dto.load(event)
             except:
+                REJECTED.inc(channel=channel)
                 continue
 
+            CONSUMED.inc(channel=channel)
             if filter is None:
                 yield dto
             elif filter.validate(event):
                 yield dto
             else:
                 continue
+
+    def scan_batches(self, channel, dto_cls, max_messages=100, timeout=1.0, manual_commit=False):
+        # Yields a Batch of fresh dto_cls instances at least every `timeout`
+        # seconds; the batch is empty when nothing arrived, so callers get a
+        # chance to do periodic work. Offsets are committed once the caller
+        # comes back for the next batch, or with manual_commit once it calls
+        # batch.ack(), e.g. after publishing the results (at-least-once).
+        self.LOGGER.info(f"Starting batch listening on channel {channel}")
+        for item in self.queue_backend.subscribe_batches(channel, max_messages, timeout, manual_commit):
+            events, ack = item if manual_commit else (item, None)
+            batch = Batch(ack=ack)
+            for event in events:
+                try:
+                    dto = dto_cls.from_payload(event)
+                except Exception:
+                    REJECTED.inc(channel=channel)
+                    continue
+                batch.append(dto)
+            if batch:
+                CONSUMED.inc(len(batch), channel=channel)
+            yield batch
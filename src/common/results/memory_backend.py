@@ -0,0 +1,25 @@
+from common.cache.memory_backend import MemoryCache
+
+
+class MemoryResultStore(MemoryCache):
+    # Values are wrapped as (image_class,) so a pending request, (None,),
+    # can be told apart from an unknown one, None.
+    def __init__(self, config):
+        super().__init__(config)
+        self.pending = 0
+
+    def stats(self):
+        stats = super().stats()
+        stats["pending"] = self.pending
+        return stats
+
+    def _store(self, key, value):
+        if key in self.entries and self.entries[key][1][0] is None:
+            self.pending -= 1
+        if value[0] is None:
+            self.pending += 1
+        super()._store(key, value)
+
+    def _evicted(self, key, value):
+        if value[0] is None:
+            self.pending -= 1
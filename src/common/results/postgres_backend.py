@@ -0,0 +1,27 @@
+from common.cache.postgres_backend import PostgresCache
+import psycopg2.sql
+
+
+class PostgresResultStore(PostgresCache):
+    # Shared, read-only tier: any dispatcher replica can answer for a request
+    # another replica accepted once reporting has persisted it.
+    def __init__(self, config):
+        super().__init__(config)
+        self.response_query = psycopg2.sql.SQL(
+            "SELECT image_class FROM {responses} WHERE correlation_id = %s "
+            "ORDER BY _tz_created DESC LIMIT 1"
+        ).format(responses=psycopg2.sql.Identifier(self.response_table))
+        self.request_query = psycopg2.sql.SQL(
+            "SELECT 1 FROM {requests} WHERE _id = %s"
+        ).format(requests=psycopg2.sql.Identifier(self.request_table))
+
+    def get(self, key):
+        row = self._fetchone(self.response_query, (key,))
+        if row is not None:
+            self.hits += 1
+            return (row[0],)
+        if self._fetchone(self.request_query, (key,)) is not None:
+            self.hits += 1
+            return (None,)
+        self.misses += 1
+        return None
@@ -0,0 +1,72 @@
+import threading
+import logging
+
+
+class ResultStore(object):
+    def __init__(self, backend, config):
+        self.LOGGER = logging
+        self.tiers = []
+        self.waiters = dict()
+        self.waiters_lock = threading.Lock()
+        for name in [name.strip() for name in backend.split(",") if name.strip()]:
+            if name == "memory":
+                from common.results.memory_backend import MemoryResultStore
+                self.tiers.append((name, MemoryResultStore(config)))
+            elif name == "postgres":
+                from common.results.postgres_backend import PostgresResultStore
+                self.tiers.append((name, PostgresResultStore(config)))
+            else:
+                raise Exception("Result store backend not implemented")
+        self.LOGGER.info(f"Selected result store tiers: {[name for name, _ in self.tiers]}")
+
+    def mark_pending(self, request_id):
+        self._put(request_id, (None,))
+
+    def set_result(self, request_id, image_class):
+        self._put(request_id, (image_class,))
+        with self.waiters_lock:
+            waiter = self.waiters.pop(request_id, None)
+        if waiter is not None:
+            waiter[0].set()
+
+    def lookup(self, request_id):
+        # (found, image_class); image_class is None while recognition is in progress
+        for idx, (_, tier) in enumerate(self.tiers):
+            value = tier.get(request_id)
+            if value is not None:
+                if value[0] is not None:
+                    for _, upper in self.tiers[:idx]:
+                        upper.put(request_id, value)
+                return True, value[0]
+        return False, None
+
+    def wait_for_result(self, request_id, timeout):
+        # lookup(), but blocks up to `timeout` seconds while the request is pending
+        found, image_class = self.lookup(request_id)
+        if not found or image_class is not None or timeout <= 0:
+            return found, image_class
+
+        with self.waiters_lock:
+            waiter = self.waiters.setdefault(request_id, [threading.Event(), 0])
+            waiter[1] += 1
+        try:
+            #-jc re-check: the result may have landed before we registered
+            found, image_class = self.lookup(request_id)
+            if found and image_class is None:
+                waiter[0].wait(timeout)
+                found, image_class = self.lookup(request_id)
+        finally:
+            with self.waiters_lock:
+                waiter[1] -= 1
+                if waiter[1] == 0 and self.waiters.get(request_id) is waiter:
+                    del self.waiters[request_id]
+        return found, image_class
+
+    def stats(self):
+        stats = {name: tier.stats() for name, tier in self.tiers}
+        stats["waiting"] = len(self.waiters)
+        return stats
+
+    def _put(self, request_id, value):
+        for _, tier in self.tiers:
+            tier.put(request_id, value)
@@ -1,5 +1,13 @@
 import logging
 import uuid
+import re
+import io
+
+
+#-jc names this code writes: uuid objects, sha256 (content-addressed) objects and in-flight .partial- files
+OBJECT_NAME = re.compile(
+    r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.\w+|[0-9a-f]{64}\.\w+|\.partial-.*)$"
+)
 
 
 class StorageBackend(object):
@@ -19,6 +27,32 @@ class StorageBackend(object):
             dst = self._generate_tempname()
         return src, dst
 
+    def open_object(self, src):
+        pass
+
+    def put_stream(self, stream, dst="", extension="jpeg", digest=None):
+        if dst == "":
+            dst = self._generate_tempname(extension)
+        return dst, 0
+
+    def get_bytes(self, src):
+        with self.open_object(src) as buffer:
+            return bytes(buffer.read())
+
+    def put_bytes(self, data, dst="", extension="jpeg", digest=None):
+        return self.put_stream(io.BytesIO(data), dst, extension, digest)
+
+    def list_objects(self):
+        # yields (path, size, modified epoch seconds)
+        return iter(())
+
+    def delete_objects(self, paths):
+        # returns the paths actually removed
+        return []
+
+    def release_objects(self, paths):
+        # drop one reference per path; without reference counts that is a delete
+        return self.delete_objects(list(dict.fromkeys(paths)))
 
     @staticmethod
     def _generate_tempname(extension="jpeg"):
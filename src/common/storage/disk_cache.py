@@ -0,0 +1,192 @@
+from common.metrics.metrics import counter, gauge
+from contextlib import contextmanager
+import tempfile
+import hashlib
+import logging
+import fcntl
+import time
+import mmap
+import io
+import os
+
+
+REQUESTS = counter("storage_cache_requests_total", "Read-through cache lookups, by outcome", ("outcome",))
+CACHED_BYTES = gauge("storage_cache_bytes", "Bytes held in the read-through cache")
+
+STATE_FILE = ".lru"
+PARTIAL_PREFIX = ".partial-"
+
+
+class DiskLRU(object):
+    # A directory of files bounded by max_bytes, shared by every process
+    # (forked workers, replicas on one volume) pointed at it. The running
+    # total sits in a small state file updated under flock, so the bound
+    # holds however many of them fill it. Recency is the file's mtime,
+    # bumped on every hit because atime is usually relatime or off. Going
+    # over max_bytes re-stats the directory and drops the oldest files down
+    # to LOW_WATER of it, so the walk is not repeated on every fill.
+    LOW_WATER = 0.9
+
+    def __init__(self, cache_dir, max_bytes, requests, cached_bytes, suffix=""):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.requests = requests
+        self.cached_bytes = cached_bytes
+        self.suffix = suffix
+        self.LOGGER = logging
+        os.makedirs(cache_dir, exist_ok=True)
+        #-jc a restart (or a crash mid-update) is corrected from the disk
+        with self._state() as state:
+            state[:] = self._rescan(self.max_bytes)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}{self.suffix}")
+
+    def touch(self, path):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def store(self, path, write):
+        # write(file) fills a partial file that then replaces `path`;
+        # False when the disk would not take it
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, partial = tempfile.mkstemp(dir=os.path.dirname(path), prefix=PARTIAL_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as target:
+                write(target)
+            size = os.path.getsize(partial)
+            previous = self._size(path)
+            os.replace(partial, path)
+        except OSError:
+            self.LOGGER.exception("Caching %s failed", path)
+            if os.path.exists(partial):
+                os.unlink(partial)
+            return False
+        self._add(size - previous, 0 if previous else 1)
+        return True
+
+    def forget(self, path):
+        size = self._size(path)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return
+        self._add(-size, -1)
+
+    def stats(self):
+        with self._state(fcntl.LOCK_SH) as state:
+            size, entries = state
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes}
+
+    def _add(self, size, entries):
+        with self._state() as state:
+            state[0] += size
+            state[1] += entries
+            if state[0] > self.max_bytes:
+                state[:] = self._rescan(int(self.max_bytes * self.LOW_WATER))
+        self.cached_bytes.set(state[0])
+
+    @contextmanager
+    def _state(self, mode=fcntl.LOCK_EX):
+        # [bytes, entries] for the whole directory, written back on exit
+        with open(os.path.join(self.cache_dir, STATE_FILE), "a+") as state_file:
+            fcntl.flock(state_file, mode)
+            state_file.seek(0)
+            fields = state_file.read().split()
+            state = [int(field) for field in fields] if len(fields) == 2 else [0, 0]
+            yield state
+            if mode == fcntl.LOCK_EX:
+                state_file.seek(0)
+                state_file.truncate()
+                state_file.write(f"{state[0]} {state[1]}")
+
+    def _rescan(self, limit):
+        # the directory's real size, oldest files dropped until it is within limit
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if name == STATE_FILE:
+                    continue
+                try:
+                    stat = os.stat(path)
+                    if name.startswith(PARTIAL_PREFIX):
+                        #-jc left by a crash; a fresh one may be another worker mid-write
+                        if time.time() - stat.st_mtime > 60:
+                            os.unlink(path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime_ns, path, stat.st_size))
+        found.sort()
+        size = sum(entry[2] for entry in found)
+        entries = len(found)
+        for _, path, file_size in found:
+            if size <= limit:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+            entries -= 1
+            self.requests.inc(outcome="evicted")
+        self.cached_bytes.set(size)
+        return [size, entries]
+
+    @staticmethod
+    def _size(path):
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+
+
+class ReadThroughCache(object):
+    # Wraps a (remote) storage backend: reads are served from a local
+    # directory, filled on a miss, least recently used files evicted past
+    # max_bytes (see DiskLRU). Objects are never rewritten under the same
+    # key, so entries need no invalidation.
+    def __init__(self, backend, cache_dir, max_bytes):
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.LOGGER = logging
+        self.lru = DiskLRU(cache_dir, max_bytes, REQUESTS, CACHED_BYTES)
+
+    def __getattr__(self, name):
+        #-jc writes and everything else go straight to the backend
+        return getattr(self.backend, name)
+
+    def open_object(self, src):
+        path = self._path(src)
+        try:
+            source = open(path, "rb")
+        except FileNotFoundError:
+            return io.BytesIO(self._fill(src, path))
+        with source:
+            self.lru.touch(path)
+            REQUESTS.inc(outcome="hit")
+            if os.fstat(source.fileno()).st_size == 0:
+                return io.BytesIO(b"")
+            return mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get_bytes(self, src):
+        with self.open_object(src) as buffer:
+            return bytes(buffer.read())
+
+    def stats(self):
+        return self.lru.stats()
+
+    def _fill(self, src, path):
+        REQUESTS.inc(outcome="miss")
+        data = self.backend.get_bytes(src)
+        if len(data) <= self.max_bytes:
+            #-jc a full or read-only cache disk must not fail the read
+            self.lru.store(path, lambda target: target.write(data))
+        return data
+
+    def _path(self, src):
+        return self.lru.path(hashlib.sha256(src.encode()).hexdigest())
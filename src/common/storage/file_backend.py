@@ -1,12 +1,36 @@
-from common.storage.backend import StorageBackend
+from common.storage.backend import StorageBackend, OBJECT_NAME
+from common.metrics.metrics import counter
+from contextlib import contextmanager
 from shutil import copyfile
+import tempfile
+import hashlib
+import fcntl
+import mmap
+import io
 import os
+import re
+
+CHUNK_SIZE = 1024 * 1024
+FANOUT = re.compile(r"^[0-9a-f]{2}$")
+DEDUPLICATED = counter("storage_deduplicated_total", "Uploads that matched an object already stored")
 
 
 class LocalFilesystem(StorageBackend):
-    def __init__(self, *args, **kwargs):
+    # layout "uuid": <remote_prefix>/<uuid>.<ext>, one object per upload.
+    # layout "content": <remote_prefix>/<shard_prefix>/ab/cd/<sha256>.<ext>,
+    # one object per distinct content. Each content object has a
+    # <object>.refs sidecar counting the uploads that point at it, changed
+    # under flock so dispatcher and reporting replicas sharing the volume
+    # agree; release_objects() deletes the object when the count reaches
+    # zero. Objects written under either layout stay readable by path.
+    def __init__(self, *args, config=None, **kwargs):
         super().__init__(*args, **kwargs)
-        self.LOGGGER.info(f"Init local filesystem with {list(*args)} {list(**kwargs)}")
+        self.LOGGGER.info(f"Init local filesystem with {list(args)} {dict(kwargs)}")
+        config = config or {}
+        self.layout = config["layout"] if config.get("layout") else "uuid"
+        self.shard_depth = int(config["shard_depth"]) if "shard_depth" in config else 2
+        if self.layout not in ("uuid", "content"):
+            raise Exception(f"Unknown storage layout {self.layout}")
 
         if self.remote_prefix == "":
         #-jc TODO: migrate to persistent volume path:-
@@ -18,11 +42,189 @@ class LocalFilesystem(StorageBackend):
     def put_object(self, src, dst=""):
         if dst == "":
             dst = os.path.join(self.remote_prefix, self._generate_tempname())
-        copyfile(src, dst)
+        try:
+            #-jc same filesystem: a hard link costs no copy at all
+            os.link(src, dst)
+        except OSError:
+            copyfile(src, dst)
         return src, dst
 
+    def put_stream(self, stream, dst="", extension="jpeg", digest=None):
+        # Single pass: written next to the final key and renamed into place,
+        # so readers never see a partial object.
+        if dst == "" and self.layout == "content":
+            return self._put_content(stream, extension, digest)
+        if dst == "":
+            dst = os.path.join(self.remote_prefix, self._generate_tempname(extension))
+        fd, partial = tempfile.mkstemp(dir=os.path.dirname(dst), prefix=".partial-")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as target:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    target.write(chunk)
+                    size += len(chunk)
+            os.replace(partial, dst)
+        except BaseException:
+            if os.path.exists(partial):
+                os.unlink(partial)
+            raise
+        return dst, size
+
+    def _put_content(self, stream, extension, digest):
+        if digest is not None:
+            #-jc digest known up front: a re-upload costs no write at all
+            dst = self.content_path(digest, extension)
+            size = self._reference(dst)
+            if size is not None:
+                return dst, size
+        root = os.path.join(self.remote_prefix, self.shard_prefix)
+        os.makedirs(root, exist_ok=True)
+        fd, partial = tempfile.mkstemp(dir=root, prefix=".partial-")
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as target:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+                    target.write(chunk)
+                    size += len(chunk)
+            dst = self.content_path(hasher.hexdigest(), extension)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            with self._refs(dst) as refs:
+                if os.path.exists(dst):
+                    _write_count(refs, max(_read_count(refs), 1) + 1)
+                    os.utime(dst)
+                    os.unlink(partial)
+                    DEDUPLICATED.inc()
+                else:
+                    os.replace(partial, dst)
+                    _write_count(refs, 1)
+        except BaseException:
+            if os.path.exists(partial):
+                os.unlink(partial)
+            raise
+        return dst, size
+
+    def _reference(self, dst):
+        # one more reference to an existing object; None when it is not there
+        if not os.path.exists(dst):
+            return None
+        with self._refs(dst) as refs:
+            try:
+                size = os.stat(dst).st_size
+            except FileNotFoundError:
+                #-jc released while we waited for the lock
+                return None
+            _write_count(refs, max(_read_count(refs), 1) + 1)
+            #-jc the retention sweep goes by mtime; keep shared objects young
+            os.utime(dst)
+        DEDUPLICATED.inc()
+        return size
+
+    def content_path(self, digest, extension="jpeg"):
+        fanout = [digest[2 * level:2 * level + 2] for level in range(self.shard_depth)]
+        return os.path.join(self.remote_prefix, self.shard_prefix, *fanout, f"{digest}.{extension}")
+
+    @contextmanager
+    def _refs(self, path):
+        # Locked sidecar fd. A releaser unlinks the sidecar while holding the
+        # lock, so after locking check we still hold the live file.
+        name = f"{path}.refs"
+        while True:
+            fd = os.open(name, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_ino == os.stat(name).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+        try:
+            yield fd
+        finally:
+            os.close(fd)
+
+    def release_objects(self, paths):
+        deleted = []
+        for path in paths:
+            if not os.path.exists(f"{path}.refs"):
+                #-jc uuid objects and anything written before refcounting
+                deleted.extend(self.delete_objects([path]))
+                continue
+            with self._refs(path) as refs:
+                count = _read_count(refs) - 1
+                if count > 0:
+                    _write_count(refs, count)
+                else:
+                    deleted.extend(self.delete_objects([path]))
+        return deleted
+
     def get_object(self, src, dst=""):
         if dst == "":
             dst = os.path.join(self.local_prefix, self._generate_tempname())
         copyfile(src, dst)
         return src, dst
+
+    def list_objects(self):
+        # Only names we generate, and only where we put them: STORAGE_DIR
+        # may be a shared directory like /tmp. uuid objects sit at the top
+        # level, content objects shard_depth fan-out levels below the
+        # content root; both are listed, as either layout reads the other.
+        content_root = os.path.join(self.remote_prefix, self.shard_prefix)
+        if os.path.normpath(content_root) == os.path.normpath(self.remote_prefix):
+            yield from self._list_dir(self.remote_prefix, self.shard_depth)
+        else:
+            yield from self._list_dir(self.remote_prefix, 0)
+            yield from self._list_dir(content_root, self.shard_depth)
+
+    def _list_dir(self, directory, depth):
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if depth > 0 and FANOUT.match(entry.name) is not None:
+                        yield from self._list_dir(entry.path, depth - 1)
+                elif OBJECT_NAME.match(entry.name) is not None:
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_mtime
+            except FileNotFoundError:
+                continue
+
+    def delete_objects(self, paths):
+        # unconditional, whatever the reference count says
+        deleted = []
+        for path in paths:
+            try:
+                os.unlink(path)
+                deleted.append(path)
+            except FileNotFoundError:
+                pass
+            try:
+                os.unlink(f"{path}.refs")
+            except FileNotFoundError:
+                pass
+        return deleted
+
+    def get_bytes(self, src):
+        with open(src, "rb") as source:
+            return source.read()
+
+    def open_object(self, src):
+        # read-only memory map: no temp copy, pages come from the page cache
+        with open(src, "rb") as source:
+            if os.fstat(source.fileno()).st_size == 0:
+                return io.BytesIO(b"")
+            return mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _read_count(fd):
+    value = os.pread(fd, 32, 0).strip()
+    return int(value) if value else 0
+
+
+def _write_count(fd, count):
+    os.ftruncate(fd, 0)
+    os.pwrite(fd, str(count).encode(), 0)
@@ -1,23 +1,130 @@
-from common.storage.backend import StorageBackend
+from common.storage.backend import StorageBackend, OBJECT_NAME
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
+import threading
+import os
+import io
+
+MB = 1024 * 1024
+CLIENTS = dict()
+CLIENTS_LOCK = threading.Lock()
+
+
+def shared_client(endpoint="", region="", max_connections=32):
+    # boto3 clients are thread-safe and expensive to build (credential
+    # lookup, endpoint resolution, a fresh connection pool), so every
+    # backend with the same settings shares one; the pool is sized for the
+    # upload/preprocess threads plus the transfer manager's own threads
+    key = (endpoint, region, max_connections)
+    with CLIENTS_LOCK:
+        if key not in CLIENTS:
+            CLIENTS[key] = boto3.session.Session().client(
+                "s3",
+                endpoint_url=endpoint or None,
+                region_name=region or None,
+                config=Config(
+                    max_pool_connections=max_connections,
+                    retries={"max_attempts": 5, "mode": "adaptive"},
+                    tcp_keepalive=True,
+                    connect_timeout=5,
+                    read_timeout=30,
+                    #-jc S3-compatible stores (MinIO, stand-ins) choke on the newer default trailers
+                    request_checksum_calculation="when_required",
+                    response_checksum_validation="when_required",
+                ),
+            )
+        return CLIENTS[key]
 
 
 class S3Backend(StorageBackend):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, config=None, **kwargs):
         super().__init__(*args, **kwargs)
-        self.s3_client = boto3.client('s3')
+        config = config or {}
+        self.s3_client = shared_client(
+            config["endpoint"] if "endpoint" in config else "",
+            config["region"] if "region" in config else "",
+            int(config["max_connections"]) if "max_connections" in config else 32,
+        )
+        #-jc single PUT/GET below the threshold, parallel ranged parts above it
+        self.transfer_config = TransferConfig(
+            multipart_threshold=int(float(config["multipart_threshold_mb"]) * MB) if "multipart_threshold_mb" in config else 8 * MB,
+            multipart_chunksize=int(float(config["multipart_chunk_mb"]) * MB) if "multipart_chunk_mb" in config else 8 * MB,
+            max_concurrency=int(config["max_concurrency"]) if "max_concurrency" in config else 8,
+            use_threads=True,
+        )
 
     def put_object(self, src, dst=""):
         src, dst = super().put_object(src, dst)
         try:
-            response = self.s3_client.upload_file(src, self.shard_prefix, dst)
-        except ClientError as e:
-            self.LOGGGER.error(e)
-            return False
+            self.s3_client.upload_file(src, self.shard_prefix, dst, Config=self.transfer_config)
+        except ClientError:
+            self.LOGGGER.exception(f"Upload of {src} to {dst} failed")
+            raise
         return src, dst
 
     def get_object(self, src, dst=""):
         src, dst = super().get_object(src, dst)
-        self.s3_client.download_file(self.shard_prefix, src, dst)
+        self.s3_client.download_file(self.shard_prefix, src, dst, Config=self.transfer_config)
         return src, dst
+
+    def open_object(self, src):
+        return io.BytesIO(self.get_bytes(src))
+
+    def get_bytes(self, src):
+        response = self.s3_client.get_object(Bucket=self.shard_prefix, Key=src)
+        return response["Body"].read()
+
+    def put_bytes(self, data, dst="", extension="jpeg", digest=None):
+        # one PutObject for data already in memory, no transfer manager threads
+        dst, _ = super().put_stream(None, dst, extension)
+        try:
+            self.s3_client.put_object(Bucket=self.shard_prefix, Key=dst, Body=data)
+        except ClientError:
+            self.LOGGGER.exception(f"Upload of {dst} failed")
+            raise
+        return dst, len(data)
+
+    def list_objects(self):
+        # only names this code writes: the orphan sweep deletes what we yield,
+        # and a shared bucket may hold other keys
+        for page in self.s3_client.get_paginator("list_objects_v2").paginate(Bucket=self.shard_prefix):
+            for item in page.get("Contents", []):
+                if OBJECT_NAME.match(os.path.basename(item["Key"])) is not None:
+                    yield item["Key"], item["Size"], item["LastModified"].timestamp()
+
+    def delete_objects(self, paths):
+        # DeleteObjects takes up to 1000 keys per request
+        deleted = []
+        paths = list(paths)
+        for start in range(0, len(paths), 1000):
+            response = self.s3_client.delete_objects(
+                Bucket=self.shard_prefix,
+                Delete={"Objects": [{"Key": path} for path in paths[start:start + 1000]], "Quiet": False},
+            )
+            for error in response.get("Errors", []):
+                self.LOGGGER.error(f"Deleting {error['Key']} failed: {error['Code']}")
+            deleted.extend(item["Key"] for item in response.get("Deleted", []))
+        return deleted
+
+    def put_stream(self, stream, dst="", extension="jpeg", digest=None):
+        dst, _ = super().put_stream(stream, dst, extension)
+        counted = CountingReader(stream)
+        try:
+            self.s3_client.upload_fileobj(counted, self.shard_prefix, dst, Config=self.transfer_config)
+        except ClientError:
+            self.LOGGGER.exception(f"Upload of {dst} failed")
+            raise
+        return dst, counted.size
+
+
+class CountingReader(object):
+    def __init__(self, stream):
+        self.stream = stream
+        self.size = 0
+
+    def read(self, *args):
+        chunk = self.stream.read(*args)
+        self.size += len(chunk)
+        return chunk
@@ -1,26 +1,75 @@
 import os
 import logging
+from common.metrics.metrics import counter, histogram
+
+
+LATENCY = histogram("storage_seconds", "Storage operation latency", ("op",))
+WRITTEN = counter("storage_written_bytes_total", "Bytes stored through put_stream/put_bytes, deduplicated uploads included")
 
 
 class Storage(object):
-    def __init__(self, backend):
+    def __init__(self, backend, config=None):
         self.LOGGER = logging
+        config = config or {}
         if backend == "s3":
-            if os.environ.get("S3_BUCKET") is None:
-                raise Exception
+            bucket = config["bucket"] if config.get("bucket") else os.environ.get("S3_BUCKET")
+            if bucket is None:
+                raise Exception("S3 storage needs a bucket")
             from common.storage.s3_backend import S3Backend
-            self.backend = S3Backend(shard_prefix=os.environ.get("S3_BUCKET"))
+            self.backend = S3Backend(shard_prefix=bucket, config=config)
         elif backend == "file":
             from common.storage.file_backend import LocalFilesystem
-            self.backend = LocalFilesystem()
+            self.backend = LocalFilesystem(config=config)
         else:
             raise Exception
+        if config.get("cache_dir"):
+            #-jc readers only (categorize): keep what we fetched on local disk
+            from common.storage.disk_cache import ReadThroughCache
+            self.backend = ReadThroughCache(self.backend, config["cache_dir"], int(float(config["cache_max_mb"]) * 1024 * 1024))
         self.LOGGER.info(f"Selected backend: {self.backend}")
 
     def get_file(self, path):
-        _, res = self.backend.get_object(path)
+        with LATENCY.time(op="get_file"):
+            _, res = self.backend.get_object(path)
         return res
 
+    def open_object(self, path):
+        # read-only, file-like and usable as a context manager
+        with LATENCY.time(op="open_object"):
+            return self.backend.open_object(path)
+
+    def get_bytes(self, path):
+        with LATENCY.time(op="get_bytes"):
+            return self.backend.get_bytes(path)
+
     def put_file(self, path):
-        _, res = self.backend.put_object(path)
+        with LATENCY.time(op="put_file"):
+            _, res = self.backend.put_object(path)
         return res
+
+    def list_objects(self):
+        return self.backend.list_objects()
+
+    def delete_objects(self, paths):
+        with LATENCY.time(op="delete_objects"):
+            return self.backend.delete_objects(paths)
+
+    def release_objects(self, paths):
+        # one reference per path (one per request row); returns what was deleted
+        with LATENCY.time(op="release_objects"):
+            return self.backend.release_objects(paths)
+
+    def put_bytes(self, data, extension="jpeg", digest=None):
+        # returns (object path, bytes written); a known sha256 digest lets a
+        # content-addressed backend skip the write for bytes it already has
+        with LATENCY.time(op="put_bytes"):
+            path, size = self.backend.put_bytes(data, extension=extension, digest=digest)
+        WRITTEN.inc(size)
+        return path, size
+
+    def put_stream(self, stream, extension="jpeg", digest=None):
+        # returns (object path, bytes written)
+        with LATENCY.time(op="put_stream"):
+            path, size = self.backend.put_stream(stream, extension=extension, digest=digest)
+        WRITTEN.inc(size)
+        return path, size
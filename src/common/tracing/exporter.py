@@ -0,0 +1,75 @@
+from collections import deque
+import atexit
+import logging
+import os
+import threading
+from common.metrics.metrics import counter
+
+
+SPANS = counter("tracing_spans_total", "Spans handed to the exporter, by outcome", ("outcome",))
+
+
+class SpanExporter(object):
+    # Spans are buffered and shipped by one background thread, so recording
+    # a span never waits on disk or network. A full buffer drops new spans
+    # (counted) rather than slowing the request down.
+    def __init__(self, service, config):
+        self.service = service
+        self.config = config
+        self.LOGGER = logging
+        self.max_queue = int(config["max_queue"]) if "max_queue" in config else 10000
+        self.batch_size = int(config["batch_size"]) if "batch_size" in config else 512
+        self.interval = float(config["interval"]) if "interval" in config else 1.0
+        self.spans = deque()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+        atexit.register(self.close)
+
+    def export(self, span):
+        with self.lock:
+            #-jc (re)start lazily: configured before a fork, the thread would not survive it
+            if self.pid != os.getpid():
+                self._start()
+            if len(self.spans) >= self.max_queue:
+                SPANS.inc(outcome="dropped")
+                return
+            self.spans.append(span)
+            if len(self.spans) >= self.batch_size:
+                self.wakeup.set()
+
+    def flush(self):
+        while True:
+            with self.lock:
+                batch = [self.spans.popleft() for _ in range(min(self.batch_size, len(self.spans)))]
+            if not batch:
+                return
+            try:
+                self._send(batch)
+                SPANS.inc(len(batch), outcome="exported")
+            except Exception:
+                self.LOGGER.exception("Exporting %d spans failed", len(batch))
+                SPANS.inc(len(batch), outcome="failed")
+
+    def close(self):
+        if self.pid == os.getpid():
+            self.pid = None
+            self.wakeup.set()
+            self.thread.join(5.0)
+        self.flush()
+
+    def _start(self):
+        self.spans.clear()
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self._run, args=(self.pid,), name="span_exporter", daemon=True)
+        self.thread.start()
+
+    def _run(self, pid):
+        while self.pid == pid:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def _send(self, spans):
+        pass
@@ -0,0 +1,16 @@
+import json
+from common.tracing.exporter import SpanExporter
+
+
+class FileExporter(SpanExporter):
+    # One JSON object per line; several processes may append to the same
+    # file, each flush being a single write.
+    def __init__(self, service, config):
+        super().__init__(service, config)
+        endpoint = config["endpoint"] if "endpoint" in config else ""
+        self.path = endpoint or f"/tmp/{service}-spans.jsonl"  # nosec B108 -jc
+
+    def _send(self, spans):
+        lines = "".join(json.dumps(dict(span, service=self.service)) + "\n" for span in spans)
+        with open(self.path, "a") as output:
+            output.write(lines)
@@ -0,0 +1,53 @@
+import json
+import urllib.request
+from common.tracing.exporter import SpanExporter
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    elif isinstance(value, int):
+        return {"intValue": str(value)}
+    elif isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(service, spans):
+    # OTLP/HTTP JSON encoding of ExportTraceServiceRequest
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+        "scopeSpans": [{
+            "scope": {"name": "weather-guess"},
+            "spans": [{
+                "traceId": span["trace_id"],
+                "spanId": span["span_id"],
+                "parentSpanId": span["parent_id"] or "",
+                "name": span["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(int(span["start"] * 1e9)),
+                "endTimeUnixNano": str(int(span["end"] * 1e9)),
+                "attributes": [{"key": key, "value": otlp_value(value)} for key, value in span["attributes"].items()],
+            } for span in spans],
+        }],
+    }]}
+
+
+class OtlpExporter(SpanExporter):
+    # Posts batches to an OpenTelemetry collector's OTLP/HTTP receiver
+    # (JSON, so no protobuf or SDK dependency).
+    def __init__(self, service, config):
+        super().__init__(service, config)
+        endpoint = config["endpoint"] if "endpoint" in config else ""
+        self.url = endpoint or "http://localhost:4318/v1/traces"
+        self.timeout = float(config["timeout"]) if "timeout" in config else 5.0
+
+    def _send(self, spans):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(otlp_payload(self.service, spans)).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:  # nosec B310 -jc configured collector URL
+            response.read()
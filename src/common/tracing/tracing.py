@@ -0,0 +1,112 @@
+import os
+import re
+import logging
+
+
+# Spans are derived from the stage timestamps an Event collects as it moves
+# through the pipeline (Event.mark), so a hop only needs the event to report
+# on the time before it. Timestamps are wall-clock and compared across
+# hosts: the breakdown is only as good as their clock sync.
+
+TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+#-jc (column, stage it ends at); each column runs from the previous stage
+BREAKDOWN = (
+    ("upload_ms", "stored"),
+    ("publish_ms", "published"),
+    ("request_transit_ms", "consumed"),
+    ("queue_wait_ms", "dequeued"),
+    ("preprocess_wait_ms", "preprocessed"),
+    ("inference_ms", "inferred"),
+    ("response_publish_ms", "responded"),
+    ("response_transit_ms", "ingested"),
+)
+
+
+def new_span_id():
+    return os.urandom(8).hex()
+
+
+def parse_traceparent(header):
+    # W3C trace context from an upstream caller: (trace id, parent span id)
+    match = TRACEPARENT.match((header or "").strip().lower())
+    if match is None or match.group(1) == "0" * 32:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+def stage_breakdown(event, ingested=None):
+    # One row of per-hop milliseconds for a response carrying its request's
+    # stages. Marks may be out of order (an image can finish preprocessing
+    # before its batch is dequeued), so each hop starts where the latest
+    # earlier one ended: hops never go negative and add up to total_ms.
+    stages = dict(event.stages or {})
+    if "received" not in stages:
+        return None
+    if ingested is not None:
+        stages["ingested"] = ingested
+    row = {
+        "_id": event.correlation_id,
+        "_tz_created": event._tz_created,
+        "trace_id": event.trace_id,
+    }
+    reached = stages["received"]
+    for column, stage in BREAKDOWN:
+        if stage in stages:
+            row[column] = round(max(stages[stage] - reached, 0.0) * 1000, 3)
+            reached = max(reached, stages[stage])
+        else:
+            row[column] = None
+    row["total_ms"] = round((reached - stages["received"]) * 1000, 3)
+    return row
+
+
+class Tracer(object):
+    def __init__(self, service, exporter="none", config=None):
+        self.LOGGER = logging
+        self.service = service
+        config = config or {}
+        self.sample_rate = float(config["sample_rate"]) if "sample_rate" in config else 1.0
+        if exporter in ("none", "", None):
+            self.exporter = None
+        elif exporter == "file":
+            from common.tracing.file_exporter import FileExporter
+            self.exporter = FileExporter(service, config)
+        elif exporter == "otlp":
+            from common.tracing.otlp_exporter import OtlpExporter
+            self.exporter = OtlpExporter(service, config)
+        else:
+            raise Exception("Trace exporter not implemented")
+        self.LOGGER.info(f"Selected trace exporter: {exporter}")
+
+    def sampled(self, trace_id):
+        # decided from the trace id alone, so every service keeps the same traces
+        if self.exporter is None or not trace_id:
+            return False
+        return int(trace_id[:8], 16) < self.sample_rate * 0x100000000
+
+    def record(self, name, trace_id, start, end, parent_id=None, span_id=None, **attributes):
+        span_id = span_id or new_span_id()
+        if start is not None and end is not None and self.sampled(trace_id):
+            self.exporter.export({
+                "trace_id": trace_id,
+                "span_id": span_id,
+                "parent_id": parent_id,
+                "name": name,
+                "start": start,
+                "end": end,
+                "duration_ms": round((end - start) * 1000, 3),
+                "attributes": attributes,
+            })
+        return span_id
+
+    def stage_span(self, name, event, first, last, **attributes):
+        # a child of the request's root span, from one Event.mark to another
+        return self.record(
+            name, event.trace_id, event.stages.get(first), event.stages.get(last),
+            parent_id=event.span_id, **attributes
+        )
+
+    def close(self):
+        if self.exporter is not None:
+            self.exporter.close()
@@ -1,58 +1,111 @@
-from flask import Flask, flash, request, redirect, jsonify, make_response
+from flask import Flask, Response as HttpResponse, flash, request, redirect, jsonify, make_response
 import os
-from werkzeug.utils import secure_filename
+import json
+import time
 from common.storage.storage import Storage
 from common.queue.queue import Queue
 from common.event.request_dto import Request
 from common.event.response_dto import Response
 from common.config.config import Configuration
+from common.cache.cache import ResultCache, content_digest
+from common.cache.memory_backend import MemoryCache
+from common.results.store import ResultStore
+from common.metrics.metrics import counter, instrument_app
+from common.tracing.tracing import Tracer, new_span_id, parse_traceparent
+from dispatcher.src.ingest import Ingest
 import threading
 import logging
+import atexit
 
 
 LOGGER = logging
 app = Flask(__name__)
-RESULT_MART = dict()
-app.config.setdefault(
-    "UPLOAD_FOLDER",
-    os.environ.get("STORAGE_DIR") or "/tmp",  # nosec B108 - container-local temp storage
-)
+instrument_app(app)
+UPLOADS = counter("dispatcher_uploads_total", "Accepted uploads by outcome", ("outcome",))
+#-jc bounded by default; replaced from Configuration at startup
+RESULT_MART = ResultStore("memory", {})
+PENDING_DIGESTS = MemoryCache({})
 #-jc module defaults (may be overridden by Configuration)
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg"}
+MAX_WAIT = 30.0
+SSE_KEEPALIVE = 15.0
 STORAGE = None  #-jc import-safe default
+CACHE = None
+QUEUE = None
+QUEUE_BACKEND = None
+QUEUE_CONFIG = None
+QUEUE_SEND_CHANNEL = None
+QUEUE_RCV_CHANNEL = None
+MODEL_ID = None  #-jc the model categorize last answered with; cached answers are per model
+TRACER = Tracer("dispatcher")
+INGEST = Ingest({})
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def status_text(request_id, found, image_class):
+    if not found:
+        return f"No cat search of id {request_id} found"
+    elif image_class is not None:
+        return str(image_class)
+    else:
+        return f"Recognition in progress"
+
+
 @app.route("/categorize/<request_id>", methods=["GET"])
 def get_request_status(request_id):
     global RESULT_MART
-    if request_id not in RESULT_MART:
-        dat = f"No cat search of id {request_id} found"
-
-    elif RESULT_MART[request_id] is not None:
-        dat = str(RESULT_MART[request_id])
-    else:
-        dat = f"Recognition in progress"
+    #-jc ?wait=<seconds> long-polls until the result lands (capped at MAX_WAIT)
+    wait = min(max(request.args.get("wait", default=0.0, type=float), 0.0), MAX_WAIT)
+    found, image_class = RESULT_MART.wait_for_result(request_id, wait)
+    dat = status_text(request_id, found, image_class)
 
     response = jsonify({"text": dat})
     response.headers.add('Access-Control-Allow-Origin', '*')
     return response
 
 
+@app.route("/categorize/<request_id>/events", methods=["GET"])
+def stream_request_status(request_id):
+    # Server-sent events: one "status" event per state, closing after the
+    # result (or MAX_WAIT); comment lines keep proxies from timing out.
+    def events():
+        deadline = time.monotonic() + MAX_WAIT
+        found, image_class = RESULT_MART.lookup(request_id)
+        yield f"event: status\ndata: {json.dumps({'text': status_text(request_id, found, image_class)})}\n\n"
+        while found and image_class is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            found, image_class = RESULT_MART.wait_for_result(request_id, min(remaining, SSE_KEEPALIVE))
+            if found and image_class is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: status\ndata: {json.dumps({'text': status_text(request_id, found, image_class)})}\n\n"
+
+    response = HttpResponse(events(), mimetype="text/event-stream")
+    response.headers.add('Cache-Control', 'no-cache')
+    response.headers.add('X-Accel-Buffering', 'no')
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
 @app.route("/stats", methods=["GET"])
 def get_request_stats():
     global RESULT_MART
-    response = jsonify({"text": str(RESULT_MART)})
+    response = jsonify({
+        "results": RESULT_MART.stats(),
+        "cache": CACHE.stats() if CACHE is not None else {},
+        "queue": QUEUE.stats() if QUEUE is not None else {},
+    })
     response.headers.add('Access-Control-Allow-Origin', '*')
     return response
 
 
 @app.route("/categorize", methods=["POST"])
 def request_classification():
-    event = Request()
     dat = None
     if request.method == 'POST':
         if 'file' not in request.files:
@@ -68,57 +121,174 @@ def request_classification():
         if STORAGE is None:
             return {"id": "test-id"}, 200
 
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            file_cache_fullpath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_cache_fullpath)
-            storage_object = STORAGE.put_file(file_cache_fullpath)
-            event.image_path = storage_object
-            event.image_size = os.path.getsize(file_cache_fullpath)
-            event.image_format = storage_object.split(".")[-1]
-
-        if "user_name" in request.form:
-            event.user_name = request.form["user_name"]
-        else:
-            event.user_name = "anonymous"
-        RESULT_MART[event["_id"]] = None
-        queue = Queue(QUEUE_BACKEND, QUEUE_CONFIG)
-        queue.publish_event(QUEUE_SEND_CHANNEL, event)
-        dat = str(event["_id"])
+        dat = accept_upload(file, request.form.get("user_name", "anonymous"), request.headers.get("traceparent"))
 
     response = jsonify({"id": dat})
     response.headers.add('Access-Control-Allow-Origin', '*')
     return response
 
 
+def accept_upload(file, user_name, traceparent=None):
+    # Shared by the Flask and ASGI front-ends; returns the request id.
+    event = Request()
+    event.mark("received")
+    trace_id, parent_id = parse_traceparent(traceparent)
+    if trace_id is not None:
+        event.trace_id = trace_id
+    #-jc the root span of the request; every later hop hangs its spans off it
+    event.span_id = new_span_id()
+    if file and allowed_file(file.filename):
+        event.image_digest = content_digest(file.stream)
+        cached_class = None
+        if CACHE is not None and MODEL_ID is not None:
+            cached_class = CACHE.get((event.image_digest, MODEL_ID))
+        if cached_class is not None:
+            #-jc answer repeat uploads straight away; nothing to store or infer
+            RESULT_MART.set_result(event["_id"], cached_class)
+            UPLOADS.inc(outcome="cached")
+            TRACER.record(
+                "dispatcher.upload", event.trace_id, event.stages["received"], time.time(),
+                parent_id=parent_id, span_id=event.span_id, request_id=event._id, cached=True
+            )
+            return str(event["_id"])
+
+        rendition = INGEST.normalise(file.stream)
+        if rendition is None:
+            #-jc straight from the upload stream to the final object, one write
+            storage_object, image_size = STORAGE.put_stream(file.stream, digest=event.image_digest)
+        else:
+            if INGEST.keep_original:
+                event.original_path, _ = STORAGE.put_stream(file.stream, digest=event.image_digest)
+            #-jc image_size/image_format describe the rendition, which is what categorize reads
+            storage_object, image_size = STORAGE.put_bytes(rendition)
+        event.image_path = storage_object
+        event.image_size = image_size
+        event.image_format = storage_object.split(".")[-1]
+        event.mark("stored")
+
+    event.user_name = user_name
+    RESULT_MART.mark_pending(event["_id"])
+    if event.image_digest is not None:
+        PENDING_DIGESTS.put(event["_id"], event.image_digest)
+    event.mark("published")
+    QUEUE.publish_event(QUEUE_SEND_CHANNEL, event)
+    UPLOADS.inc(outcome="queued")
+    TRACER.stage_span("dispatcher.store", event, "received", "stored", image_size=event.image_size or 0)
+    TRACER.record(
+        "dispatcher.upload", event.trace_id, event.stages["received"], time.time(),
+        parent_id=parent_id, span_id=event.span_id, request_id=event._id, cached=False
+    )
+    return str(event["_id"])
+
+
+def record_response(event):
+    global MODEL_ID
+    LOGGER.debug(f"Updating {event['correlation_id']}")
+    event.mark("collected")
+    RESULT_MART.set_result(event["correlation_id"], event["image_class"])
+    #-jc a fallback is a guess: cached, it would answer every re-upload of the image
+    if not event["fallback"] and event["model"] is not None:
+        MODEL_ID = event["model"]
+        digest = PENDING_DIGESTS.get(event["correlation_id"])
+        if digest is not None and CACHE is not None:
+            CACHE.put((digest, event["model"]), event["image_class"])
+    event.mark("delivered")
+    TRACER.stage_span("queue.response", event, "responded", "collected")
+    TRACER.stage_span("dispatcher.deliver", event, "collected", "delivered")
+
+
 def update_results():
-    global RESULT_MART
     queue = Queue(QUEUE_BACKEND, QUEUE_CONFIG)
     for event in queue.scan_events(QUEUE_RCV_CHANNEL, Response()):
-        LOGGER.debug(f"Updating {event['correlation_id']}")
-        RESULT_MART[event["correlation_id"]] = event["image_class"]
+        record_response(event)
 
 
-if __name__ == "__main__":
-    config = Configuration()
-    config.load_config(config_file_path=os.getenv("CONFIG_FILE", default=None))
+def configure(config):
+    global ALLOWED_EXTENSIONS, MAX_WAIT, STORAGE, CACHE, RESULT_MART, PENDING_DIGESTS
+    global QUEUE, QUEUE_BACKEND, QUEUE_CONFIG, QUEUE_SEND_CHANNEL, QUEUE_RCV_CHANNEL, TRACER, INGEST
 
-    # Flask confgiuration
-    APP_HOST = config.dispatcher_app_host
-    APP_PORT = int(config.dispatcher_app_port)
-    LOGLEVEL_DEBUG = config.dispatcher_app_debug
-    UPLOAD_FOLDER = config.dispatcher_temp_folder
     ALLOWED_EXTENSIONS = config.dispatcher_allowed_extensions
-    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    MAX_WAIT = float(config.dispatcher_max_wait)
+    INGEST = Ingest({
+        "max_side": int(config.dispatcher_ingest_max_side),
+        "quality": int(config.dispatcher_ingest_quality),
+        "keep_original": str(config.dispatcher_ingest_keep_original).lower() in ("1", "true", "yes"),
+    })
 
     # Integrations configuration
-    STORAGE = Storage(backend=config.storage_backend)
+    STORAGE = Storage(backend=config.storage_backend, config={
+        "layout": config.storage_file_layout,
+        "shard_depth": int(config.storage_file_shard_depth),
+        "bucket": config.storage_s3_bucket,
+        "endpoint": config.storage_s3_endpoint,
+        "region": config.storage_s3_region,
+        "max_connections": int(config.storage_s3_max_connections),
+        "max_concurrency": int(config.storage_s3_max_concurrency),
+        "multipart_threshold_mb": float(config.storage_s3_multipart_threshold_mb),
+        "multipart_chunk_mb": float(config.storage_s3_multipart_chunk_mb),
+    })
+    TRACER = Tracer("dispatcher", config.tracing_exporter, {
+        "endpoint": config.tracing_endpoint,
+        "sample_rate": float(config.tracing_sample_rate),
+    })
+    DB_CONFIG = {
+        "host": config.reporting_db_host,
+        "port": int(config.reporting_db_port),
+        "database": config.reporting_db_database_name,
+        "user": config.reporting_db_database_user_name,
+        "password": config.reporting_db_database_user_password,
+    }
+    CACHE = ResultCache(
+        backend=config.cache_backend,
+        config={
+            "max_entries": int(config.cache_max_entries),
+            "ttl": float(config.cache_ttl),
+            "db": DB_CONFIG,
+            "request_table": config.reporting_db_request_table,
+            "response_table": config.reporting_db_response_table,
+        },
+    )
+    RESULT_MART = ResultStore(
+        backend=config.results_backend,
+        config={
+            "max_entries": int(config.results_max_entries),
+            "ttl": float(config.results_ttl),
+            "db": DB_CONFIG,
+            "request_table": config.reporting_db_request_table,
+            "response_table": config.reporting_db_response_table,
+        },
+    )
+    PENDING_DIGESTS = MemoryCache({
+        "max_entries": int(config.results_max_entries),
+        "ttl": float(config.results_ttl),
+    })
 
     QUEUE_BACKEND = config.queue_backend
-    QUEUE_CONFIG = config.queue_config
+    QUEUE_CONFIG = {
+        "connection": config.queue_config,
+        "linger_ms": int(config.queue_linger_ms),
+        "batch_size": int(config.queue_batch_size),
+        "compression": config.queue_compression,
+        "codec": config.queue_codec,
+    }
     QUEUE_SEND_CHANNEL = config.queue_input_channel
     QUEUE_RCV_CHANNEL = config.queue_response_channel
 
+    #-jc one long-lived producer for all uploads; flushed on shutdown
+    QUEUE = Queue(QUEUE_BACKEND, QUEUE_CONFIG)
+    atexit.register(QUEUE.close)
+
+
+if __name__ == "__main__":
+    config = Configuration()
+    config.load_config(config_file_path=os.getenv("CONFIG_FILE", default=None))
+
+    # Flask confgiuration
+    APP_HOST = config.dispatcher_app_host
+    APP_PORT = int(config.dispatcher_app_port)
+    LOGLEVEL_DEBUG = config.dispatcher_app_debug
+    configure(config)
+
     # Starting app
     if os.environ.get("WERKZEUG_RUN_MAIN") == "true" or not LOGLEVEL_DEBUG:
         logging.info("Starting background updater")  #-jc
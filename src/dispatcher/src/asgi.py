@@ -0,0 +1,171 @@
+from quart import Quart, request, jsonify, make_response, redirect
+from concurrent.futures import ThreadPoolExecutor
+import os
+import json
+import time
+import asyncio
+import logging
+from common.queue.queue import Queue
+from common.event.response_dto import Response
+from common.config.config import Configuration
+from common.metrics.metrics import gauge, instrument_app
+import dispatcher.src.app as core
+
+
+# ASGI front-end for the dispatcher: same routes and JSON contract as the
+# Flask app, sharing its configuration, storage, cache and result store.
+# Blocking work (hashing, storage writes, publishing) runs in a worker
+# thread, and waiting clients are parked on asyncio events, so a slow
+# classification holds a coroutine rather than a server thread.
+#
+#   hypercorn dispatcher.src.asgi:app --bind 0.0.0.0:8080
+#   python src/dispatcher/src/asgi.py
+
+LOGGER = logging
+app = Quart(__name__)
+instrument_app(app, framework="quart")
+WAITERS = dict()
+UPDATER = None
+BATCHES = None
+#-jc the Kafka consumer stays on one thread for its whole life
+CONSUMER_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state_updater")
+gauge("dispatcher_waiting_requests", "Request ids with parked long-poll/SSE clients").set_function(lambda: len(WAITERS))
+
+
+def cors(response):
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+
+async def lookup(request_id):
+    # the memory tier answers on the loop; postgres tiers would block it
+    if all(name == "memory" for name, _ in core.RESULT_MART.tiers):
+        return core.RESULT_MART.lookup(request_id)
+    return await asyncio.to_thread(core.RESULT_MART.lookup, request_id)
+
+
+async def wait_for_result(request_id, timeout):
+    if timeout <= 0:
+        return await lookup(request_id)
+    # parked before the lookup: update_results() runs on the loop and may
+    # land while a threaded lookup is pending, and must still wake us
+    waiter = WAITERS.setdefault(request_id, [asyncio.Event(), 0])
+    waiter[1] += 1
+    try:
+        found, image_class = await lookup(request_id)
+        if not found or image_class is not None:
+            return found, image_class
+        await asyncio.wait_for(waiter[0].wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        waiter[1] -= 1
+        if waiter[1] == 0 and WAITERS.get(request_id) is waiter:
+            del WAITERS[request_id]
+    return await lookup(request_id)
+
+
+@app.route("/categorize/<request_id>", methods=["GET"])
+async def get_request_status(request_id):
+    wait = min(max(request.args.get("wait", default=0.0, type=float), 0.0), core.MAX_WAIT)
+    found, image_class = await wait_for_result(request_id, wait)
+    return cors(jsonify({"text": core.status_text(request_id, found, image_class)}))
+
+
+@app.route("/categorize/<request_id>/events", methods=["GET"])
+async def stream_request_status(request_id):
+    async def events():
+        deadline = time.monotonic() + core.MAX_WAIT
+        found, image_class = await lookup(request_id)
+        yield f"event: status\ndata: {json.dumps({'text': core.status_text(request_id, found, image_class)})}\n\n"
+        while found and image_class is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            found, image_class = await wait_for_result(request_id, min(remaining, core.SSE_KEEPALIVE))
+            if found and image_class is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: status\ndata: {json.dumps({'text': core.status_text(request_id, found, image_class)})}\n\n"
+
+    response = await make_response(events(), {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    response.timeout = None
+    return cors(response)
+
+
+@app.route("/stats", methods=["GET"])
+async def get_request_stats():
+    return cors(jsonify({
+        "results": core.RESULT_MART.stats(),
+        "cache": core.CACHE.stats() if core.CACHE is not None else {},
+        "queue": core.QUEUE.stats() if core.QUEUE is not None else {},
+        "waiting": len(WAITERS),
+    }))
+
+
+@app.route("/categorize", methods=["POST"])
+async def request_classification():
+    files = await request.files
+    form = await request.form
+    if 'file' not in files:
+        return redirect(request.url)
+    if core.STORAGE is None:
+        return {"id": "test-id"}, 200
+
+    request_id = await asyncio.to_thread(
+        core.accept_upload, files['file'], form.get("user_name", "anonymous"), request.headers.get("traceparent")
+    )
+    return cors(jsonify({"id": request_id}))
+
+
+async def update_results():
+    global BATCHES
+    loop = asyncio.get_running_loop()
+    queue = Queue(core.QUEUE_BACKEND, core.QUEUE_CONFIG)
+    BATCHES = queue.scan_batches(core.QUEUE_RCV_CHANNEL, Response, 500, 0.5)
+    while True:
+        events = await loop.run_in_executor(CONSUMER_EXECUTOR, next, BATCHES)
+        for event in events:
+            core.record_response(event)
+            waiter = WAITERS.pop(event["correlation_id"], None)
+            if waiter is not None:
+                waiter[0].set()
+
+
+@app.before_serving
+async def startup():
+    global UPDATER
+    if core.QUEUE is None:
+        config = Configuration()
+        config.load_config(config_file_path=os.getenv("CONFIG_FILE", default=None))
+        core.configure(config)
+    LOGGER.info("Starting background updater task")  #-jc
+    UPDATER = asyncio.get_running_loop().create_task(update_results())
+
+
+@app.after_serving
+async def shutdown():
+    if UPDATER is not None:
+        UPDATER.cancel()
+    if BATCHES is not None:
+        #-jc queued behind any pending next(), on the consumer's own thread;
+        # closing the generator is what leaves the consumer group
+        await asyncio.get_running_loop().run_in_executor(CONSUMER_EXECUTOR, BATCHES.close)
+    core.QUEUE.close()
+
+
+if __name__ == "__main__":
+    from hypercorn.config import Config as HypercornConfig
+    from hypercorn.asyncio import serve
+
+    config = Configuration()
+    config.load_config(config_file_path=os.getenv("CONFIG_FILE", default=None))
+    core.configure(config)
+
+    server_config = HypercornConfig()
+    server_config.bind = [f"{config.dispatcher_app_host}:{int(config.dispatcher_app_port)}"]
+    asyncio.run(serve(app, server_config))
@@ -0,0 +1,52 @@
+from common.metrics.metrics import counter, histogram
+from PIL import Image, ImageOps
+import logging
+import time
+import io
+import os
+
+
+INGESTED = counter("dispatcher_ingest_bytes_total", "Upload bytes received and rendition bytes stored", ("kind",))
+FAILED = counter("dispatcher_ingest_failed_total", "Uploads stored as they came because they did not decode")
+LATENCY = histogram("dispatcher_ingest_seconds", "Decode, downscale and re-encode time per upload")
+
+
+class Ingest(object):
+    # Decodes an upload once and re-encodes it as a bounded JPEG: EXIF
+    # orientation applied, then all metadata (EXIF, ICC, comments) dropped,
+    # longest side at most max_side. Categorize shrinks every image to
+    # 224x224 anyway, so full-resolution bytes only cost storage, transfer
+    # and decode time downstream. max_side 0 turns it off.
+    def __init__(self, config):
+        self.LOGGER = logging
+        self.max_side = int(config["max_side"]) if "max_side" in config else 0
+        self.quality = int(config["quality"]) if "quality" in config else 85
+        self.keep_original = bool(config["keep_original"]) if "keep_original" in config else False
+
+    def normalise(self, stream):
+        # returns the rendition's JPEG bytes, or None to store the upload as
+        # it came; the stream is left rewound either way
+        if self.max_side <= 0:
+            return None
+        started = time.monotonic()
+        try:
+            image = Image.open(stream)
+            #-jc JPEG: libjpeg decodes at 1/2, 1/4 or 1/8 scale, never below the box
+            image.draft("RGB", (self.max_side, self.max_side))
+            image = ImageOps.exif_transpose(image)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            image.thumbnail((self.max_side, self.max_side), Image.BILINEAR)
+            rendition = io.BytesIO()
+            image.save(rendition, "JPEG", quality=self.quality)
+            original_size = stream.seek(0, os.SEEK_END)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            self.LOGGER.warning("Upload did not decode, storing it unchanged", exc_info=True)
+            FAILED.inc()
+            return None
+        finally:
+            stream.seek(0)
+        LATENCY.observe(time.monotonic() - started)
+        INGESTED.inc(original_size, kind="original")
+        INGESTED.inc(rendition.tell(), kind="stored")
+        return rendition.getvalue()
@@ -22,3 +22,54 @@ CREATE TABLE responses (
     image_class VARCHAR,
     PRIMARY KEY (_id)
 );
+
+--changeset liquibase:3
+--Database: postgresql
+ALTER TABLE requests ADD COLUMN image_digest VARCHAR;
+CREATE INDEX requests_image_digest_idx ON requests (image_digest);
+CREATE INDEX responses_correlation_id_idx ON responses (correlation_id);
+
+--changeset liquibase:4
+--Database: postgresql
+CREATE TABLE event_counts (
+    table_name VARCHAR,
+    row_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (table_name)
+);
+INSERT INTO event_counts (table_name, row_count) SELECT 'requests', COUNT(*) FROM requests;
+INSERT INTO event_counts (table_name, row_count) SELECT 'responses', COUNT(*) FROM responses;
+
+--changeset liquibase:5
+--Database: postgresql
+ALTER TABLE requests ADD COLUMN trace_id VARCHAR, ADD COLUMN span_id VARCHAR, ADD COLUMN stages JSONB;
+ALTER TABLE responses ADD COLUMN trace_id VARCHAR, ADD COLUMN span_id VARCHAR, ADD COLUMN stages JSONB;
+CREATE TABLE request_latency (
+    _tz_created TIMESTAMP,
+    _id VARCHAR,
+    trace_id VARCHAR,
+    upload_ms DOUBLE PRECISION,
+    publish_ms DOUBLE PRECISION,
+    request_transit_ms DOUBLE PRECISION,
+    queue_wait_ms DOUBLE PRECISION,
+    preprocess_wait_ms DOUBLE PRECISION,
+    inference_ms DOUBLE PRECISION,
+    response_publish_ms DOUBLE PRECISION,
+    response_transit_ms DOUBLE PRECISION,
+    total_ms DOUBLE PRECISION,
+    PRIMARY KEY (_id)
+);
+CREATE INDEX request_latency_total_ms_idx ON request_latency (total_ms);
+
+--changeset liquibase:6
+--Database: postgresql
+ALTER TABLE requests ADD COLUMN image_expired_at TIMESTAMP;
+CREATE INDEX requests_image_path_idx ON requests (image_path);
+CREATE INDEX requests_retention_idx ON requests (_tz_created) WHERE image_expired_at IS NULL;
+
+--changeset liquibase:7
+--Database: postgresql
+ALTER TABLE requests ADD COLUMN original_path TEXT;
+
+--changeset liquibase:8
+--Database: postgresql
+ALTER TABLE responses ADD COLUMN fallback BOOLEAN NOT NULL DEFAULT FALSE, ADD COLUMN model VARCHAR;
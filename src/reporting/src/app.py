@@ -5,50 +5,42 @@ from common.queue.queue import Queue
 from common.event.request_dto import Request
 from common.event.response_dto import Response
 from common.config.config import Configuration
+from reporting.src.writer import BulkWriter
+from reporting.src.retention import Retention, retention_config
+from common.metrics.metrics import instrument_app
+from common.tracing.tracing import Tracer, stage_breakdown
 import threading
+import time
 import psycopg2
-import psycopg2.sql
+import psycopg2.pool
 import logging
 
 
 LOGGER = logging
 app = Flask(__name__)
+instrument_app(app)
 RESULT_MART = {
     "requests": 0,
     "responses": 0
 }
+WRITER = None
+RETENTION = None
+TRACER = Tracer("reporting")
 
 
 @app.route("/stats", methods=["GET"])
 def get_request_stats():
     try:
-        conn = psycopg2.connect(
-            host=DB_DATABASE_HOST,
-            port=DB_DATABASE_PORT,
-            database=DB_DATABASE,
-            user=DB_USERNAME,
-            password=DB_PASSWORD,
-        )
-
-        with conn:
-            with conn.cursor() as cur:
-                # count of requests
-                q = psycopg2.sql.SQL("SELECT COUNT(*) FROM {}").format(
-                    psycopg2.sql.Identifier(DB_REQ_TABLE)
-                )
-                cur.execute(q)
-                req_count = cur.fetchone()[0]
-                # count of responses
-                q = psycopg2.sql.SQL("SELECT COUNT(*) FROM {}").format(
-                    psycopg2.sql.Identifier(DB_RESP_TABLE)
-                )
-                cur.execute(q)
-                resp_count = cur.fetchone()[0]
+        #-jc O(1): read the counters the writer maintains instead of COUNT(*)
+        counts = WRITER.counts([DB_REQ_TABLE, DB_RESP_TABLE])
 
         return {
             "status": "ok",
-            "requests": req_count,
-            "responses": resp_count,
+            "requests": counts[DB_REQ_TABLE],
+            "responses": counts[DB_RESP_TABLE],
+            "ingested": dict(RESULT_MART),
+            "writer": WRITER.stats(),
+            "retention": RETENTION.report if RETENTION is not None else {},
         }
 
     except Exception:
@@ -56,50 +48,33 @@ def get_request_stats():
         return {"status": "error"}, 500
 
 
-def scan_topic(dto, channel, table):
+def scan_topic(dto_cls, channel, table, latency_table=None):
     global RESULT_MART
     queue = Queue(QUEUE_BACKEND, QUEUE_CONFIG)
-    for event in queue.scan_events(channel, dto):
-        event_keys = ','.join(event.keys())
-        event_values = []
-        for key in event.keys():
-            if isinstance(event[key], int):
-                event_values.append(str(event[key]))
-            else:
-                event_values.append(f"'{str(event[key])}'")
-
-        try:
-            columns = list(event.keys())
-            values = [event[c] for c in columns]
-
-            query = psycopg2.sql.SQL(
-                "INSERT INTO {table} ({fields}) VALUES ({placeholders})"
-            ).format(
-                table=psycopg2.sql.Identifier(table),
-                fields=psycopg2.sql.SQL(", ").join(
-                    map(psycopg2.sql.Identifier, columns)
-                ),
-                placeholders=psycopg2.sql.SQL(", ").join(
-                    psycopg2.sql.Placeholder() for _ in columns
-                ),
-            )
-
-            conn = psycopg2.connect(
-                host=DB_DATABASE_HOST,
-                port=DB_DATABASE_PORT,
-                database=DB_DATABASE,
-                user=DB_USERNAME,
-                password=DB_PASSWORD,
-            )
-
-            with conn:
-                with conn.cursor() as cur:
-                    cur.execute(query, values)
-
-            RESULT_MART[table] += 1
-
-        except psycopg2.Error as e:
-            LOGGER.exception("Database insert failed")  #-jc
+    #-jc the consumer batch is the write buffer: it closes after FLUSH_ROWS
+    #-jc events or FLUSH_INTERVAL seconds, and its offsets are only committed
+    #-jc once the rows are in the database
+    for events in queue.scan_batches(channel, dto_cls, FLUSH_ROWS, FLUSH_INTERVAL):
+        if not events:
+            continue
+        ingested = time.time()
+        RESULT_MART[table] += WRITER.write(table, events)
+        if latency_table is not None:
+            write_breakdown(latency_table, events, ingested)
+
+
+def write_breakdown(latency_table, events, ingested):
+    # Responses carry their request's stage marks: one row per request with
+    # where its time went, so slow paths can be found with plain SQL.
+    rows = [row for row in (stage_breakdown(event, ingested) for event in events) if row is not None]
+    if rows:
+        WRITER.write(latency_table, rows)
+    written = time.time()
+    for event in events:
+        #-jc the dispatcher records its own queue.response; this is our leg of the fan-out
+        TRACER.record("queue.response.reporting", event.trace_id, event.stages.get("responded"), ingested, parent_id=event.span_id)
+        TRACER.record("reporting.write", event.trace_id, ingested, written, parent_id=event.span_id)
+
 
 if __name__ == "__main__":
     config = Configuration()
@@ -116,24 +91,66 @@ if __name__ == "__main__":
     DB_DATABASE_PORT = int(config.reporting_db_port)
     DB_RESP_TABLE = config.reporting_db_response_table
     DB_REQ_TABLE = config.reporting_db_request_table
+    DB_LATENCY_TABLE = config.reporting_db_latency_table
     DB_USERNAME = config.reporting_db_database_user_name
     DB_PASSWORD = config.reporting_db_database_user_password
+    FLUSH_ROWS = max(1, int(config.reporting_flush_rows))
+    FLUSH_INTERVAL = int(config.reporting_flush_interval_ms) / 1000.0
+
+    #-jc minconn 0: connections are opened on demand, so startup does not need postgres yet
+    DB_POOL = psycopg2.pool.ThreadedConnectionPool(
+        0,
+        max(1, int(config.reporting_db_pool_size)),
+        host=DB_DATABASE_HOST,
+        port=DB_DATABASE_PORT,
+        database=DB_DATABASE,
+        user=DB_USERNAME,
+        password=DB_PASSWORD,
+    )
+    WRITER = BulkWriter(DB_POOL, counts_table=config.reporting_db_counts_table)
 
     # Integration configuration
-    STORAGE = Storage(backend=config.storage_backend)
+    STORAGE = Storage(backend=config.storage_backend, config={
+        "layout": config.storage_file_layout,
+        "shard_depth": int(config.storage_file_shard_depth),
+        "bucket": config.storage_s3_bucket,
+        "endpoint": config.storage_s3_endpoint,
+        "region": config.storage_s3_region,
+        "max_connections": int(config.storage_s3_max_connections),
+        "max_concurrency": int(config.storage_s3_max_concurrency),
+        "multipart_threshold_mb": float(config.storage_s3_multipart_threshold_mb),
+        "multipart_chunk_mb": float(config.storage_s3_multipart_chunk_mb),
+    })
+    TRACER = Tracer("reporting", config.tracing_exporter, {
+        "endpoint": config.tracing_endpoint,
+        "sample_rate": float(config.tracing_sample_rate),
+    })
 
     QUEUE_BACKEND = config.queue_backend
-    QUEUE_CONFIG = config.queue_config
+    QUEUE_CONFIG = {
+        "connection": config.queue_config,
+        "linger_ms": int(config.queue_linger_ms),
+        "batch_size": int(config.queue_batch_size),
+        "compression": config.queue_compression,
+        "codec": config.queue_codec,
+    }
     QUEUE_REQ_CHANNEL = config.queue_input_channel
     QUEUE_RESP_CHANNEL = config.queue_response_channel
 
 
     request_thread = threading.Thread(
-        target=scan_topic, name="request", args=(Request(), QUEUE_REQ_CHANNEL, DB_REQ_TABLE,)
+        target=scan_topic, name="request", args=(Request, QUEUE_REQ_CHANNEL, DB_REQ_TABLE,)
     )
     response_thread = threading.Thread(
-        target=scan_topic, name="response", args=(Response(), QUEUE_RESP_CHANNEL, DB_RESP_TABLE,)
+        target=scan_topic, name="response", args=(Response, QUEUE_RESP_CHANNEL, DB_RESP_TABLE, DB_LATENCY_TABLE,)
     )
     request_thread.start()
     response_thread.start()
+
+    if float(config.retention_days) > 0:
+        RETENTION = Retention(DB_POOL, STORAGE, retention_config(config))
+        threading.Thread(
+            target=RETENTION.run, name="retention",
+            args=(float(config.retention_interval_s), threading.Event()), daemon=True,
+        ).start()
     app.run(host=APP_HOST, port=APP_PORT, debug=LOGLEVEL_DEBUG)
@@ -0,0 +1,227 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import argparse
+import logging
+import json
+import time
+import os
+import psycopg2
+import psycopg2.pool
+import psycopg2.sql
+from common.metrics.metrics import counter
+
+
+DELETED = counter("retention_deleted_objects_total", "Objects deleted by retention, by reason", ("reason",))
+RECLAIMED = counter("retention_reclaimed_bytes_total", "Bytes freed by retention, by reason", ("reason",))
+#-jc pg advisory lock id: one retention pass at a time across reporting replicas
+LOCK_KEY = 7761021
+
+
+class Retention(object):
+    # Images expire with their request rows. Rows older than `days` are
+    # taken oldest first in batches; each row releases its reference to
+    # its object, which is deleted once nothing else points at it
+    # (deduplicated uploads share one object under the content layout),
+    # and the rows are stamped image_expired_at. A sweep of the storage
+    # listing then catches what the database does not know about:
+    # abandoned .partial- writes, and objects older than the retention
+    # period plus a grace period (temp copies, uploads whose row never
+    # landed). Deletes are paced to max_deletes_per_sec.
+    def __init__(self, pool, storage, config):
+        self.pool = pool
+        self.storage = storage
+        self.LOGGER = logging
+        self.table = config["request_table"] if "request_table" in config else "requests"
+        self.days = float(config["days"]) if "days" in config else 30.0
+        self.batch_size = int(config["batch_size"]) if "batch_size" in config else 500
+        self.max_rate = float(config["max_deletes_per_sec"]) if "max_deletes_per_sec" in config else 200.0
+        self.partial_max_age = float(config["partial_max_age_s"]) if "partial_max_age_s" in config else 3600.0
+        self.orphan_grace = float(config["orphan_grace_hours"]) * 3600 if "orphan_grace_hours" in config else 86400.0
+        self.report = dict()
+        self.conn = None
+
+    def run(self, interval, stopping):
+        while not stopping.is_set():
+            try:
+                self.run_pass()
+            except Exception:
+                self.LOGGER.exception("Retention pass failed")
+            stopping.wait(interval)
+
+    def run_pass(self):
+        started = time.monotonic()
+        report = {
+            "expired_rows": 0,
+            "deleted_objects": 0,
+            "reclaimed_bytes": 0,
+            "shared_objects_kept": 0,
+            "orphans_deleted": 0,
+            "partials_deleted": 0,
+            "orphan_bytes": 0,
+            "skipped": False,
+        }
+        with self._exclusive() as acquired:
+            if acquired:
+                self._expire(report)
+                self._sweep(report)
+            else:
+                report["skipped"] = True
+        report["elapsed_s"] = round(time.monotonic() - started, 3)
+        report["finished"] = str(datetime.now())
+        self.report = report
+        self.LOGGER.info(f"Retention pass: {report}")
+        return report
+
+    def _expire(self, report):
+        cutoff = datetime.now() - timedelta(days=self.days)
+        while True:
+            started = time.monotonic()
+            rows = self._expired_batch(cutoff)
+            if not rows:
+                return
+            sizes = {path: size or 0 for _, path, size, _ in rows}
+            #-jc originals kept by ingest go with their rendition; their size is not recorded
+            sizes.update((original, 0) for _, _, _, original in rows if original)
+            deleted = self.storage.release_objects([path for _, path, _, _ in rows] + [
+                original for _, _, _, original in rows if original
+            ])
+            # Stamped once the references are dropped. A delete that failed
+            # (say an S3 error) is not retried from here: nothing references
+            # the object any more, so the orphan sweep takes it once it is
+            # older than days plus orphan_grace_hours.
+            self._mark_expired([_id for _id, _, _, _ in rows])
+
+            reclaimed = sum(sizes[path] for path in deleted)
+            report["expired_rows"] += len(rows)
+            report["deleted_objects"] += len(deleted)
+            report["reclaimed_bytes"] += reclaimed
+            report["shared_objects_kept"] += len(sizes) - len(set(deleted))
+            DELETED.inc(len(deleted), reason="expired")
+            RECLAIMED.inc(reclaimed, reason="expired")
+            self._throttle(len(rows), started)
+            if len(rows) < self.batch_size:
+                return
+
+    def _sweep(self, report):
+        now = time.time()
+        orphan_age = self.days * 86400 + self.orphan_grace
+        batch = []
+        started = time.monotonic()
+        for path, size, modified in self.storage.list_objects():
+            if os.path.basename(path).startswith(".partial-"):
+                if now - modified > self.partial_max_age:
+                    batch.append((path, size, "partial"))
+            elif now - modified > orphan_age:
+                batch.append((path, size, "orphan"))
+            if len(batch) >= self.batch_size:
+                self._delete_swept(batch, report)
+                self._throttle(len(batch), started)
+                batch, started = [], time.monotonic()
+        if batch:
+            self._delete_swept(batch, report)
+
+    def _delete_swept(self, batch, report):
+        deleted = set(self.storage.delete_objects([path for path, _, _ in batch]))
+        for path, size, reason in batch:
+            if path not in deleted:
+                continue
+            report["partials_deleted" if reason == "partial" else "orphans_deleted"] += 1
+            report["orphan_bytes"] += size
+            DELETED.inc(reason=reason)
+            RECLAIMED.inc(size, reason=reason)
+
+    def _throttle(self, deletes, started):
+        if self.max_rate > 0:
+            time.sleep(max(0.0, deletes / self.max_rate - (time.monotonic() - started)))
+
+    @contextmanager
+    def _exclusive(self):
+        # The pass holds one connection throughout: the session-level lock
+        # and every query share it, so retention takes a single slot of the
+        # pool the writers and /stats draw from. Autocommit, so each
+        # statement is its own transaction.
+        conn = self.pool.getconn()
+        broken = False
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (LOCK_KEY,))
+                acquired = cur.fetchone()[0]
+            try:
+                self.conn = conn
+                yield acquired
+            finally:
+                self.conn = None
+                if acquired:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if not broken:
+                conn.autocommit = False
+            self.pool.putconn(conn, close=broken)
+
+    def _expired_batch(self, cutoff):
+        return self._query(
+            "SELECT _id, image_path, image_size, original_path FROM {table} "
+            "WHERE _tz_created < %s AND image_expired_at IS NULL AND image_path IS NOT NULL "
+            "ORDER BY _tz_created LIMIT %s",
+            (cutoff, self.batch_size),
+        )
+
+    def _mark_expired(self, ids):
+        self._query("UPDATE {table} SET image_expired_at = now() WHERE _id = ANY(%s)", (ids,), fetch=False)
+
+    def _query(self, query, args, fetch=True):
+        # on the connection _exclusive() holds for the pass
+        query = psycopg2.sql.SQL(query).format(table=psycopg2.sql.Identifier(self.table))
+        with self.conn.cursor() as cur:
+            cur.execute(query, args)
+            return cur.fetchall() if fetch else None
+
+
+def retention_config(config):
+    return {
+        "request_table": config.reporting_db_request_table,
+        "days": float(config.retention_days),
+        "batch_size": int(config.retention_batch_size),
+        "max_deletes_per_sec": float(config.retention_max_deletes_per_sec),
+        "partial_max_age_s": float(config.retention_partial_max_age_s),
+        "orphan_grace_hours": float(config.retention_orphan_grace_hours),
+    }
+
+
+if __name__ == "__main__":
+    # one pass from cron or by hand; the reporting service runs it on an interval
+    from common.config.config import Configuration
+    from common.storage.storage import Storage
+
+    parser = argparse.ArgumentParser(description="Delete expired and orphaned images")
+    parser.add_argument("--days", type=float, default=None, help="override [retention] days")
+    args = parser.parse_args()
+
+    config = Configuration()
+    config.load_config(config_file_path=os.getenv("CONFIG_FILE", default=None))
+    pool = psycopg2.pool.ThreadedConnectionPool(
+        0, 2,
+        host=config.reporting_db_host,
+        port=int(config.reporting_db_port),
+        database=config.reporting_db_database_name,
+        user=config.reporting_db_database_user_name,
+        password=config.reporting_db_database_user_password,
+    )
+    settings = retention_config(config)
+    if args.days is not None:
+        settings["days"] = args.days
+    if settings["days"] <= 0:
+        raise SystemExit("Retention is off ([retention] days = 0); pass --days to run once")
+    storage = Storage(backend=config.storage_backend, config={
+        "layout": config.storage_file_layout,
+        "shard_depth": int(config.storage_file_shard_depth),
+        "bucket": config.storage_s3_bucket,
+        "endpoint": config.storage_s3_endpoint,
+        "region": config.storage_s3_region,
+    })
+    print(json.dumps(Retention(pool, storage, settings).run_pass(), indent=2))
@@ -0,0 +1,171 @@
+from collections import deque
+import threading
+import logging
+import time
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
+import psycopg2.sql
+from common.metrics.metrics import counter, histogram
+
+
+#-jc events carry their stage marks as a dict; stored as jsonb
+psycopg2.extensions.register_adapter(dict, psycopg2.extras.Json)
+
+WRITE_LATENCY = histogram("reporting_db_write_seconds", "Bulk insert latency, retries included", ("table",))
+ROWS = counter("reporting_rows_total", "Rows written, by outcome", ("table", "outcome"))
+RETRIES = counter("reporting_db_retries_total", "Bulk inserts retried because the database was unavailable", ("table",))
+
+#-jc PoolError subclasses psycopg2.Error: an exhausted pool is "unavailable", not a bad row
+UNAVAILABLE = (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.pool.PoolError)
+
+
+class BulkWriter(object):
+    # One multi-row INSERT per batch of events. Rows already present (Kafka
+    # redelivers after a restart) are skipped by ON CONFLICT, so only the
+    # rows actually inserted are counted, both here and in the counts table
+    # which is bumped in the same transaction.
+    def __init__(self, pool, counts_table="event_counts", retry_delay=1.0, rate_window=60.0):
+        self.pool = pool
+        self.counts_table = counts_table
+        self.retry_delay = retry_delay
+        self.rate_window = rate_window
+        self.LOGGER = logging
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.metrics = dict()
+
+    def write(self, table, events):
+        if not events:
+            return 0
+        columns = list(events[0].keys())
+        rows = [tuple(event[c] for c in columns) for event in events]
+
+        started = time.monotonic()
+        inserted = self._insert_with_retry(table, columns, rows)
+        self._record(table, len(rows), inserted, time.monotonic() - started)
+        return inserted
+
+    def counts(self, tables):
+        query = psycopg2.sql.SQL(
+            "SELECT table_name, row_count FROM {counts} WHERE table_name = ANY(%s)"
+        ).format(counts=psycopg2.sql.Identifier(self.counts_table))
+        conn = self.pool.getconn()
+        broken = False
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, (list(tables),))
+                    found = dict(cur.fetchall())
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.pool.putconn(conn, close=broken)
+        return {table: found.get(table, 0) for table in tables}
+
+    def stats(self):
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and now - self.recent[0][0] > self.rate_window:
+                self.recent.popleft()
+            rows = sum(count for _, count in self.recent)
+            return {
+                "rows_per_sec": round(rows / self.rate_window, 3),
+                "tables": {table: dict(metrics) for table, metrics in self.metrics.items()},
+            }
+
+    def _insert_with_retry(self, table, columns, rows):
+        delay = self.retry_delay
+        single_rows = False
+        while True:
+            try:
+                if single_rows:
+                    return self._insert_rows(table, columns, rows)
+                return self._insert(table, columns, rows)
+            except UNAVAILABLE:
+                #-jc database unavailable: hold the batch (and the Kafka offsets) until it is back
+                self.LOGGER.exception("Bulk insert into %s failed, retrying in %ss", table, delay)
+                RETRIES.inc(table=table)
+                time.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            except psycopg2.Error:
+                self.LOGGER.exception("Bulk insert into %s failed, falling back to single rows", table)
+                single_rows = True
+
+    def _insert_rows(self, table, columns, rows):
+        # only rows the database rejects are dropped; an outage part way
+        # through retries the lot, and ON CONFLICT skips the rows already in
+        inserted = 0
+        for row in rows:
+            try:
+                inserted += self._insert(table, columns, [row])
+            except UNAVAILABLE:
+                raise
+            except psycopg2.Error:
+                self.LOGGER.exception("Database insert failed")  #-jc
+        return inserted
+
+    def _insert(self, table, columns, rows):
+        query = psycopg2.sql.SQL(
+            "INSERT INTO {table} ({fields}) VALUES %s ON CONFLICT (_id) DO NOTHING RETURNING 1"
+        ).format(
+            table=psycopg2.sql.Identifier(table),
+            fields=psycopg2.sql.SQL(", ").join(map(psycopg2.sql.Identifier, columns)),
+        )
+        conn = self.pool.getconn()
+        broken = False
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    result = psycopg2.extras.execute_values(
+                        cur, query, rows, page_size=len(rows), fetch=True
+                    )
+                    if result:
+                        self._bump_count(cur, table, len(result))
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.pool.putconn(conn, close=broken)
+        return len(result)
+
+    def _bump_count(self, cur, table, inserted):
+        # a savepoint keeps the data rows even if the counts table is missing
+        cur.execute("SAVEPOINT bump_count")
+        try:
+            cur.execute(
+                psycopg2.sql.SQL(
+                    "INSERT INTO {counts} (table_name, row_count) VALUES (%s, %s) "
+                    "ON CONFLICT (table_name) DO UPDATE "
+                    "SET row_count = {counts}.row_count + EXCLUDED.row_count"
+                ).format(counts=psycopg2.sql.Identifier(self.counts_table)),
+                (table, inserted),
+            )
+        except psycopg2.Error:
+            self.LOGGER.exception("Updating %s for %s failed", self.counts_table, table)
+            cur.execute("ROLLBACK TO SAVEPOINT bump_count")
+        else:
+            cur.execute("RELEASE SAVEPOINT bump_count")
+
+    def _record(self, table, rows, inserted, latency):
+        WRITE_LATENCY.observe(latency, table=table)
+        ROWS.inc(inserted, table=table, outcome="inserted")
+        ROWS.inc(rows - inserted, table=table, outcome="duplicate")
+        with self.lock:
+            self.recent.append((time.monotonic(), inserted))
+            metrics = self.metrics.setdefault(table, {
+                "rows": 0,
+                "duplicates": 0,
+                "flushes": 0,
+                "last_flush_rows": 0,
+                "last_flush_ms": 0.0,
+                "max_flush_ms": 0.0,
+            })
+            metrics["rows"] += inserted
+            metrics["duplicates"] += rows - inserted
+            metrics["flushes"] += 1
+            metrics["last_flush_rows"] = rows
+            metrics["last_flush_ms"] = round(latency * 1000, 3)
+            metrics["max_flush_ms"] = max(metrics["max_flush_ms"], metrics["last_flush_ms"])
@@ -1,17 +1,17 @@
 import { Injectable } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
-import { interval, Observable } from 'rxjs';
+import { EMPTY, Observable } from 'rxjs';
 // import {  of } from 'rxjs';
-import { takeWhile, tap } from 'rxjs/operators';
-import { flatMap } from 'rxjs/internal/operators';
+import { expand, takeWhile, tap } from 'rxjs/operators';
 
 const IN_PROGRESS = 'Recognition in progress';
+//-jc dispatcher holds each GET open until the result lands (server caps the wait)
+const LONG_POLL_SECONDS = 25;
 
 @Injectable({
   providedIn: 'root',
 })
 export class FileUploadService {
-  private isRecognitionInProgress: boolean = false;
   // private counter: number = 0;
 
   constructor(
@@ -27,20 +27,18 @@ export class FileUploadService {
   }
 
   public pollFileDataById(id: string): Observable<any> {
-    this.isRecognitionInProgress = true;
-    return interval(1000)
+    return this.getFileDataById(id, LONG_POLL_SECONDS)
       .pipe(
-        flatMap(() => this.getFileDataById(id)),
-        takeWhile(() => this.isRecognitionInProgress),
-        tap((data) => {
-            console.log(data.text);
-            return this.isRecognitionInProgress = data.text === IN_PROGRESS;
-        }),
+        expand((data) => data.text === IN_PROGRESS
+          ? this.getFileDataById(id, LONG_POLL_SECONDS)
+          : EMPTY),
+        takeWhile((data) => data.text === IN_PROGRESS, true),
+        tap((data) => console.log(data.text)),
       )
   }
 
-  public getFileDataById(id: string): Observable<any> {
-    return this.http.get<any>(`/categorize/${ id }`);
+  public getFileDataById(id: string, wait: number = 0): Observable<any> {
+    return this.http.get<any>(`/categorize/${ id }`, { params: { wait: String(wait) } });
     // this.counter++;
     // return this.counter < 3  ? of(IN_PROGRESS) : of('cat');
   }
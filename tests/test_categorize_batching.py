@@ -0,0 +1,161 @@
+#-jc categorize micro-batching: fan-out to the model, answers mapped back per request
+
+import io
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+import categorize.runtime.app as categorize
+from categorize.engine.engine import IMAGE_CLASSES
+from common.event.request_dto import Request
+from common.event.response_dto import Response
+from common.queue import memory_backend
+from common.queue.queue import Queue
+
+COLOURS = {"blue": (0, 0, 255), "green": (0, 255, 0), "red": (255, 0, 0)}
+
+
+class ChannelModel(object):
+    # stub engine: the strongest BGR channel picks the class, so blue is
+    # foggy, green rainy and red shine
+    model_id = "channels"
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, images):
+        self.batches.append(len(images))
+        return images.mean(axis=(1, 2))
+
+
+class ColourStorage(object):
+    def open_object(self, path):
+        name = path.split(".")[0]
+        if name not in COLOURS:
+            raise FileNotFoundError(path)
+        buffer = io.BytesIO()
+        Image.new("RGB", (32, 32), COLOURS[name]).save(buffer, format="PNG")
+        buffer.seek(0)
+        return buffer
+
+
+def request(image_path):
+    event = Request()
+    event.image_path = image_path
+    event.image_size = 1
+    event.image_format = "png"
+    event.user_name = "alice"
+    return event
+
+
+def prepared(image_path):
+    future = Future()
+    try:
+        future.set_result(categorize.prepare_image(image_path))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = ChannelModel()
+    monkeypatch.setattr(categorize, "MODEL_EXEC", model)
+    monkeypatch.setattr(categorize, "STORAGE", ColourStorage(), raising=False)
+    monkeypatch.setattr(categorize, "TENSOR_CACHE", None)
+    monkeypatch.setattr(categorize, "BATCH_STATS", dict(categorize.BATCH_STATS, batches=0, images=0))
+    monkeypatch.setattr(categorize, "RESULT_MART", dict())
+    return model
+
+
+def test_one_predict_per_batch_and_classes_in_request_order(model):
+    paths = ["red.png", "missing.png", "blue.png", "green.png"]
+    batch = [request(path) for path in paths]
+
+    classes = categorize.classify_batch(batch, [prepared(path) for path in paths])
+
+    #-jc the image that failed to load is left out of the model call, not the batch
+    assert model.batches == [3]
+    assert classes == ["shine", None, "foggy", "rainy"]
+
+
+def test_failed_predict_leaves_the_whole_batch_unanswered(model):
+    model.predict = lambda images: 1 / 0
+    paths = ["red.png", "blue.png"]
+
+    classes = categorize.classify_batch([request(path) for path in paths], [prepared(path) for path in paths])
+
+    assert classes == [None, None]
+
+
+def infer_settings(monkeypatch):
+    settings = {
+        "QUEUE_BACKEND": "memory",
+        "QUEUE_CONFIG": {"group_id": "categorize"},
+        "QUEUE_RCV_CHANNEL": "requests_topic",
+        "QUEUE_SEND_CHANNEL": "response_topic",
+        "BATCH_SIZE": 4,
+        "BATCH_MAX_WAIT": 0.05,
+        "PREFETCH_BATCHES": 2,
+        "PREPROCESS_POOL": ThreadPoolExecutor(max_workers=2),
+        "STOPPING": threading.Event(),
+    }
+    for name, value in settings.items():
+        monkeypatch.setattr(categorize, name, value, raising=False)
+
+
+def test_infer_answers_each_request_by_correlation_id(model, monkeypatch):
+    memory_backend.reset()
+    infer_settings(monkeypatch)
+
+    paths = ["red.png", "green.png", "blue.png", "missing.png", "red.png"]
+    requests = [request(path) for path in paths]
+    producer = Queue("memory", {})
+    for event in requests:
+        producer.publish_event("requests_topic", event)
+
+    worker = threading.Thread(target=categorize.infer, daemon=True)
+    worker.start()
+    responses = dict()
+    batches = Queue("memory", {}).scan_batches("response_topic", Response, max_messages=10, timeout=0.05)
+    deadline = time.monotonic() + 5
+    while len(responses) < len(requests) and time.monotonic() < deadline:
+        responses.update((event["correlation_id"], event) for event in next(batches))
+    batches.close()
+    categorize.STOPPING.set()
+    worker.join(5)
+    categorize.PREPROCESS_POOL.shutdown()
+
+    expected = {"red.png": "shine", "green.png": "rainy", "blue.png": "foggy"}
+    for event in requests:
+        resp = responses[event["_id"]]
+        assert resp["model"] == "channels"
+        if event.image_path in expected:
+            assert (resp["image_class"], resp["fallback"]) == (expected[event.image_path], False)
+    #-jc the unreadable image still gets a class, flagged as a guess
+    missing = responses[requests[3]["_id"]]
+    assert missing["fallback"] and missing["image_class"] in IMAGE_CLASSES
+    #-jc five requests at BATCH_SIZE 4: one full batch, then the rest on the timeout
+    assert categorize.BATCH_STATS["batches"] == 2 and categorize.BATCH_STATS["images"] == 5
+    assert not worker.is_alive()
+
+
+def test_infer_does_not_ack_a_batch_whose_responses_were_not_delivered(model, monkeypatch):
+    memory_backend.reset()
+    infer_settings(monkeypatch)
+    monkeypatch.setattr(memory_backend.MemoryBackend, "flush", lambda self: False)
+    producer = Queue("memory", {})
+    producer.publish_event("requests_topic", request("red.png"))
+
+    with pytest.raises(Exception, match="Responses not delivered"):
+        categorize.infer()
+    categorize.STOPPING.set()
+    categorize.PREPROCESS_POOL.shutdown()
+
+    #-jc the group reads the request again
+    batches = Queue("memory", {"group_id": "categorize"}).scan_batches("requests_topic", Request, 10, 0.05)
+    assert [event.image_path for event in next(batches)] == ["red.png"]
+    batches.close()
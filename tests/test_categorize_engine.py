@@ -0,0 +1,93 @@
+#-jc categorize preprocessing and engine selection (no TensorFlow needed)
+
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from categorize.engine.engine import InferenceEngine
+from categorize.engine.preprocess import load_image, CHANNEL_MEANS
+from categorize.engine.tflite_backend import TFLiteBackend
+
+
+def image_bytes(colour, size=(320, 240), mode="RGB"):
+    buffer = io.BytesIO()
+    Image.new(mode, size, colour).save(buffer, format="PNG")
+    buffer.seek(0)
+    return buffer
+
+
+def test_load_image_matches_vgg19_caffe_preprocessing():
+    img = load_image(image_bytes((255, 0, 0)))
+
+    assert img.shape == (1, 224, 224, 3)
+    assert img.dtype == np.float32
+    #-jc channels come out BGR with the ImageNet means removed
+    np.testing.assert_allclose(img[0, 0, 0], np.array([0, 0, 255], dtype=np.float32) - CHANNEL_MEANS)
+
+
+def test_load_image_converts_greyscale():
+    img = load_image(image_bytes(128, mode="L"))
+    np.testing.assert_allclose(img[0, 10, 10], 128 - CHANNEL_MEANS)
+
+
+def test_tflite_quantisation_round_trip():
+    detail = {"dtype": np.int8, "quantization": (0.5, -3)}
+    quantised = TFLiteBackend._quantize(np.array([[-1.0, 0.0, 10.0, 1000.0]], dtype=np.float32), detail)
+
+    assert quantised.dtype == np.int8
+    assert quantised.tolist() == [[-5, -3, 17, 127]]
+    np.testing.assert_allclose(TFLiteBackend._dequantize(quantised, detail), [[-1.0, 0.0, 10.0, 65.0]])
+
+
+def test_unknown_engine_is_rejected():
+    with pytest.raises(Exception):
+        InferenceEngine("caffe", {"model_path": "model.bin"})
+
+
+def test_cached_model_is_keyed_by_model_hash(tmp_path, monkeypatch):
+    import categorize.engine.convert as convert
+    from categorize.engine.model_cache import cached_model
+
+    conversions = []
+
+    def fake_convert(model_path, output_path, quantize="none"):
+        conversions.append(quantize)
+        with open(output_path, "wb") as output:
+            output.write(b"tflite")
+
+    monkeypatch.setattr(convert, "convert", fake_convert)
+    model = tmp_path / "weather.h5"
+    model.write_bytes(b"weights v1")
+
+    first = cached_model(str(model), str(tmp_path / "cache"), "fp16")
+    assert cached_model(str(model), str(tmp_path / "cache"), "fp16") == first
+    assert conversions == ["fp16"]
+
+    model.write_bytes(b"weights v2")
+    assert cached_model(str(model), str(tmp_path / "cache"), "fp16") != first
+    assert len(conversions) == 2
+    assert not list((tmp_path / "cache").glob(".partial-*"))
+
+
+def test_categorize_readiness_is_separate_from_liveness(monkeypatch):
+    import threading
+    import categorize.runtime.app as categorize
+
+    release = threading.Event()
+    worker = threading.Thread(target=release.wait, daemon=True)
+    worker.start()
+    monkeypatch.setattr(categorize, "WORKERS", [worker])
+    monkeypatch.setattr(categorize, "STARTUP", {"ready": False, "phases": {}})
+    client = categorize.app.test_client()
+
+    assert client.get("/health").status_code == 200
+    assert client.get("/ready").status_code == 503
+
+    categorize.STARTUP["ready"] = True
+    assert client.get("/ready").status_code == 200
+
+    release.set()
+    worker.join()
+    assert client.get("/health").status_code == 503
@@ -0,0 +1,107 @@
+#-jc ASGI dispatcher smoke test: same contract as the Flask app
+
+import asyncio
+import io
+
+from quart.datastructures import FileStorage
+
+from dispatcher.src.asgi import app
+
+
+def test_asgi_categorize_endpoint_exists():
+    async def run():
+        client = app.test_client()
+        resp = await client.post(
+            "/categorize",
+            files={"file": FileStorage(io.BytesIO(b"fake"), "test.jpg")},
+        )
+        return resp.status_code, await resp.get_json()
+
+    status, body = asyncio.run(run())
+
+    assert status in (200, 400)
+    assert "id" in body
+
+
+def test_asgi_unknown_request_status():
+    async def run():
+        client = app.test_client()
+        resp = await client.get("/categorize/unknown?wait=0")
+        return await resp.get_json()
+
+    assert asyncio.run(run()) == {"text": "No cat search of id unknown found"}
+
+
+def test_asgi_metrics_endpoint():
+    async def run():
+        client = app.test_client()
+        await client.get("/categorize/unknown?wait=0")
+        resp = await client.get("/metrics")
+        return resp.status_code, await resp.get_data(as_text=True)
+
+    status, text = asyncio.run(run())
+
+    assert status == 200
+    assert 'route="/categorize/<request_id>"' in text
+    assert "dispatcher_waiting_requests" in text
+
+
+def test_asgi_upload_without_file_redirects_like_flask():
+    async def run():
+        client = app.test_client()
+        resp = await client.post("/categorize", form={"user_name": "alice"})
+        return resp.status_code, resp.headers["Location"]
+
+    status, location = asyncio.run(run())
+
+    assert status == 302 and location.endswith("/categorize")
+
+
+def test_asgi_postgres_lookups_leave_the_event_loop(monkeypatch):
+    import threading
+    import dispatcher.src.app as core
+
+    class ThreadRecordingStore(object):
+        tiers = [("memory", None), ("postgres", None)]
+        threads = []
+
+        def lookup(self, request_id):
+            self.threads.append(threading.current_thread())
+            return False, None
+
+    monkeypatch.setattr(core, "RESULT_MART", ThreadRecordingStore())
+
+    async def run():
+        client = app.test_client()
+        await client.get("/categorize/unknown?wait=1")
+
+    asyncio.run(run())
+
+    assert ThreadRecordingStore.threads and threading.main_thread() not in ThreadRecordingStore.threads
+
+
+def test_asgi_shutdown_closes_the_response_consumer(monkeypatch):
+    import dispatcher.src.app as core
+    import dispatcher.src.asgi as asgi
+
+    closed = []
+
+    def batches():
+        try:
+            yield []
+        finally:
+            closed.append("batches")
+
+    class ClosingQueue(object):
+        def close(self):
+            closed.append("queue")
+
+    consumer = batches()
+    next(consumer)
+    monkeypatch.setattr(asgi, "UPDATER", None)
+    monkeypatch.setattr(asgi, "BATCHES", consumer)
+    monkeypatch.setattr(core, "QUEUE", ClosingQueue())
+
+    asyncio.run(asgi.shutdown())
+
+    assert closed == ["batches", "queue"]
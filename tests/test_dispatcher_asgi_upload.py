@@ -0,0 +1,45 @@
+#-jc ASGI upload stored through the file backend
+
+import asyncio
+import io
+import os
+
+from quart.datastructures import FileStorage
+
+import dispatcher.src.app as core
+from dispatcher.src.asgi import app
+from common.storage.storage import Storage
+
+
+class PublishedEvents(object):
+    def __init__(self):
+        self.events = []
+
+    def publish_event(self, channel, event):
+        self.events.append(event)
+
+
+def test_asgi_upload_is_stored_and_published(tmp_path, monkeypatch):
+    monkeypatch.setenv("STORAGE_DIR", str(tmp_path))
+    published = PublishedEvents()
+    monkeypatch.setattr(core, "STORAGE", Storage("file"))
+    monkeypatch.setattr(core, "QUEUE", published)
+    payload = b"\xff\xd8 not really a jpeg " * 1000
+
+    async def run():
+        client = app.test_client()
+        resp = await client.post(
+            "/categorize",
+            files={"file": FileStorage(io.BytesIO(payload), "photo.jpg")},
+            form={"user_name": "alice"},
+        )
+        return await resp.get_json()
+
+    body = asyncio.run(run())
+
+    [event] = published.events
+    assert body == {"id": str(event["_id"])}
+    assert event["user_name"] == "alice" and event["image_size"] == len(payload)
+    with open(event["image_path"], "rb") as stored:
+        assert stored.read() == payload
+    assert os.path.dirname(event["image_path"]) == str(tmp_path)
@@ -0,0 +1,71 @@
+#-jc event schema and wire codecs
+
+import json
+
+import pytest
+
+from common.event import codec
+from common.event.request_dto import Request
+from common.event.response_dto import Response
+from common.queue.queue import Queue
+
+
+def response():
+    event = Response()
+    event.correlation_id = "req-1"
+    event.image_class = "shine"
+    event.mark("responded", 12.5)
+    return event
+
+
+def test_event_has_a_fixed_schema():
+    event = Request()
+    assert not hasattr(event, "__dict__")
+    assert list(event.keys())[:3] == ["_tz_created", "_id", "correlation_id"]
+    assert "more" not in event.keys()
+    with pytest.raises(KeyError):
+        event["more"]
+    with pytest.raises(Exception):
+        event.dump()
+
+
+@pytest.mark.parametrize("name", codec.CODECS)
+def test_codecs_round_trip(name):
+    if codec.codec_for(name) != name:
+        pytest.skip(f"{name} not installed")
+    sent = response()
+    payload = sent.dump(name)
+    received = Response.from_payload(payload)
+    assert dict(received.items()) == dict(sent.items())
+    if name == "msgpack":
+        assert payload.startswith(b"\x00msgpack\x00")
+    else:
+        assert json.loads(payload)["image_class"] == "shine"
+
+
+def test_payloads_from_older_producers_still_load():
+    #-jc spaced json, no trace fields, str or bytes off the wire
+    legacy = json.dumps({"_tz_created": "2024-01-01 00:00:00", "_id": "r", "correlation_id": "req-1", "image_class": "fog"})
+    for payload in (legacy, legacy.encode()):
+        event = Response.from_payload(payload)
+        assert event.image_class == "fog"
+        assert event.stages == {}
+        assert len(event.trace_id) == 32
+
+    with pytest.raises(Exception):
+        Response.from_payload(json.dumps({"_id": "r"}))
+    with pytest.raises(Exception):
+        codec.decode(b"\x00unknown\x00...")
+
+
+def test_queue_publishes_with_configured_codec():
+    from common.queue import memory_backend
+    memory_backend.reset()
+    queue = Queue("memory", {"codec": "orjson"})
+    queue.publish_event("response_topic", response())
+    batch = next(queue.scan_batches("response_topic", Response, 10, 0.1))
+    assert [event.correlation_id for event in batch] == ["req-1"]
+    assert batch[0].stages == {"responded": 12.5}
+
+    with pytest.raises(Exception):
+        Queue("memory", {"codec": "xml"})
@@ -0,0 +1,49 @@
+#-jc dispatcher ingest: bounded, metadata-free JPEG renditions
+
+import io
+
+from PIL import Image
+
+from dispatcher.src.ingest import Ingest
+
+
+def photo(size, orientation=None, fmt="JPEG"):
+    image = Image.new("RGB", size, (200, 120, 40))
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    exif[0x010F] = "PhoneMaker"
+    if fmt == "JPEG":
+        image.save(buffer, fmt, exif=exif.tobytes())
+    else:
+        image.save(buffer, fmt)
+    buffer.seek(0)
+    return buffer
+
+
+def test_rendition_is_bounded_upright_and_stripped():
+    #-jc orientation 6: stored landscape, displayed portrait
+    upload = photo((4000, 3000), orientation=6)
+
+    rendition = Ingest({"max_side": 512, "quality": 80}).normalise(upload)
+
+    image = Image.open(io.BytesIO(rendition))
+    assert image.format == "JPEG" and image.size == (384, 512)
+    assert not image.getexif() and "icc_profile" not in image.info
+    assert upload.tell() == 0
+
+
+def test_small_and_png_uploads_become_jpeg():
+    rendition = Ingest({"max_side": 512}).normalise(photo((300, 200), fmt="PNG"))
+
+    image = Image.open(io.BytesIO(rendition))
+    assert image.format == "JPEG" and image.size == (300, 200)
+
+
+def test_off_or_undecodable_leaves_upload_alone():
+    upload = io.BytesIO(b"not an image")
+
+    assert Ingest({}).normalise(photo((100, 100))) is None
+    assert Ingest({"max_side": 512}).normalise(upload) is None
+    assert upload.tell() == 0
@@ -0,0 +1,67 @@
+#-jc metrics registry, text rendering and the /metrics endpoint
+
+import pytest
+from flask import Flask
+
+from common.metrics.metrics import Registry, instrument_app
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    registry.counter("jobs_total", "Jobs", ("queue",)).inc(2, queue="a")
+    registry.gauge("depth", "Depth").set(7)
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+
+    assert "# TYPE jobs_total counter" in text
+    assert 'jobs_total{queue="a"} 2' in text
+    assert "depth 7" in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_count 3" in text
+
+
+def test_snapshots_from_other_processes_get_extra_labels():
+    worker = Registry()
+    worker.counter("images_total", "Images").inc(3)
+
+    text = Registry().render([({"worker": "1"}, worker.snapshot())])
+
+    assert 'images_total{worker="1"} 3' in text
+
+
+def test_process_cpu_time_is_a_counter():
+    from common.metrics.metrics import REGISTRY
+
+    text = REGISTRY.render()
+
+    assert "# TYPE process_cpu_seconds_total counter" in text
+    assert "process_cpu_seconds_total " in text and "process_cpu_seconds " not in text
+
+
+def test_registry_refuses_kind_clash():
+    registry = Registry()
+    registry.counter("things", "Things")
+    with pytest.raises(Exception):
+        registry.gauge("things", "Things")
+
+
+def test_instrumented_app_times_routes_by_template():
+    app = instrument_app(Flask(__name__))
+
+    @app.route("/items/<item_id>")
+    def item(item_id):
+        return {"id": item_id}
+
+    client = app.test_client()
+    client.get("/items/42")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain")
+    assert 'route="/items/<item_id>"' in response.get_data(as_text=True)
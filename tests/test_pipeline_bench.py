@@ -0,0 +1,25 @@
+#-jc offline pipeline benchmark, run small as an end-to-end smoke test
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_pipeline_bench_reports_latency_and_stages(tmp_path):
+    output = tmp_path / "pipeline.json"
+    #-jc own process: the bench configures the dispatcher and categorize module globals
+    subprocess.run(
+        [sys.executable, str(ROOT / "bench" / "pipeline.py"), "--requests", "12", "--concurrency", "4",
+         "--model-batch-ms", "1", "--model-image-ms", "0", "--output", str(output)],
+        check=True, timeout=120,
+    )
+
+    report = json.loads(output.read_text())
+    assert report["load"]["errors"] == 0
+    assert report["load"]["end_to_end"]["count"] == 12
+    assert report["load"]["end_to_end"]["p99_ms"] is not None
+    assert report["batches"]["images"] == 12
+    assert {"fetch", "preprocess", "predict", "publish"} <= set(report["stages"])
@@ -0,0 +1,311 @@
+#-jc Queue batch scanning against a stand-in backend
+
+from common.queue.backend import QueueBackend
+from common.queue.queue import Queue
+from common.event.response_dto import Response
+
+
+class ListBackend(QueueBackend):
+    def __init__(self, batches):
+        super().__init__(None)
+        self.batches = batches
+
+    def subscribe_batches(self, channel, max_messages, timeout, manual_commit=False):
+        for batch in self.batches:
+            yield batch
+
+
+def make_queue(batches):
+    queue = Queue("kafka", "localhost:9092")
+    queue.queue_backend = ListBackend(batches)
+    return queue
+
+
+def response_json(correlation_id, image_class):
+    resp = Response()
+    resp.correlation_id = correlation_id
+    resp.image_class = image_class
+    return resp.dump()
+
+
+def test_scan_batches_yields_fresh_dtos():
+    queue = make_queue([
+        [response_json("a", "shine"), "not json", response_json("b", "rainy")],
+        [],
+    ])
+
+    batches = list(queue.scan_batches("response_topic", Response, max_messages=10, timeout=0.1))
+
+    assert [[event["correlation_id"] for event in batch] for batch in batches] == [["a", "b"], []]
+    assert batches[0][0] is not batches[0][1]
+
+
+class FakeMessage(object):
+    def __init__(self, value, offset):
+        self._value = value
+        self._offset = offset
+
+    def error(self):
+        return None
+
+    def topic(self):
+        return "requests_topic"
+
+    def partition(self):
+        return 0
+
+    def offset(self):
+        return self._offset
+
+    def value(self):
+        return self._value.encode("utf-8")
+
+
+class FakeConsumer(object):
+    instances = []
+
+    def __init__(self, conf):
+        self.conf = conf
+        self.commits = 0
+        self.committed = None
+        self.closed = False
+        self.pending = [[FakeMessage("one", 0), FakeMessage("two", 1)], [FakeMessage("three", 2)]]
+        FakeConsumer.instances.append(self)
+
+    def subscribe(self, topics, **callbacks):
+        self.topics = topics
+        self.callbacks = callbacks
+
+    def consume(self, num_messages, timeout):
+        return self.pending.pop(0) if self.pending else []
+
+    def commit(self, offsets=None, asynchronous=True):
+        from confluent_kafka import KafkaException
+        self.commits += 1
+        self.committed = offsets
+        if self.commits == 2:
+            raise KafkaException("partition revoked")
+
+    def close(self):
+        self.closed = True
+
+
+def test_kafka_batches_share_group_and_commit_after_handling(monkeypatch):
+    import common.queue.kafka_backend as kafka_backend
+    monkeypatch.setattr(kafka_backend, "Consumer", FakeConsumer)
+    backend = kafka_backend.KafkaBackend({"connection": "localhost:9092", "group_id": "categorize"})
+
+    batches = backend.subscribe_batches("requests_topic", 10, 0.1)
+    assert next(batches) == [b"one", b"two"]
+    consumer = FakeConsumer.instances[-1]
+    assert consumer.conf["group.id"] == "categorize"
+    assert consumer.conf["partition.assignment.strategy"] == "cooperative-sticky"
+    assert set(consumer.callbacks) == {"on_assign", "on_revoke", "on_lost"}
+    assert consumer.commits == 0
+
+    assert next(batches) == [b"three"]
+    assert consumer.commits == 1
+    #-jc a commit lost to a rebalance is logged, not fatal
+    assert next(batches) == []
+    assert consumer.commits == 2
+
+    batches.close()
+    assert consumer.closed
+
+
+def test_kafka_manual_commit_waits_for_acks_in_order(monkeypatch):
+    import common.queue.kafka_backend as kafka_backend
+    monkeypatch.setattr(kafka_backend, "Consumer", FakeConsumer)
+    backend = kafka_backend.KafkaBackend({"connection": "localhost:9092", "group_id": "categorize"})
+
+    batches = backend.subscribe_batches("requests_topic", 10, 0.1, manual_commit=True)
+    first, ack_first = next(batches)
+    second, ack_second = next(batches)
+    consumer = FakeConsumer.instances[-1]
+    assert (first, second) == ([b"one", b"two"], [b"three"])
+
+    #-jc the later batch alone would also commit the earlier one
+    ack_second()
+    next(batches)
+    assert consumer.commits == 0
+
+    ack_first()
+    next(batches)
+    assert consumer.commits == 1
+    assert [(tp.topic, tp.partition, tp.offset) for tp in consumer.committed] == [("requests_topic", 0, 3)]
+    batches.close()
+    assert consumer.commits == 1 and consumer.closed
+
+
+def test_kafka_revoke_commits_acked_batches_and_drops_the_rest(monkeypatch):
+    import common.queue.kafka_backend as kafka_backend
+    from confluent_kafka import TopicPartition
+    monkeypatch.setattr(kafka_backend, "Consumer", FakeConsumer)
+    backend = kafka_backend.KafkaBackend({"connection": "localhost:9092", "group_id": "categorize"})
+
+    batches = backend.subscribe_batches("requests_topic", 10, 0.1, manual_commit=True)
+    _, ack_first = next(batches)
+    _, ack_second = next(batches)
+    consumer = FakeConsumer.instances[-1]
+    ack_first()
+
+    consumer.callbacks["on_revoke"](consumer, [TopicPartition("requests_topic", 0)])
+    assert consumer.commits == 1
+    assert [tp.offset for tp in consumer.committed] == [2]
+
+    #-jc the new owner re-reads "three"; acking it here commits nothing
+    ack_second()
+    batches.close()
+    assert consumer.commits == 1
+
+
+class FakeProducer(object):
+    # delivers on flush(); the values in `failing` get an error report
+    def __init__(self, conf):
+        self.buffered = []
+        self.failing = set()
+
+    def produce(self, topic, value=None, on_delivery=None):
+        self.buffered.append((value, on_delivery))
+
+    def poll(self, timeout):
+        return 0
+
+    def flush(self, timeout=None):
+        for value, on_delivery in self.buffered:
+            on_delivery("broker down" if value in self.failing else None, FakeMessage("", 0))
+        self.buffered = []
+        return 0
+
+
+def test_kafka_flush_reports_failed_deliveries_once(monkeypatch):
+    import common.queue.kafka_backend as kafka_backend
+    monkeypatch.setattr(kafka_backend, "Producer", FakeProducer)
+    backend = kafka_backend.KafkaBackend({"connection": "localhost:9092"})
+
+    assert backend.flush()
+    backend.publish("response_topic", b"one")
+    backend.producer.failing = {b"two"}
+    backend.publish("response_topic", b"two")
+    assert not backend.flush()
+    #-jc the failure belongs to the flush that saw it
+    backend.publish("response_topic", b"three")
+    assert backend.flush()
+    assert backend.stats() == {"delivered": 2, "failed": 1}
+    backend.close()
+
+
+def publish_responses(queue, ids):
+    for correlation_id in ids:
+        resp = Response()
+        resp.correlation_id = correlation_id
+        resp.image_class = "shine"
+        queue.publish_event("response_topic", resp)
+
+
+def ids(batch):
+    return [event["correlation_id"] for event in batch]
+
+
+def test_memory_backend_batches_and_replays_for_a_new_group():
+    from common.queue import memory_backend
+    memory_backend.reset()
+    queue = Queue("memory", {})
+    publish_responses(queue, ["0", "1", "2", "3", "4"])
+
+    first = queue.scan_batches("response_topic", Response, max_messages=2, timeout=0.05)
+    assert [ids(next(first)) for _ in range(3)] == [["0", "1"], ["2", "3"], ["4"]]
+    assert next(first) == []
+
+    #-jc no group_id: a fresh group per backend, reading from the earliest offset
+    second = Queue("memory", {}).scan_batches("response_topic", Response, max_messages=10, timeout=0.05)
+    assert len(next(second)) == 5
+    assert queue.stats() == {"published": 5}
+
+
+def test_memory_backend_fills_batches_and_flushes_a_partial_one_on_timeout():
+    import time
+    from common.queue import memory_backend
+    memory_backend.reset()
+    queue = Queue("memory", {})
+    publish_responses(queue, [str(i) for i in range(7)])
+    batches = queue.scan_batches("response_topic", Response, max_messages=3, timeout=0.5)
+
+    #-jc full batches go straight out, without waiting for the timeout
+    started = time.monotonic()
+    assert [len(next(batches)) for _ in range(2)] == [3, 3]
+    assert time.monotonic() - started < 0.5
+
+    started = time.monotonic()
+    assert ids(next(batches)) == ["6"]
+    assert time.monotonic() - started >= 0.5
+    assert next(batches) == []
+
+
+def test_memory_backend_group_shares_partitions_and_redelivers_uncommitted():
+    from common.queue import memory_backend
+    memory_backend.reset(partitions=2)
+    queue = Queue("memory", {"group_id": "categorize"})
+    one = queue.scan_batches("response_topic", Response, max_messages=10, timeout=0.05)
+    two = Queue("memory", {"group_id": "categorize"}).scan_batches("response_topic", Response, max_messages=10, timeout=0.05)
+    assert next(one) == [] and next(two) == []
+
+    publish_responses(queue, ["a", "b", "c", "d"])
+    got_one, got_two = ids(next(one)), ids(next(two))
+    assert sorted(got_one + got_two) == ["a", "b", "c", "d"]
+    assert len(got_one) == len(got_two) == 2
+
+    #-jc two leaves without coming back for more: its batch was never committed
+    two.close()
+    assert sorted(ids(next(one))) == sorted(got_two)
+    assert next(one) == []
+    assert memory_backend.BROKER.describe()["response_topic"]["groups"]["categorize"] == {"members": 1, "lag": 0}
+
+
+def test_memory_backend_redelivers_a_batch_that_was_never_acked():
+    from common.queue import memory_backend
+    memory_backend.reset()
+    queue = Queue("memory", {"group_id": "categorize"})
+    publish_responses(queue, ["a", "b", "c"])
+
+    #-jc handed out and asked past, but the responses were never published
+    one = queue.scan_batches("response_topic", Response, max_messages=2, timeout=0.05, manual_commit=True)
+    assert ids(next(one)) == ["a", "b"]
+    assert ids(next(one)) == ["c"]
+    one.close()
+
+    two = Queue("memory", {"group_id": "categorize"}).scan_batches(
+        "response_topic", Response, max_messages=10, timeout=0.05, manual_commit=True
+    )
+    batch = next(two)
+    assert ids(batch) == ["a", "b", "c"]
+    batch.ack()
+    two.close()
+    assert memory_backend.BROKER.describe()["response_topic"]["groups"]["categorize"]["lag"] == 0
+
+
+def test_memory_broker_trims_retention_in_chunks():
+    from common.queue.memory_backend import Broker
+    broker = Broker(retention=100)
+    for i in range(255):
+        broker.publish("requests_topic", str(i))
+
+    #-jc keeps retention, plus less than a chunk of 10; offsets stay absolute
+    base, log = broker.topics["requests_topic"][0]
+    assert (base, len(log)) == (150, 105)
+    member = broker.join("late", "requests_topic")
+    assert broker.fetch("late", "requests_topic", member, 200, 0) == [str(i) for i in range(150, 255)]
+
+
+def test_multiprocessing_backend_talks_to_a_broker_server():
+    import threading
+    from common.queue.memory_backend import broker_server
+
+    server = broker_server(("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    connection = "%s:%d" % server.address
+
+    producer = Queue("multiprocessing", connection)
+    publish_responses(producer, ["x", "y"])
+    consumer = Queue("multiprocessing", {"connection": connection, "group_id": "reporting"})
+    assert ids(next(consumer.scan_batches("response_topic", Response, max_messages=2, timeout=1.0))) == ["x", "y"]
@@ -0,0 +1,97 @@
+#-jc result cache: LRU/TTL behaviour and tier backfill
+
+import io
+import time
+
+from common.cache.cache import ResultCache, content_digest
+from common.cache.memory_backend import MemoryCache
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache({"max_entries": 2, "ttl": 0})
+    cache.put("a", "shine")
+    cache.put("b", "rainy")
+    assert cache.get("a") == "shine"
+
+    cache.put("c", "foggy")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "shine"
+    assert cache.stats() == {"hits": 2, "misses": 1, "evictions": 1, "entries": 2}
+
+
+def test_memory_cache_expires_entries():
+    cache = MemoryCache({"max_entries": 10, "ttl": 0.01})
+    cache.put("a", "shine")
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_result_cache_backfills_upper_tiers():
+    cache = ResultCache("memory", {"max_entries": 10, "ttl": 0})
+    lower = MemoryCache({"max_entries": 10, "ttl": 0})
+    cache.tiers.append(("lower", lower))
+    lower.put("digest", "foggy")
+
+    assert cache.get("digest") == "foggy"
+    assert cache.tiers[0][1].get("digest") == "foggy"
+
+
+def test_dispatcher_caches_model_answers_per_model_and_never_fallbacks(monkeypatch):
+    import dispatcher.src.app as dispatcher
+    from common.event.response_dto import Response
+    from common.results.store import ResultStore
+
+    monkeypatch.setattr(dispatcher, "CACHE", ResultCache("memory", {"max_entries": 10, "ttl": 0}))
+    monkeypatch.setattr(dispatcher, "PENDING_DIGESTS", MemoryCache({}))
+    monkeypatch.setattr(dispatcher, "RESULT_MART", ResultStore("memory", {}))
+    monkeypatch.setattr(dispatcher, "MODEL_ID", None)
+
+    def respond(request_id, digest, image_class, model, fallback=False):
+        dispatcher.PENDING_DIGESTS.put(request_id, digest)
+        resp = Response()
+        resp.correlation_id = request_id
+        resp.image_class = image_class
+        resp.model = model
+        resp.fallback = fallback
+        dispatcher.record_response(resp)
+
+    respond("r1", "broken", "rainy", "model-a", fallback=True)
+    assert dispatcher.MODEL_ID is None and dispatcher.CACHE.get(("broken", "model-a")) is None
+    assert dispatcher.RESULT_MART.lookup("r1") == (True, "rainy")
+
+    respond("r2", "digest", "shine", "model-a")
+    assert dispatcher.MODEL_ID == "model-a" and dispatcher.CACHE.get(("digest", "model-a")) == "shine"
+    #-jc a new model starts with an empty cache
+    respond("r3", "other", "foggy", "model-b")
+    assert dispatcher.MODEL_ID == "model-b" and dispatcher.CACHE.get(("digest", "model-b")) is None
+
+
+def test_postgres_tier_closes_the_connection_a_query_broke(monkeypatch):
+    import psycopg2
+    from common.cache.postgres_backend import PostgresCache
+
+    class BrokenConnection(object):
+        closed = 0
+
+        def cursor(self):
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+        def close(self):
+            self.closed = 1
+
+    connections = []
+    monkeypatch.setattr(psycopg2, "connect", lambda **db: connections.append(BrokenConnection()) or connections[-1])
+    tier = PostgresCache({"db": {}})
+
+    assert tier.get(("digest", "model")) is None and tier.get(("digest", "model")) is None
+    assert len(connections) == 2 and all(conn.closed for conn in connections)
+
+
+def test_content_digest_rewinds_stream():
+    stream = io.BytesIO(b"image bytes")
+
+    assert content_digest(stream) == content_digest(io.BytesIO(b"image bytes"))
+    assert stream.read() == b"image bytes"
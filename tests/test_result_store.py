@@ -0,0 +1,40 @@
+#-jc bounded result store used by the dispatcher
+
+import threading
+
+from common.results.store import ResultStore
+
+
+def test_lookup_distinguishes_unknown_pending_and_done():
+    store = ResultStore("memory", {"max_entries": 10, "ttl": 0})
+    store.mark_pending("a")
+
+    assert store.lookup("missing") == (False, None)
+    assert store.lookup("a") == (True, None)
+
+    store.set_result("a", "foggy")
+
+    assert store.lookup("a") == (True, "foggy")
+
+
+def test_store_is_bounded_and_tracks_pending():
+    store = ResultStore("memory", {"max_entries": 2, "ttl": 0})
+    store.mark_pending("a")
+    store.mark_pending("b")
+    store.set_result("b", "shine")
+    store.mark_pending("c")
+
+    stats = store.stats()["memory"]
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert stats["pending"] == 1
+    assert store.lookup("a") == (False, None)
+
+
+def test_wait_for_result_wakes_on_set():
+    store = ResultStore("memory", {"max_entries": 10, "ttl": 0})
+    store.mark_pending("a")
+    threading.Timer(0.05, store.set_result, ("a", "rainy")).start()
+
+    assert store.wait_for_result("a", timeout=5) == (True, "rainy")
+    assert store.stats()["waiting"] == 0
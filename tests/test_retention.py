@@ -0,0 +1,194 @@
+#-jc retention: expiry by request rows, shared objects kept, storage sweep on both backends
+
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+from common.storage.storage import Storage
+from reporting.src.retention import Retention
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "bench"))
+
+from s3_standin import standin_server  # noqa: E402
+
+DAY = 86400
+
+
+class FakeRetention(Retention):
+    # the database side as a list of (id, path, size, created) rows
+    def __init__(self, storage, rows, **config):
+        super().__init__(None, storage, dict({"days": 30, "max_deletes_per_sec": 0}, **config))
+        self.rows = rows
+        self.expired = set()
+
+    @contextmanager
+    def _exclusive(self):
+        yield True
+
+    def _expired_batch(self, cutoff):
+        live = [row for row in self.rows if row[3] < cutoff and row[0] not in self.expired]
+        return [(_id, path, size, None) for _id, path, size, _ in live[:self.batch_size]]
+
+    def _mark_expired(self, ids):
+        self.expired.update(ids)
+
+
+def age(path, days):
+    stamp = time.time() - days * DAY
+    os.utime(path, (stamp, stamp))
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setenv("STORAGE_DIR", str(tmp_path))
+    return Storage("file")
+
+
+def test_expired_rows_delete_objects_but_keep_shared(tmp_path, monkeypatch):
+    monkeypatch.setenv("STORAGE_DIR", str(tmp_path))
+    storage = Storage("file", {"layout": "content"})
+    old = datetime.now() - timedelta(days=40)
+    expired, _ = storage.put_bytes(b"x" * 100)
+    shared, _ = storage.put_bytes(b"y" * 50)
+    #-jc a newer upload of the same image shares the object
+    assert storage.put_bytes(b"y" * 50)[0] == shared
+    rows = [
+        (1, expired, 100, old),
+        (2, shared, 50, old),
+        (3, shared, 50, datetime.now()),
+    ]
+    retention = FakeRetention(storage, rows, batch_size=1)
+
+    report = retention.run_pass()
+
+    assert not os.path.exists(expired) and os.path.exists(shared)
+    assert retention.expired == {1, 2}
+    assert report["expired_rows"] == 2 and report["deleted_objects"] == 1
+    assert report["reclaimed_bytes"] == 100 and report["shared_objects_kept"] == 1
+    assert retention.run_pass()["expired_rows"] == 0
+
+
+def test_sweep_removes_stale_partials_and_orphans_only(storage, tmp_path):
+    fresh, _ = storage.put_bytes(b"fresh")
+    orphan, _ = storage.put_bytes(b"orphan")
+    age(orphan, 40)
+    partial = tmp_path / ".partial-abc"
+    partial.write_bytes(b"half")
+    age(partial, 1)
+    recent_partial = tmp_path / ".partial-def"
+    recent_partial.write_bytes(b"writing")
+    unrelated = tmp_path / "notes.txt"
+    unrelated.write_bytes(b"not ours")
+    age(unrelated, 400)
+
+    report = FakeRetention(storage, [], orphan_grace_hours=24).run_pass()
+
+    assert os.path.exists(fresh) and not os.path.exists(orphan)
+    assert not partial.exists() and recent_partial.exists() and unrelated.exists()
+    assert report["orphans_deleted"] == 1 and report["partials_deleted"] == 1
+    assert report["orphan_bytes"] == len(b"orphan") + len(b"half")
+
+
+def test_skipped_when_another_replica_holds_the_lock(storage):
+    class Locked(FakeRetention):
+        @contextmanager
+        def _exclusive(self):
+            yield False
+
+    path, _ = storage.put_bytes(b"x")
+    report = Locked(storage, [(1, path, 1, datetime.now() - timedelta(days=40))]).run_pass()
+    assert report["skipped"] and os.path.exists(path)
+
+
+def test_failed_delete_is_left_to_the_orphan_sweep(storage):
+    class DeleteFails(object):
+        # S3 reported an error for every key
+        def __getattr__(self, name):
+            return getattr(storage, name)
+
+        def release_objects(self, paths):
+            return []
+
+    path, _ = storage.put_bytes(b"x" * 10)
+    age(path, 40)
+    retention = FakeRetention(DeleteFails(), [(1, path, 10, datetime.now() - timedelta(days=40))])
+
+    report = retention.run_pass()
+
+    assert retention.expired == {1} and report["deleted_objects"] == 0
+    assert report["orphans_deleted"] == 1 and not os.path.exists(path)
+
+
+def test_lock_and_queries_share_one_connection(storage):
+    class Cursor(object):
+        def __init__(self, conn):
+            self.conn = conn
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def execute(self, query, args=None):
+            self.conn.statements.append(query if isinstance(query, str) else "query")
+
+        def fetchone(self):
+            return (True,)
+
+        def fetchall(self):
+            return []
+
+    class Connection(object):
+        autocommit = False
+
+        def __init__(self):
+            self.statements = []
+
+        def cursor(self):
+            return Cursor(self)
+
+    class Pool(object):
+        def __init__(self):
+            self.taken = []
+
+        def getconn(self):
+            self.taken.append(Connection())
+            return self.taken[-1]
+
+        def putconn(self, conn, close=False):
+            pass
+
+    pool = Pool()
+    Retention(pool, storage, {"days": 30, "max_deletes_per_sec": 0}).run_pass()
+
+    assert len(pool.taken) == 1
+    statements = pool.taken[0].statements
+    assert statements[0].startswith("SELECT pg_try_advisory_lock") and statements[1] == "query"
+    assert statements[-1].startswith("SELECT pg_advisory_unlock")
+
+
+def test_s3_list_and_delete(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    server = standin_server("127.0.0.1:0", ["images"])
+    try:
+        storage = Storage("s3", {"bucket": "images", "endpoint": server.url, "region": "us-east-1"})
+        kept, _ = storage.put_bytes(b"kept")
+        orphan, _ = storage.put_bytes(b"orphan")
+        body, _ = server.buckets["images"][orphan]
+        server.buckets["images"][orphan] = (body, datetime.now(timezone.utc) - timedelta(days=40))
+
+        assert sorted(path for path, _, _ in storage.list_objects()) == sorted([kept, orphan])
+        report = FakeRetention(storage, []).run_pass()
+
+        assert report["orphans_deleted"] == 1
+        assert list(server.buckets["images"]) == [kept]
+    finally:
+        server.shutdown()
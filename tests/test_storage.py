@@ -0,0 +1,80 @@
+#-jc local filesystem storage backend
+
+import hashlib
+import io
+import os
+
+from common.storage.file_backend import LocalFilesystem
+
+
+def test_put_stream_writes_once_and_counts_bytes(tmp_path):
+    backend = LocalFilesystem(remote_prefix=str(tmp_path), local_prefix=str(tmp_path))
+
+    dst, size = backend.put_stream(io.BytesIO(b"x" * 3000000))
+
+    assert size == 3000000
+    assert os.path.getsize(dst) == size
+    assert dst.endswith(".jpeg")
+    assert os.listdir(tmp_path) == [os.path.basename(dst)]
+
+
+def test_put_object_keeps_source(tmp_path):
+    src = tmp_path / "upload.jpg"
+    src.write_bytes(b"image")
+    backend = LocalFilesystem(remote_prefix=str(tmp_path), local_prefix=str(tmp_path))
+
+    _, dst = backend.put_object(str(src))
+
+    assert open(dst, "rb").read() == b"image"
+    assert src.exists()
+
+
+def test_open_object_returns_read_only_buffer(tmp_path):
+    src = tmp_path / "image.jpeg"
+    src.write_bytes(b"image bytes")
+    backend = LocalFilesystem(remote_prefix=str(tmp_path), local_prefix=str(tmp_path))
+
+    with backend.open_object(str(src)) as buffer:
+        assert buffer.read() == b"image bytes"
+
+    assert os.listdir(tmp_path) == ["image.jpeg"]
+
+
+def test_content_layout_deduplicates_and_counts_references(tmp_path):
+    backend = LocalFilesystem(remote_prefix=str(tmp_path), config={"layout": "content", "shard_depth": 2})
+    digest = hashlib.sha256(b"image").hexdigest()
+
+    first, size = backend.put_bytes(b"image")
+    second, _ = backend.put_bytes(b"image", digest=digest)
+
+    assert first == second == os.path.join(str(tmp_path), digest[:2], digest[2:4], f"{digest}.jpeg")
+    assert size == 5 and open(first, "rb").read() == b"image"
+    assert [path for path, _, _ in backend.list_objects()] == [first]
+    #-jc the first release leaves the object for the second upload
+    assert backend.release_objects([first]) == []
+    assert backend.release_objects([first]) == [first]
+    assert not os.path.exists(first) and not os.path.exists(f"{first}.refs")
+
+
+def test_content_layout_reads_uuid_objects(tmp_path):
+    legacy, _ = LocalFilesystem(remote_prefix=str(tmp_path)).put_bytes(b"old")
+    backend = LocalFilesystem(remote_prefix=str(tmp_path), config={"layout": "content"})
+
+    assert backend.get_bytes(legacy) == b"old"
+    assert sorted(path for path, _, _ in backend.list_objects()) == [legacy]
+    assert backend.release_objects([legacy]) == [legacy]
+
+
+def test_listing_stays_out_of_unrelated_directories(tmp_path):
+    backend = LocalFilesystem(remote_prefix=str(tmp_path), config={"layout": "content"})
+    content, _ = backend.put_bytes(b"image")
+    legacy, _ = LocalFilesystem(remote_prefix=str(tmp_path)).put_bytes(b"old")
+    #-jc STORAGE_DIR=/tmp: someone else's tree, with names that look like ours
+    stranger = tmp_path / "pytest-of-root" / "ab"
+    stranger.mkdir(parents=True)
+    (stranger / f"{'0' * 64}.jpeg").write_bytes(b"not ours")
+    (tmp_path / "ab" / "cd").mkdir(parents=True, exist_ok=True)
+    (tmp_path / "ab" / "cd" / "deeper").mkdir()
+    (tmp_path / "ab" / "cd" / "deeper" / f"{'1' * 64}.jpeg").write_bytes(b"not ours")
+
+    assert sorted(path for path, _, _ in backend.list_objects()) == sorted([content, legacy])
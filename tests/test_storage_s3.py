@@ -0,0 +1,110 @@
+#-jc S3 backend against the in-process stand-in, and the read-through cache
+
+import io
+import sys
+from pathlib import Path
+
+import pytest
+from botocore.exceptions import ClientError
+
+from common.storage.storage import Storage
+from common.storage.disk_cache import ReadThroughCache
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "bench"))
+
+from s3_standin import standin_server  # noqa: E402
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    server = standin_server("127.0.0.1:0", ["images"])
+    yield server
+    server.shutdown()
+
+
+def s3_config(server, **extra):
+    return dict({"bucket": "images", "endpoint": server.url, "region": "us-east-1"}, **extra)
+
+
+def test_s3_bytes_and_streams_round_trip(s3):
+    storage = Storage("s3", s3_config(s3, multipart_threshold_mb=1, multipart_chunk_mb=1))
+
+    path, size = storage.put_bytes(b"small image", extension="png")
+    assert path.endswith(".png") and size == 11
+    assert storage.get_bytes(path) == b"small image"
+
+    #-jc above the threshold: a multipart upload in 1MB parts
+    payload = bytes(range(256)) * 12000
+    path, size = storage.put_stream(io.BytesIO(payload))
+    assert size == len(payload)
+    with storage.open_object(path) as buffer:
+        assert buffer.read() == payload
+
+
+def test_s3_errors_raise(s3, tmp_path):
+    storage = Storage("s3", s3_config(s3, bucket="missing"))
+    src = tmp_path / "image.jpeg"
+    src.write_bytes(b"image")
+    with pytest.raises(Exception):
+        storage.put_file(str(src))
+    with pytest.raises(ClientError):
+        storage.put_bytes(b"image")
+
+
+def test_s3_listing_skips_keys_this_code_did_not_write(s3):
+    storage = Storage("s3", s3_config(s3))
+    path, _ = storage.put_bytes(b"image", extension="png")
+    storage.backend.s3_client.put_object(Bucket="images", Key="backups/db.dump", Body=b"not ours")
+    storage.backend.s3_client.put_object(Bucket="images", Key="README.txt", Body=b"not ours")
+
+    assert [key for key, _, _ in storage.list_objects()] == [path]
+
+
+class CountingBackend(object):
+    def __init__(self, objects):
+        self.objects = objects
+        self.reads = 0
+
+    def get_bytes(self, src):
+        self.reads += 1
+        return self.objects[src]
+
+
+def test_read_through_cache_hits_and_evicts(tmp_path):
+    backend = CountingBackend({"a": b"a" * 400, "b": b"b" * 400, "c": b"c" * 400})
+    cache = ReadThroughCache(backend, str(tmp_path), max_bytes=1000)
+
+    assert cache.get_bytes("a") == b"a" * 400
+    with cache.open_object("a") as buffer:
+        assert buffer.read() == b"a" * 400
+    assert backend.reads == 1
+
+    cache.get_bytes("b")
+    cache.get_bytes("a")  #-jc a is now more recent than b
+    cache.get_bytes("c")
+    assert cache.stats()["bytes"] == 800
+    cache.get_bytes("a")
+    cache.get_bytes("b")
+    assert backend.reads == 4
+
+    #-jc a new process finds the same entries on disk
+    restarted = ReadThroughCache(backend, str(tmp_path), max_bytes=1000)
+    assert restarted.stats()["entries"] == 2
+
+
+def test_read_through_cache_bound_holds_across_processes(tmp_path):
+    objects = {str(i): bytes([i]) * 400 for i in range(6)}
+    #-jc one instance per worker process, all pointed at the same directory
+    workers = [ReadThroughCache(CountingBackend(objects), str(tmp_path), max_bytes=1000) for _ in range(3)]
+
+    for i in range(6):
+        workers[i % 3].get_bytes(str(i))
+
+    on_disk = sum(path.stat().st_size for path in tmp_path.rglob("*") if path.is_file() and path.name != ".lru")
+    assert on_disk <= 1000
+    assert workers[0].stats()["bytes"] == on_disk and workers[2].stats()["entries"] == on_disk // 400
+    #-jc the most recent fills survive, whoever made them
+    assert workers[0].get_bytes("5") == objects["5"] and workers[0].backend.reads == 2
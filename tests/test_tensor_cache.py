@@ -0,0 +1,86 @@
+#-jc categorize tensor cache: object keys, mmap hits, size-based eviction
+
+import io
+
+import numpy as np
+from PIL import Image
+
+from categorize.engine.preprocess import PREPROCESS_VERSION
+from categorize.engine.tensor_cache import TensorCache, cache_key
+
+TENSOR_BYTES = 224 * 224 * 3 * 4
+
+
+def tensor(value):
+    return np.full((1, 224, 224, 3), value, dtype=np.float32)
+
+
+def test_hits_are_read_only_maps_of_what_was_stored(tmp_path):
+    cache = TensorCache(str(tmp_path), 10 * TENSOR_BYTES)
+    key = cache_key("/data/images/ab/cd/abcd.jpeg")
+
+    assert key.endswith(f"-v{PREPROCESS_VERSION}") and cache_key(None) is None
+    assert key == cache_key("/data/images/ab/cd/abcd.jpeg") != cache_key("/data/images/ef/01/ef01.jpeg")
+    assert cache.get(key) is None
+    cache.put(key, tensor(1.5))
+
+    hit = cache.get(key)
+    assert isinstance(hit, np.memmap) and not hit.flags.writeable
+    np.testing.assert_array_equal(hit, tensor(1.5))
+    #-jc a restart picks the entries back up from disk
+    assert TensorCache(str(tmp_path), 10 * TENSOR_BYTES).stats()["entries"] == 1
+
+
+def test_least_recently_used_evicted_past_max_bytes(tmp_path):
+    cache = TensorCache(str(tmp_path), int(2.5 * TENSOR_BYTES))
+    cache.put("aa-1-v1", tensor(1))
+    cache.put("bb-1-v1", tensor(2))
+    cache.get("aa-1-v1")
+    cache.put("cc-1-v1", tensor(3))
+
+    assert cache.get("bb-1-v1") is None
+    assert cache.get("aa-1-v1") is not None and cache.get("cc-1-v1") is not None
+    assert cache.stats()["entries"] == 2
+
+
+def test_unreadable_entry_is_dropped(tmp_path):
+    cache = TensorCache(str(tmp_path), 10 * TENSOR_BYTES)
+    cache.put("dd-1-v1", tensor(4))
+    with open(cache.lru.path("dd-1-v1"), "wb") as broken:
+        broken.write(b"not a tensor")
+
+    assert cache.get("dd-1-v1") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_prepare_image_skips_storage_on_a_hit(tmp_path, monkeypatch):
+    import categorize.runtime.app as categorize
+
+    class Storage(object):
+        reads = 0
+
+        def open_object(self, path):
+            Storage.reads += 1
+            buffer = io.BytesIO()
+            Image.new("RGB", (320, 240), (10, 20, 30)).save(buffer, format="PNG")
+            buffer.seek(0)
+            return buffer
+
+    monkeypatch.setattr(categorize, "STORAGE", Storage(), raising=False)
+    monkeypatch.setattr(categorize, "TENSOR_CACHE", TensorCache(str(tmp_path), 10 * TENSOR_BYTES))
+    key = cache_key("image.png")
+
+    first, _, _, _ = categorize.prepare_image("image.png", key)
+    second, fetch_second, _, _ = categorize.prepare_image("image.png", key)
+
+    assert Storage.reads == 1 and fetch_second == 0.0
+    np.testing.assert_array_equal(first, second)
+
+
+def test_workers_sharing_the_directory_share_the_bound(tmp_path):
+    workers = [TensorCache(str(tmp_path), int(2.5 * TENSOR_BYTES)) for _ in range(2)]
+    for value, key in enumerate(["aa-1-v1", "bb-1-v1", "cc-1-v1", "dd-1-v1"]):
+        workers[value % 2].put(key, tensor(value))
+
+    assert workers[0].stats()["entries"] == 2 and workers[1].stats()["bytes"] <= 2.5 * TENSOR_BYTES
+    assert workers[0].get("dd-1-v1") is not None and workers[1].get("aa-1-v1") is None
@@ -0,0 +1,84 @@
+#-jc trace context on events, stage breakdown and span exporters
+
+import json
+
+from common.event.request_dto import Request
+from common.event.response_dto import Response
+from common.tracing.tracing import Tracer, parse_traceparent, stage_breakdown
+from common.tracing.otlp_exporter import otlp_payload
+
+
+def answered(marks):
+    request = Request()
+    request.span_id = "00f067aa0ba902b7"
+    for stage, at in marks:
+        request.mark(stage, at)
+    loaded = Request()
+    loaded.load(json.loads(json.dumps(dict(request.items(), image_path="x", image_size=1, image_format="jpg", user_name="u"))))
+    response = Response()
+    response.follow(loaded)
+    response.correlation_id = request._id
+    return request, response
+
+
+def test_response_follows_request_trace():
+    request, response = answered([("received", 10.0), ("stored", 10.5)])
+    assert response.trace_id == request.trace_id
+    assert response.span_id == request.span_id
+    assert response.stages == {"received": 10.0, "stored": 10.5}
+    assert set(Response().keys()) >= {"trace_id", "span_id", "stages"}
+
+
+def test_stage_breakdown_hops_add_up():
+    _, response = answered([
+        ("received", 100.0), ("stored", 100.01), ("published", 100.02), ("consumed", 100.1),
+        #-jc preprocessing finished before the batch was dequeued: no negative hop
+        ("preprocessed", 100.15), ("dequeued", 100.2), ("inferred", 100.3), ("responded", 100.31),
+    ])
+    row = stage_breakdown(response, ingested=100.4)
+    assert row["_id"] == response.correlation_id
+    assert row["preprocess_wait_ms"] == 0.0
+    assert round(row["inference_ms"]) == 100
+    hops = [value for key, value in row.items() if key.endswith("_ms") and key != "total_ms"]
+    assert abs(sum(hops) - row["total_ms"]) < 0.01
+    assert round(row["total_ms"]) == 400
+
+    assert stage_breakdown(Response()) is None
+
+
+def test_traceparent():
+    assert parse_traceparent("00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01") == (
+        "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+    )
+    assert parse_traceparent("garbage") == (None, None)
+    assert parse_traceparent(None) == (None, None)
+
+
+def test_file_exporter_and_sampling(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer("categorize", "file", {"endpoint": str(path), "sample_rate": 0.5})
+    kept, dropped = "7" + "0" * 31, "9" + "0" * 31
+    span_id = tracer.record("categorize.predict", kept, 1.0, 1.25, parent_id="ab" * 8, batch_size=8)
+    tracer.record("categorize.predict", dropped, 1.0, 1.25)
+    tracer.close()
+
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(spans) == 1
+    assert spans[0]["span_id"] == span_id
+    assert spans[0]["service"] == "categorize"
+    assert spans[0]["duration_ms"] == 250.0
+    assert spans[0]["attributes"] == {"batch_size": 8}
+
+    assert Tracer("dispatcher").record("x", kept, 1.0, 2.0)
+
+
+def test_otlp_payload_shape():
+    payload = otlp_payload("dispatcher", [{
+        "trace_id": "a" * 32, "span_id": "b" * 16, "parent_id": None, "name": "dispatcher.upload",
+        "start": 1.5, "end": 2.0, "duration_ms": 500.0, "attributes": {"cached": False, "image_size": 10},
+    }])
+    span = payload["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert span["startTimeUnixNano"] == "1500000000"
+    assert span["parentSpanId"] == ""
+    assert span["attributes"][0] == {"key": "cached", "value": {"boolValue": False}}
+    assert span["attributes"][1] == {"key": "image_size", "value": {"intValue": "10"}}
@@ -0,0 +1,124 @@
+#-jc reporting bulk writer: duplicates skipped, outages retried, bad rows dropped alone
+
+import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+import pytest
+
+from reporting.src.writer import BulkWriter
+
+
+class FakeCursor(object):
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, args=None):
+        if args is not None:
+            table, inserted = args
+            self.db.pending_counts.append((table, inserted))
+
+
+class FakeConnection(object):
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.pending_ids, self.db.pending_counts = [], []
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        #-jc like psycopg2: commit on a clean exit, roll back on an exception
+        if exc_type is None:
+            self.db.ids.update(self.db.pending_ids)
+            for table, inserted in self.db.pending_counts:
+                self.db.counts[table] = self.db.counts.get(table, 0) + inserted
+        return False
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+
+class FakePool(object):
+    # a database of _ids; the getconn() calls numbered in `exhausted` fail
+    def __init__(self):
+        self.ids = set()
+        self.counts = dict()
+        self.bad_ids = set()
+        self.exhausted = set()
+        self.getconns = 0
+        self.statements = []
+
+    def getconn(self):
+        self.getconns += 1
+        if self.getconns in self.exhausted:
+            raise psycopg2.pool.PoolError("connection pool exhausted")
+        return FakeConnection(self)
+
+    def putconn(self, conn, close=False):
+        pass
+
+    def execute_values(self, cur, query, rows, page_size=100, fetch=False):
+        self.statements.append(len(rows))
+        if any(row[0] in self.bad_ids for row in rows):
+            raise psycopg2.DataError("invalid input syntax")
+        new = [row[0] for row in rows if row[0] not in self.ids and row[0] not in self.pending_ids]
+        self.pending_ids.extend(new)
+        return [(1,) for _ in new]
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(psycopg2.extras, "execute_values", lambda *args, **kwargs: pool.execute_values(*args, **kwargs))
+    return pool
+
+
+def events(*ids):
+    return [{"_id": _id, "image_class": "shine"} for _id in ids]
+
+
+def test_redelivered_rows_are_counted_as_duplicates(pool):
+    writer = BulkWriter(pool, retry_delay=0)
+
+    assert writer.write("responses", events("a", "b")) == 2
+    assert writer.write("responses", events("b", "c")) == 1
+
+    assert pool.ids == {"a", "b", "c"} and pool.counts == {"responses": 3}
+    metrics = writer.stats()["tables"]["responses"]
+    assert metrics["rows"] == 3 and metrics["duplicates"] == 1 and metrics["flushes"] == 2
+
+
+def test_exhausted_pool_is_retried_not_dropped(pool):
+    pool.exhausted = {1, 2}
+    writer = BulkWriter(pool, retry_delay=0)
+
+    assert writer.write("responses", events("a", "b", "c")) == 3
+    #-jc one bulk statement once a connection is free, no single-row fallback
+    assert pool.statements == [3] and pool.ids == {"a", "b", "c"}
+
+
+def test_bad_row_falls_back_to_single_rows(pool):
+    pool.bad_ids = {"b"}
+    writer = BulkWriter(pool, retry_delay=0)
+
+    assert writer.write("responses", events("a", "b", "c")) == 2
+    assert pool.statements == [3, 1, 1, 1]
+    assert pool.ids == {"a", "c"} and pool.counts == {"responses": 2}
+
+
+def test_outage_during_single_rows_retries_them(pool):
+    pool.bad_ids = {"b"}
+    #-jc the pool runs dry just before the single-row insert of "c"
+    pool.exhausted = {4}
+    writer = BulkWriter(pool, retry_delay=0)
+
+    writer.write("responses", events("a", "b", "c"))
+
+    assert pool.statements == [3, 1, 1, 1, 1, 1]
+    assert pool.ids == {"a", "c"} and pool.counts == {"responses": 2}